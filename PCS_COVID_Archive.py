@@ -0,0 +1,205 @@
+'''
+Archive of the raw html of every scraped page, so that the data can be rebuilt when the table
+reader changes, without going back to the site (which may no longer serve older pages).
+
+    html_archive/objects/3f/3fa4...e1.html.gz            a page's html, gzip-compressed, named by
+                                                         its sha256
+    html_archive/runs/20210823T071502.041297-9c1e.json   one scrape: url, submit button, start time
+    html_archive/runs/20210823T071502.041297-9c1e.jsonl  its pages, one line each: page, time, sha256,
+                                                         size and source ('table' for the table
+                                                         element read from the browser, 'page'
+                                                         for a whole page); pages a resumed scrape
+                                                         took from its checkpoint are copied from
+                                                         the run that scraped them, with
+                                                         copied_from set
+
+A run's files are written with its first page, so a scrape that fails or falls back to another
+engine before fetching a page leaves nothing behind; runs() also passes over empty runs left by
+earlier versions. Identical html is stored once, so pages that did not change between scrapes
+cost nothing. The scrapers archive as they go when PCS_COVID_ScraPy.ARCHIVE is set (pcs-covid
+scrape does so with the archive_dir setting):
+
+    PCS.ARCHIVE = Archive.HtmlArchive('html_archive')
+
+reparse() rebuilds one scrape from the archive and reparse_all() every scrape, in a process
+pool across the cores, with PCS_COVID_ScraPy.extract_table or another parse function. Each
+distinct page is parsed once however many scrapes hold it. No browser or network is involved:
+
+    data_df = Archive.reparse(Archive.HtmlArchive('html_archive'))
+    pcs-covid reparse --all
+'''
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+
+class HtmlArchive:
+    '''
+    The archive in folder `root`. See the module docstring for the layout.
+        Inputs:
+            root - (string) the archive folder; created if missing.
+            level - (int) gzip compression level.
+    '''
+
+    def __init__(self, root='html_archive', level=6):
+        self.root = root
+        self.level = level
+        self.lock = threading.Lock()
+        #Runs started but holding no page yet: {run: meta}
+        self.pending = {}
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'runs'), exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest + '.html.gz')
+
+    def run_path(self, run, extension='.jsonl'):
+        return os.path.join(self.root, 'runs', run + extension)
+
+    def start_run(self, url, submit_id=None):
+        '''
+        Starts a scrape and returns its id: the start time, to the microsecond so that runs sort
+        in the order they started, and a random suffix. Nothing is written until its first page.
+        '''
+        now = time.time()
+        run = time.strftime('%Y%m%dT%H%M%S', time.localtime(now)) + '.%06d' % int(now % 1 * 1e6) + '-' + uuid.uuid4().hex[:4]
+        with self.lock:
+            self.pending[run] = {'run': run, 'url': url, 'submit_id': submit_id,
+                                 'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now))}
+        return run
+
+    def open_run(self, run):
+        '''Writes the meta of `run` if it is still pending. Called with the lock held.'''
+        meta = self.pending.pop(run, None)
+        if meta is not None:
+            with open(self.run_path(run, '.json'), 'w') as f:
+                json.dump(meta, f)
+
+    def add(self, run, page, html, source='table'):
+        '''Stores the html of `page` of scrape `run`. Returns its sha256.'''
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            #Workers may store the same page at once; each writes its own temporary file
+            temp_path = path + '.' + uuid.uuid4().hex[:8] + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(gzip.compress(data, self.level, mtime=0))
+            os.replace(temp_path, path)
+        entry = {'page': page, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sha256': digest,
+                 'bytes': len(data), 'source': source}
+        with self.lock:
+            self.open_run(run)
+            with open(self.run_path(run), 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        return digest
+
+    def copy_pages(self, source_run, run, pages):
+        '''
+        Adds the pages of scrape `source_run` numbered in `pages` to scrape `run`, e.g. pages a
+        resumed scrape took from its checkpoint. Only the entries are copied; the html is shared.
+        Returns the number of pages copied.
+        '''
+        if not os.path.exists(self.run_path(source_run)):
+            return 0
+        pages = set(pages)
+        entries = [dict(entry, copied_from=source_run) for entry in self.entries(source_run) if entry['page'] in pages]
+        if not entries:
+            return 0
+        with self.lock:
+            self.open_run(run)
+            with open(self.run_path(run), 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + '\n')
+        return len(entries)
+
+    def read(self, digest):
+        '''The html stored under `digest`.'''
+        with open(self.object_path(digest), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+
+    def runs(self):
+        '''Ids of the archived scrapes that hold pages, oldest first.'''
+        return sorted(os.path.basename(path)[:-len('.jsonl')] for path in glob.glob(self.run_path('*'))
+                      if os.path.getsize(path))
+
+    def run_meta(self, run):
+        path = self.run_path(run, '.json')
+        if not os.path.exists(path):
+            return {'run': run}
+        with open(path) as f:
+            return json.load(f)
+
+    def entries(self, run):
+        '''The pages of `run` in page order; a page stored twice (after a retry) keeps its last copy.'''
+        pages = {}
+        if not os.path.exists(self.run_path(run)):
+            return []
+        with open(self.run_path(run)) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    pages[entry['page']] = entry
+        return [pages[page] for page in sorted(pages)]
+
+
+def parse_chunk(root, digests, parse):
+    '''Process pool task: reads and parses archived pages. Returns their DataFrames.'''
+    archive = HtmlArchive(root)
+    return [parse(archive.read(digest)) for digest in digests]
+
+
+def parse_objects(archive, digests, workers=None, parse=None):
+    '''
+    Parses the archived pages `digests` in a process pool. Returns {digest: DataFrame}.
+        workers - number of processes (default: one per CPU); 1 parses in this process.
+        parse - function from html to DataFrame, importable by the workers (default
+            PCS_COVID_ScraPy.extract_table).
+    '''
+    if parse is None:
+        import PCS_COVID_ScraPy as PCS
+        parse = PCS.extract_table
+    digests = list(dict.fromkeys(digests))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(digests) <= 1:
+        return dict(zip(digests, parse_chunk(archive.root, digests, parse)))
+    #A few chunks per worker keeps the pool busy without sending one task per page
+    size = max(1, -(-len(digests) // (workers * 4)))
+    chunks = [digests[i:i + size] for i in range(0, len(digests), size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(parse_chunk, [archive.root] * len(chunks), chunks, [parse] * len(chunks))
+        frames = [frame for chunk in results for frame in chunk]
+    return dict(zip(digests, frames))
+
+
+def reparse_all(archive, runs=None, workers=None, parse=None):
+    '''
+    Rebuilds the tables of `runs` (default: every archived scrape) from the archive.
+    Returns {run: data_df}, each table's pages concatenated in page order as Scrape_data does;
+    runs that hold no pages are left out.
+    '''
+    import PCS_COVID_ScraPy as PCS
+    runs = archive.runs() if runs is None else runs
+    entries = {run: archive.entries(run) for run in runs}
+    runs = [run for run in runs if entries[run]]
+    frames = parse_objects(archive, [entry['sha256'] for run in runs for entry in entries[run]], workers, parse)
+    return {run: PCS.collect_pages((entry['page'], frames[entry['sha256']]) for entry in entries[run])[1]
+            for run in runs}
+
+
+def reparse(archive, run=None, workers=None, parse=None):
+    '''Rebuilds the table of scrape `run` (default: the latest) from the archive.'''
+    runs = archive.runs()
+    if not runs:
+        raise ValueError('The archive in ' + archive.root + ' holds no scrapes.')
+    run = run or runs[-1]
+    if run not in runs:
+        raise ValueError('Scrape ' + run + ' holds no pages in the archive in ' + archive.root + '.')
+    return reparse_all(archive, [run], workers, parse)[run]
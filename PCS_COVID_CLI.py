@@ -0,0 +1,297 @@
+'''
+The pcs-covid command, for running the pipeline from cron or a batch job instead of the notebooks:
+
+    pcs-covid scrape [--engine selenium|http|fast|parallel|incremental] [--metrics-dir DIR [--profile]]
+        scrape the dashboard, save today's data_dump_YYYYMMDD.csv and add it to the case store;
+        with a metrics folder, also write the scrape's stage timings there
+    pcs-covid ingest [FILE ...]
+        add the 2020-2021 file and the data dumps (or the files given) to the case store
+    pcs-covid analyze [--json]
+        district totals for the current term and the semester comparison
+    pcs-covid render [--workers N] [--force]
+        write the district, semester and per-school figures
+    pcs-covid reparse [--run RUN | --all] [--workers N]
+        rebuild scrapes from the html archive with the current table reader, without the site
+    pcs-covid serve [--port N]
+        answer series queries over HTTP/JSON from the case store (see PCS_COVID_Query)
+
+Settings such as driver_path come from PCS_COVID_Config. Every subcommand imports only the
+modules it uses, inside its own function, so `pcs-covid analyze --json` loads neither selenium
+nor matplotlib.
+'''
+import argparse
+import glob
+import json
+import os
+import sys
+
+
+def dump_files(settings):
+    '''The 2020-2021 file followed by the data dumps, oldest first.'''
+    files = sorted(glob.glob(os.path.join(settings['dump_dir'], 'data_dump_*.csv')))
+    baseline = settings['baseline']
+    return ([baseline] if os.path.exists(baseline) else []) + files
+
+
+def current_term(district, terms=None):
+    '''The latest term in the calendar that has data, or None.'''
+    import PCS_COVID_Terms as Terms
+    table = Terms.calendar(terms)
+    codes, _ = Terms.align(district['Date'], table)
+    codes = codes[codes >= 0]
+    return table['term'][codes.max()] if len(codes) else None
+
+
+def district_summary(store, term=None):
+    '''
+    Numbers behind the notebook's district cells, read from the store's aggregate cube. Returns
+    (summary dict, term curves DataFrame).
+    '''
+    import PCS_COVID_Store as Store
+    import PCS_COVID_Terms as Terms
+
+    cube = store.cube
+    district = cube.district()
+    term = term or current_term(district)
+    summary = {'store_version': store.version, 'term': term,
+               'latest_date': str(district['Date'].max().date()) if len(district) else None}
+    if term is None:
+        return summary, None
+
+    table = Terms.calendar()
+    start, end = table.loc[Terms.term_index(table, term), ['start', 'end']]
+    in_term = cube.district(start, end)
+    summary['term_start'] = str(start.date())
+    summary['totals'] = {name: int(in_term[name].sum()) for name in Store.CUBE_COUNTS}
+    school_days = Terms.school_days_so_far(district, term)
+    curves = Terms.cumulative_curves(district, Store.TOTAL, days=school_days)
+    summary['school_days'] = school_days
+    summary['same_school_days'] = {name: int(curves[name].max()) for name in curves.columns}
+    return summary, curves
+
+
+def scrape_telemetry(metrics_dir, engine, profile=False):
+    '''
+    A Telemetry writing to `metrics_dir`: stage records appended to scrape_metrics.jsonl, totals
+    in pcs_covid_scrape.prom and, with profile, cProfile statistics in scrape_<engine>_<time>.pstats.
+    '''
+    import time
+    import PCS_COVID_Telemetry as Telemetry
+
+    os.makedirs(metrics_dir, exist_ok=True)
+    profile_path = None
+    if profile:
+        profile_path = os.path.join(metrics_dir, 'scrape_' + engine + '_' + time.strftime('%Y%m%d_%H%M%S') + '.pstats')
+    return Telemetry.Telemetry(jsonl_path=os.path.join(metrics_dir, 'scrape_metrics.jsonl'),
+                               prom_path=os.path.join(metrics_dir, 'pcs_covid_scrape.prom'),
+                               profile_path=profile_path)
+
+
+def cmd_scrape(args, settings):
+    from datetime import date
+    import PCS_COVID_ScraPy as PCS
+
+    url = args.url or settings['url']
+    driver_path = args.driver_path or settings['driver_path']
+    delay = float(args.delay if args.delay is not None else settings['delay'])
+    engine = args.engine or settings['engine']
+    metrics_dir = args.metrics_dir or settings['metrics_dir'] or ('scrape_metrics' if args.profile else '')
+    if metrics_dir:
+        PCS.TELEMETRY = scrape_telemetry(metrics_dir, engine, args.profile)
+    if settings['archive_dir']:
+        import PCS_COVID_Archive as Archive
+        PCS.ARCHIVE = Archive.HtmlArchive(settings['archive_dir'])
+    with PCS.TELEMETRY.run(engine):
+        if engine == 'selenium':
+            _, data_df = PCS.Scrape_data(url, driver_path, delay, checkpoint_dir=settings['checkpoint_dir'])
+        elif engine == 'http':
+            import PCS_COVID_HTTP
+            _, data_df = PCS_COVID_HTTP.Scrape_data(url)
+        elif engine == 'fast':
+            _, data_df = PCS.Scrape_data_fast(url, driver_path, delay)
+        elif engine == 'parallel':
+            _, data_df = PCS.Scrape_data_parallel(url, driver_path, delay, workers=args.workers)
+        else:
+            _, data_df = PCS.Scrape_data_incremental(url, driver_path, delay, dump_dir=settings['dump_dir'])
+
+    filename = args.output or os.path.join(settings['dump_dir'], 'data_dump_' + date.today().strftime('%Y%m%d') + '.csv')
+    data_df.to_csv(filename)
+    print('Saved ' + str(len(data_df)) + ' rows to ' + filename)
+    if not args.no_store:
+        import PCS_COVID_Store as Store
+        written = Store.CaseStore(settings['store']).import_csv([filename])
+        print('Wrote ' + str(written) + ' new or changed rows to ' + settings['store'])
+    return 0
+
+
+def cmd_ingest(args, settings):
+    import PCS_COVID_Ingest as Ingest
+    import PCS_COVID_Store as Store
+
+    paths = args.files or dump_files(settings)
+    store = Store.CaseStore(settings['store'])
+    written = store.import_csv(paths)
+    quarantined = {os.path.basename(path): len(Ingest.ingest(path).quarantine) for path in paths}
+    result = {'files': len(paths), 'rows_written': written, 'store_version': store.version,
+              'quarantined': {name: n for name, n in quarantined.items() if n}}
+    if args.json:
+        print(json.dumps(result, indent=1))
+    else:
+        print('Ingested ' + str(len(paths)) + ' files, wrote ' + str(written) + ' rows, store version ' + str(store.version))
+        for name, n in result['quarantined'].items():
+            print('  ' + name + ': ' + str(n) + ' rows quarantined')
+    return 0
+
+
+def cmd_analyze(args, settings):
+    import PCS_COVID_Store as Store
+
+    summary, _ = district_summary(Store.CaseStore(settings['store']), args.term)
+    if args.json:
+        print(json.dumps(summary, indent=1))
+        return 0
+    if summary['term'] is None:
+        print('No data in any term of the calendar.')
+        return 1
+    print(summary['term'] + ' (since ' + summary['term_start'] + ', data through ' + summary['latest_date'] + ')')
+    for name, value in summary['totals'].items():
+        print('  ' + name + ': ' + str(value))
+    print('Cumulative cases after ' + str(summary['school_days']) + ' school days:')
+    for name, value in summary['same_school_days'].items():
+        print('  ' + name + ': ' + str(value))
+    return 0
+
+
+def cmd_render(args, settings):
+    import PCS_COVID_Render as Render
+    import PCS_COVID_Schools as Schools
+    import PCS_COVID_Store as Store
+
+    store = Store.CaseStore(settings['store'])
+    summary, curves = district_summary(store, args.term)
+    if summary['term'] is None:
+        print('No data in any term of the calendar.')
+        return 1
+    cases_by_date = store.cube.district(start=summary['term_start']).set_index('Date')
+    specs = [Render.daily_spec(cases_by_date), Render.terms_spec(curves, summary['term'], summary['school_days'])]
+    if not args.no_schools:
+        specs += Render.school_specs(Schools.SchoolSeries(store.read(start=summary['term_start'])))
+    drawn = Render.render(specs, args.out or settings['figures'], workers=args.workers, force=args.force)
+    print('Drew ' + str(len(drawn)) + ' of ' + str(len(specs)) + ' figures')
+    return 0
+
+
+def cmd_reparse(args, settings):
+    import time
+    import PCS_COVID_Archive as Archive
+
+    archive = Archive.HtmlArchive(args.archive_dir or settings['archive_dir'] or 'html_archive')
+    runs = archive.runs()
+    if not runs:
+        print('No scrapes in ' + archive.root)
+        return 1
+    if not args.all:
+        if args.run_id and args.run_id not in runs:
+            print('Scrape ' + args.run_id + ' holds no pages in ' + archive.root)
+            return 1
+        runs = [args.run_id or runs[-1]]
+    start = time.perf_counter()
+    tables = Archive.reparse_all(archive, runs, workers=args.workers)
+    pages = sum(len(archive.entries(run)) for run in runs)
+    print('Reparsed ' + str(pages) + ' pages of ' + str(len(runs)) + ' scrapes in %.1f s' % (time.perf_counter() - start))
+
+    if args.output:
+        tables[runs[-1]].to_csv(args.output)
+        print('Saved ' + str(len(tables[runs[-1]])) + ' rows of ' + runs[-1] + ' to ' + args.output)
+    if not args.no_store:
+        import PCS_COVID_Store as Store
+        store = Store.CaseStore(settings['store'])
+        #Oldest first, so that newer scrapes win as with import_csv
+        written = sum(store.append(tables[run]) for run in runs)
+        print('Wrote ' + str(written) + ' new or changed rows to ' + settings['store'])
+    return 0
+
+
+def cmd_serve(args, settings):
+    import time
+    import PCS_COVID_Query as Query
+
+    enrollment = settings['enrollment'] if os.path.exists(settings['enrollment']) else None
+    service = Query.QueryService(settings['store'], enrollment)
+    server, url = Query.serve(service, args.host, int(args.port or settings['serve_port']))
+    print('Serving ' + settings['store'] + ' at ' + url + ' (Ctrl-C to stop)')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='pcs-covid', description='Pinellas County Schools COVID dashboard data.')
+    parser.add_argument('--config', help='settings file (default: pcs_covid.ini)')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    scrape = commands.add_parser('scrape', help='scrape the dashboard and save a data dump')
+    scrape.add_argument('--engine', choices=['selenium', 'http', 'fast', 'parallel', 'incremental'])
+    scrape.add_argument('--url')
+    scrape.add_argument('--driver-path')
+    scrape.add_argument('--delay', type=float)
+    scrape.add_argument('--workers', type=int, default=2, help='browsers for --engine parallel')
+    scrape.add_argument('--output', help='csv to write (default: data_dump_YYYYMMDD.csv in dump_dir)')
+    scrape.add_argument('--no-store', action='store_true', help='do not add the dump to the case store')
+    scrape.add_argument('--metrics-dir', help='folder for stage timings (default: the metrics_dir setting)')
+    scrape.add_argument('--profile', action='store_true', help='also write cProfile statistics to the metrics folder (default: scrape_metrics)')
+    scrape.set_defaults(run=cmd_scrape)
+
+    ingest = commands.add_parser('ingest', help='add csv files to the case store')
+    ingest.add_argument('files', nargs='*', help='default: the 2020-2021 file and every data dump')
+    ingest.add_argument('--json', action='store_true')
+    ingest.set_defaults(run=cmd_ingest)
+
+    analyze = commands.add_parser('analyze', help='district totals and semester comparison')
+    analyze.add_argument('--term', help='term from PCS_COVID_Terms (default: the latest with data)')
+    analyze.add_argument('--json', action='store_true')
+    analyze.set_defaults(run=cmd_analyze)
+
+    render = commands.add_parser('render', help='write the figures')
+    render.add_argument('--term')
+    render.add_argument('--out', help='output folder (default: the figures setting)')
+    render.add_argument('--workers', type=int)
+    render.add_argument('--force', action='store_true', help='redraw figures that have not changed')
+    render.add_argument('--no-schools', action='store_true', help='skip the per-school figures')
+    render.set_defaults(run=cmd_render)
+
+    reparse = commands.add_parser('reparse', help='rebuild scrapes from the html archive')
+    reparse.add_argument('--run', dest='run_id', help='scrape to rebuild (default: the latest)')
+    reparse.add_argument('--all', action='store_true', help='rebuild every archived scrape, oldest first')
+    reparse.add_argument('--archive-dir', help='default: the archive_dir setting')
+    reparse.add_argument('--workers', type=int, help='processes (default: one per CPU)')
+    reparse.add_argument('--output', help='also save the (latest) rebuilt scrape to this csv')
+    reparse.add_argument('--no-store', action='store_true', help='do not add the rebuilt rows to the case store')
+    reparse.set_defaults(run=cmd_reparse)
+
+    serve = commands.add_parser('serve', help='answer series queries over HTTP/JSON')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, help='default: the serve_port setting')
+    serve.set_defaults(run=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    import PCS_COVID_Config as Config
+
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'term', None):
+        import PCS_COVID_Terms as Terms
+        terms = Terms.calendar()['term'].tolist()
+        if args.term not in terms:
+            parser.error('unknown --term ' + repr(args.term) + ' (choose from ' + ', '.join(terms) + ')')
+    return args.run(args, Config.load(args.config))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+'''
+Settings shared by the notebooks and the pcs-covid command.
+
+Each user's webdriver lives somewhere different, so paths are not written into the code. Values
+are taken from, in increasing order of priority:
+
+    DEFAULTS below
+    the [pcs_covid] section of pcs_covid.ini in the working folder (or of the file named by
+        the PCS_COVID_CONFIG environment variable)
+    PCS_COVID_<NAME> environment variables, e.g. PCS_COVID_DRIVER_PATH=/usr/local/bin/chromedriver
+
+A pcs_covid.ini looks like:
+
+    [pcs_covid]
+    driver_path = C:/webdrivers/chromedriver.exe
+    delay = 3
+'''
+import configparser
+import os
+
+CONFIG_FILE = 'pcs_covid.ini'
+SECTION = 'pcs_covid'
+DEFAULTS = {
+    'url': 'https://www.pcsb.org/covid19cases',
+    'url_2020_2021': 'https://www.pcsb.org/Page/34025',
+    'driver_path': 'chromedriver',
+    'delay': '2',
+    'engine': 'selenium',
+    'dump_dir': '.',
+    'baseline': 'All_Data_2020-2021.csv',
+    'store': 'case_store',
+    'checkpoint_dir': 'scrape_checkpoint',
+    'figures': '.',
+    #Folder for scrape timings (PCS_COVID_Telemetry); empty for none
+    'metrics_dir': '',
+    #School, Enrollment and Region table for the rate metrics, used when the file exists
+    'enrollment': 'school_enrollment.csv',
+    'serve_port': '8050',
+    #Folder keeping the html of every scraped page (PCS_COVID_Archive); empty for none
+    'archive_dir': 'html_archive',
+}
+
+
+def load(path=None):
+    '''Returns the settings as a dict of strings. `path` overrides the config file looked for.'''
+    settings = dict(DEFAULTS)
+    path = path or os.environ.get('PCS_COVID_CONFIG') or CONFIG_FILE
+    if os.path.exists(path):
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        if parser.has_section(SECTION):
+            settings.update(parser[SECTION])
+    for name in list(settings):
+        value = os.environ.get('PCS_COVID_' + name.upper())
+        if value is not None:
+            settings[name] = value
+    return settings
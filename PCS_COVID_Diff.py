@@ -0,0 +1,226 @@
+'''
+Row-level differences between dashboard snapshots.
+
+Consecutive data dumps are nearly identical. diff_snapshots() compares two snapshots (csv dumps
+read with load_snapshot, or store versions from PCS_COVID_Store.CaseStore.read(as_of=...)) in one
+vectorized pass. It reports which rows the district added, removed, or changed, per date and
+school. DeltaArchive keeps a run of snapshots on disk as one base table plus one small delta
+file per later snapshot, and rebuilds any of them on demand.
+
+Rows are matched on (Date, Locations affected, n), where n counts repeats of the same school on
+the same day within a snapshot, so two separate reports for one school and day are compared
+one to one.
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import PCS_COVID_Store as Store
+
+KEYS = Store.KEYS
+COUNTS = Store.COUNTS
+COLUMNS = Store.COLUMNS
+CHANGES = ['inserted', 'deleted', 'changed']
+
+
+def load_snapshot(path):
+    '''Reads a snapshot csv into the store's normalized columns.'''
+    return Store.normalize(Store.read_snapshot(path))
+
+
+def hash_rows(snapshot):
+    '''
+    Returns (key_hash, value_hash) arrays for a normalized snapshot: key_hash identifies the
+    row by (Date, Locations affected, repeat number), value_hash its two counts.
+    '''
+    repeat = snapshot.groupby(KEYS, sort=False).cumcount()
+    keyed = snapshot[KEYS].assign(repeat=repeat.to_numpy())
+    key_hash = pd.util.hash_pandas_object(keyed, index=False).to_numpy()
+    value_hash = pd.util.hash_pandas_object(snapshot[COUNTS], index=False).to_numpy()
+    return key_hash, value_hash
+
+
+def diff_snapshots(old, new):
+    '''
+    Compares two normalized snapshots and returns one row per difference:
+        Date, Locations affected - the row that differs.
+        change - 'inserted' (only in new), 'deleted' (only in old) or 'changed' (counts differ).
+        old employees/students, new employees/students - the counts on each side (NaN if absent).
+        key - the row's key hash, used by DeltaArchive.
+    '''
+    old_key, old_value = hash_rows(old)
+    new_key, new_value = hash_rows(new)
+    left = pd.DataFrame({'key': old_key, 'old_value': old_value, 'old_row': np.arange(len(old))})
+    right = pd.DataFrame({'key': new_key, 'new_value': new_value, 'new_row': np.arange(len(new))})
+    joined = left.merge(right, on='key', how='outer')
+
+    in_old = joined['old_row'].notna().to_numpy()
+    in_new = joined['new_row'].notna().to_numpy()
+    change = np.select(
+        [in_new & ~in_old, in_old & ~in_new, joined['old_value'].to_numpy() != joined['new_value'].to_numpy()],
+        CHANGES, default='')
+    differs = change != ''
+    joined = joined[differs]
+    change = change[differs]
+    in_old = in_old[differs]
+    in_new = in_new[differs]
+
+    old_rows = old.iloc[joined['old_row'].fillna(0).astype(int).to_numpy()].reset_index(drop=True)
+    new_rows = new.iloc[joined['new_row'].fillna(0).astype(int).to_numpy()].reset_index(drop=True)
+    result = pd.DataFrame({
+        'Date': new_rows['Date'].where(in_new, old_rows['Date']),
+        'Locations affected': new_rows['Locations affected'].where(in_new, old_rows['Locations affected']),
+        'change': change,
+    })
+    for name in COUNTS:
+        result['old ' + name] = old_rows[name].where(in_old)
+        result['new ' + name] = new_rows[name].where(in_new)
+    result['key'] = joined['key'].to_numpy()
+    return result.sort_values(by=['Date', 'Locations affected'], kind='stable').reset_index(drop=True)
+
+
+def summarize(diff, by=KEYS):
+    '''
+    Counts inserted, deleted and changed rows in diff_snapshots output, per date and school by
+    default. `by` is 'Date', 'Locations affected' or a list of both.
+    '''
+    by = [by] if isinstance(by, str) else list(by)
+    summary = pd.crosstab([diff[column] for column in by], diff['change'])
+    return summary.reindex(columns=CHANGES, fill_value=0)
+
+
+def diff_chain(snapshots):
+    '''
+    Diffs each snapshot against the one before it. `snapshots` is a {name: snapshot} dict in
+    order; returns {(old name, new name): diff}.
+    '''
+    names = list(snapshots)
+    return {(a, b): diff_snapshots(snapshots[a], snapshots[b]) for a, b in zip(names, names[1:])}
+
+
+def delta_from_diff(diff):
+    '''
+    The part of a diff needed to rebuild the new snapshot from the old one: the new counts of
+    inserted and changed rows, and the keys of changed and deleted rows.
+    '''
+    delta = diff[KEYS + ['change', 'key']].copy()
+    for name in COUNTS:
+        delta[name] = diff['new ' + name].fillna(0).astype('int32')
+    return delta[COLUMNS + ['change', 'key']]
+
+
+def apply_delta(snapshot, delta):
+    '''Applies a delta from delta_from_diff to the snapshot it was taken against.'''
+    key_hash, _ = hash_rows(snapshot)
+    gone = delta.loc[delta['change'] != 'inserted', 'key'].to_numpy()
+    kept = snapshot[~np.isin(key_hash, gone)]
+    added = delta.loc[delta['change'] != 'deleted', COLUMNS]
+    rebuilt = pd.concat([kept, added], ignore_index=True)
+    return rebuilt.sort_values(by='Date', ascending=False, kind='stable').reset_index(drop=True)
+
+
+class DeltaArchive:
+    '''
+    A run of snapshots kept as one base table and one delta per later snapshot:
+
+        <root>/base.parquet
+        <root>/delta-0001.parquet ...   rows inserted, deleted or changed since the previous one
+        <root>/latest-0003.parquet      the latest snapshot (here the fourth), materialized
+        <root>/archive.json             names of the snapshots, oldest first
+
+    add() stores a snapshot as a delta against the latest one, which it reads from
+    its latest-NNNN.parquet (or memory) rather than replaying the deltas, so adding a day does not get
+    slower as the archive grows. snapshot(name) rebuilds an older one by applying the deltas in
+    order; each step costs O(rows).
+    '''
+
+    def __init__(self, root='snapshot_archive'):
+        self.root = root
+        self.meta_path = os.path.join(root, 'archive.json')
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'snapshots': []}
+        #(name, snapshot) of the latest snapshot, once read or added
+        self.latest = None
+
+    def names(self):
+        return list(self.meta['snapshots'])
+
+    def write(self, frame, filename):
+        path = os.path.join(self.root, filename)
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def read(self, filename):
+        frame = pq.read_table(os.path.join(self.root, filename)).to_pandas()
+        return frame.astype({'Locations affected': object})
+
+    def latest_path(self, number):
+        return os.path.join(self.root, 'latest-%04d.parquet' % number)
+
+    def latest_snapshot(self):
+        '''The latest snapshot, from memory or its latest-NNNN.parquet; rebuilt from the deltas if neither has it.'''
+        names = self.names()
+        if not names:
+            raise KeyError('The archive is empty.')
+        if self.latest is None or self.latest[0] != names[-1]:
+            if os.path.exists(self.latest_path(len(names) - 1)):
+                snapshot = Store.normalize(self.read(os.path.basename(self.latest_path(len(names) - 1))))
+            else:
+                snapshot = self.replay(len(names) - 1)
+            self.latest = (names[-1], snapshot)
+        return self.latest[1]
+
+    def snapshot(self, name=None):
+        '''Rebuilds the snapshot called `name` (default: the latest).'''
+        names = self.names()
+        if not names:
+            raise KeyError('The archive is empty.')
+        if name is None or name == names[-1]:
+            return self.latest_snapshot().copy()
+        return self.replay(names.index(name))
+
+    def replay(self, stop):
+        '''Applies the deltas up to number `stop` to the base.'''
+        snapshot = Store.normalize(self.read('base.parquet'))
+        for i in range(1, stop + 1):
+            snapshot = Store.normalize(apply_delta(snapshot, self.read('delta-%04d.parquet' % i)))
+        return snapshot
+
+    def add(self, name, snapshot):
+        '''
+        Stores a normalized snapshot under `name`. Returns the diff against the previous
+        snapshot (None for the first one, which becomes the base).
+        '''
+        names = self.names()
+        if name in names:
+            raise ValueError(name + ' is already in the archive.')
+        snapshot = snapshot[COLUMNS].reset_index(drop=True)
+        if not names:
+            self.write(snapshot, 'base.parquet')
+            diff = None
+        else:
+            diff = diff_snapshots(self.latest_snapshot(), snapshot)
+            self.write(delta_from_diff(diff), 'delta-%04d.parquet' % len(names))
+        #Numbered after the snapshot, so a crash before archive.json names it leaves a file nobody reads
+        self.write(snapshot, os.path.basename(self.latest_path(len(names))))
+        self.meta['snapshots'].append(name)
+        self.latest = (name, snapshot)
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(temp_path, self.meta_path)
+        if names and os.path.exists(self.latest_path(len(names) - 1)):
+            os.remove(self.latest_path(len(names) - 1))
+        return diff
+
+    def add_files(self, paths):
+        '''Adds snapshot csv files, oldest first, named after the files. Returns {name: diff}.'''
+        return {os.path.basename(path): self.add(os.path.basename(path), load_snapshot(path)) for path in paths}
@@ -0,0 +1,340 @@
+'''
+Selenium-free engine for scraping the Pinellas County Schools COVID dashboard.
+
+The dashboard is a Schoolwires "minibase" module. Clicking the submit button
+(`minibaseSubmit65979` for the current school year, `minibaseSubmit62143` for 2020-2021) submits
+the filter form, and each link in the `ui-paging-container` pager requests one more page of the
+results table. This module replays those requests directly over a pooled `requests.Session`, so
+no browser has to be started and no fixed delay is needed between pages.
+
+Scrape_data() here returns the same (data_dict, data_df) pair as PCS_COVID_ScraPy.Scrape_data.
+PCS_COVID_ScraPy.Scrape_data_fast tries this engine first and falls back to Selenium when the
+page does not look like the form/pager we expect. benchmarks/dashboard_sim.py serves a recorded
+dump the way the dashboard does, and tests/test_http_engine.py runs this engine against it,
+with failures injected.
+'''
+import re
+import time
+from urllib.parse import urljoin, urlparse, urlencode, parse_qsl, urlunparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+
+import PCS_COVID_ScraPy as PCS
+
+SUBMIT_MAIN = PCS.SUBMIT_MAIN
+SUBMIT_OLDDATA = PCS.SUBMIT_OLDDATA
+USER_AGENT = 'Mozilla/5.0 (compatible; PCS_COVID scraper)'
+
+#Pager links look like 'Go to Page 3' or, for the ellipsis, 'Skip to Page 11'
+PAGE_LABEL = PCS.PAGE_LABEL
+#Quoted url inside a javascript onclick handler
+ONCLICK_URL = re.compile(r'''['"]([^'"]*\?[^'"]*)['"]''')
+#Responses that are worth asking for again: the server or a proxy failed, or asked us to slow down
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class MinibaseError(Exception):
+    '''Raised when a page does not contain the minibase form or pager this engine expects.'''
+
+
+def make_session(pool_size=4, retries=3, backoff=0.5):
+    '''
+    Returns a requests.Session whose connections are kept alive and reused between page
+    requests. pool_size is the number of connections kept open to each host.
+    Failed connections and RETRY_STATUS responses are retried up to `retries` times, waiting
+    backoff, 2*backoff, 4*backoff... seconds in between. The form submission is a search, so
+    POST is retried as well. A response still failing after that is returned, and raises an
+    HTTPError in MinibaseClient.request.
+    '''
+    session = requests.Session()
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUS, allowed_methods=None, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def form_request(page_source, base_url, submit_id):
+    '''
+    Finds the form holding the submit button `submit_id` and returns (method, url, fields),
+    the request a browser would send when the button is clicked.
+    '''
+    soup = BeautifulSoup(page_source, 'lxml')
+    button = soup.find(id=submit_id)
+    if button is None:
+        raise MinibaseError('No element with id ' + submit_id + ' on ' + base_url)
+
+    #Schoolwires does not always wrap the filters in a <form>; use the closest container that
+    #holds named fields instead.
+    form = button.find_parent('form')
+    container = form
+    if container is None:
+        container = button.parent
+        while container is not None and not container.find_all(['input', 'select', 'textarea'], attrs={'name': True}):
+            container = container.parent
+        if container is None:
+            raise MinibaseError('No form fields found around ' + submit_id)
+
+    fields = []
+    for field in container.find_all(['input', 'select', 'textarea'], attrs={'name': True}):
+        kind = (field.get('type') or '').lower()
+        if kind in ('submit', 'button', 'image', 'reset') and field is not button:
+            continue
+        if kind in ('checkbox', 'radio') and not field.has_attr('checked'):
+            continue
+        if field.name == 'select':
+            option = field.find('option', selected=True) or field.find('option')
+            value = option.get('value', option.get_text()) if option is not None else ''
+        elif field.name == 'textarea':
+            value = field.get_text()
+        else:
+            value = field.get('value', '')
+        fields.append((field['name'], value))
+    if button.has_attr('name') and (button['name'], button.get('value', '')) not in fields:
+        fields.append((button['name'], button.get('value', '')))
+
+    action = base_url
+    method = 'post'
+    if form is not None:
+        action = urljoin(base_url, form.get('action') or base_url)
+        method = (form.get('method') or 'post').lower()
+    return method, action, fields
+
+
+def page_links(page_source, base_url, container_id=PCS.ID):
+    '''
+    Reads the pager and returns {page number: url} for every page link it offers, including
+    the ellipsis ('Skip to Page N') links. The url comes from the href, or from the onclick
+    handler when the href is only a javascript stub.
+    '''
+    soup = BeautifulSoup(page_source, 'lxml')
+    pager = soup.find(id=container_id)
+    links = {}
+    if pager is None:
+        return links
+    for a in pager.find_all('a'):
+        match = PAGE_LABEL.search(a.get('aria-label', ''))
+        if match is None:
+            continue
+        href = a.get('href', '')
+        if not href or href.startswith('javascript') or href == '#':
+            found = ONCLICK_URL.search(a.get('onclick', ''))
+            if found is None:
+                continue
+            href = found.group(1)
+        links[int(match.group(1))] = urljoin(base_url, href)
+    return links
+
+
+def page_url_template(links):
+    '''
+    Works out which query parameter carries the page number from a {page: url} mapping.
+    Returns (url, parameter) for use with build_page_url, or None if no parameter matches.
+    '''
+    for page, url in links.items():
+        for name, value in parse_qsl(urlparse(url).query, keep_blank_values=True):
+            if value == str(page):
+                return url, name
+    return None
+
+
+def build_page_url(template, page):
+    '''Returns the url of `page` given a (url, parameter) template from page_url_template.'''
+    url, name = template
+    parts = urlparse(url)
+    query = [(k, str(page) if k == name else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+
+class MinibaseClient:
+    '''
+    Replays the dashboard's form submission and page requests over one pooled session.
+
+        Inputs:
+            url - (string) web address where the data portal can be accessed.
+            submit_id - (string) id of the submit button to replay, SUBMIT_MAIN for the current
+                school year or SUBMIT_OLDDATA for the 2020-2021 table.
+            session - (requests.Session) optional session to share; one is made with
+                make_session(pool_size) otherwise.
+            timeout - (float) seconds to wait for each response.
+            limiter - (PCS_COVID_ScraPy.HostLimiter) shared cap on requests in flight per host.
+            retries, backoff - a results page that comes back without the data table (half
+                loaded) is requested again up to `retries` times, backoff, 2*backoff...
+                seconds apart. make_session uses the same settings for failed requests.
+    '''
+
+    def __init__(self, url, submit_id=SUBMIT_MAIN, session=None, pool_size=4, timeout=30, limiter=None,
+                 retries=3, backoff=0.5):
+        self.url = url
+        self.submit_id = submit_id
+        self.session = session if session is not None else make_session(pool_size, retries, backoff)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = limiter if limiter is not None else PCS.HostLimiter(pool_size)
+        self.links = {}
+        self.template = None
+        self.first_page = None
+
+    def request(self, method, url, **kwargs):
+        with self.limiter.slot(url), PCS.TELEMETRY.stage('http_request') as event:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            event['bytes'] = len(response.content)
+            event['status'] = response.status_code
+            response.raise_for_status()
+        return response
+
+    def get(self, url):
+        return self.request('get', url)
+
+    def results(self, method, url, page, **kwargs):
+        '''
+        Requests results page `page` until the response holds the whole data table, and returns
+        the response. Raises PCS_COVID_ScraPy.TableError once the retries are used up.
+        '''
+        for attempt in range(self.retries + 1):
+            response = self.request(method, url, **kwargs)
+            try:
+                PCS.table_html(response.text)
+                return response
+            except PCS.TableError:
+                if attempt == self.retries:
+                    raise
+            PCS.TELEMETRY.count('retries')
+            with PCS.TELEMETRY.stage('backoff_sleep', page):
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def submit(self):
+        '''Loads the search page, submits the empty filter form and returns the html of page 1.'''
+        landing = self.get(self.url)
+        method, action, fields = form_request(landing.text, landing.url, self.submit_id)
+        if method == 'get':
+            response = self.results('get', action, 1, params=fields)
+        else:
+            response = self.results('post', action, 1, data=fields)
+        self.remember_links(response.text, response.url)
+        self.first_page = response.text
+        return response.text
+
+    def remember_links(self, page_source, base_url):
+        links = page_links(page_source, base_url)
+        self.links.update(links)
+        if self.template is None and links:
+            self.template = page_url_template(links)
+
+    def page(self, page):
+        '''Returns the html of results page `page` (1-based). submit() must be called first.'''
+        if page == 1 and self.first_page is not None:
+            return self.first_page
+        if page in self.links:
+            url = self.links[page]
+        elif self.template is not None:
+            url = build_page_url(self.template, page)
+        else:
+            raise MinibaseError('No link to page ' + str(page) + ' in the pager.')
+        response = self.results('get', url, page)
+        self.remember_links(response.text, response.url)
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+
+def iter_pages(url, delay=0, submit_id=SUBMIT_MAIN, pool_size=4, timeout=30, stop_before=None):
+    '''
+    HTTP counterpart of PCS_COVID_ScraPy.iter_pages: yields (page number, DataFrame) for each
+    results page as it is parsed. Walks the pages in one pass, following the pager until no
+    later page is offered.
+        Inputs:
+            url - (string) web address where the data portal can be accessed.
+            delay - (float) optional pause between page requests, to go easy on the server.
+                Nothing has to render, so the default is no delay.
+            submit_id - (string) SUBMIT_MAIN or SUBMIT_OLDDATA.
+            pool_size - (int) number of keep-alive connections held per host.
+            timeout - (float) seconds to wait for each response.
+            stop_before - (datetime, optional) stop after the first page holding a row dated
+                before this, as in PCS_COVID_ScraPy.iter_pages.
+    '''
+    client = MinibaseClient(url, submit_id=submit_id, pool_size=pool_size, timeout=timeout)
+    run = PCS.archive_run(url, submit_id)
+    try:
+        page_source = client.submit()
+        page = 1
+        while True:
+            PCS.archive_page(run, page, page_source, 'page')
+            temp_df = PCS.timed_parse(page_source, page, PCS.parse_table)
+            PCS.debug('Data scraped from page ' + str(page) + ' table (HTTP)...')
+            PCS.TELEMETRY.count('pages')
+            yield page, temp_df
+            if PCS.reached_watermark(temp_df, stop_before):
+                break
+            later = [p for p in page_links(page_source, url) if p > page]
+            if not later:
+                break
+            page += 1
+            if delay:
+                with PCS.TELEMETRY.stage('delay', page):
+                    time.sleep(delay)
+            page_source = client.page(page)
+    finally:
+        client.close()
+        PCS.TELEMETRY.flush()
+
+
+def Scrape_data(url, delay=0, submit_id=SUBMIT_MAIN, pool_size=4, timeout=30, stop_before=None, keep_pages=None):
+    '''
+    HTTP counterpart of PCS_COVID_ScraPy.Scrape_data. Takes the arguments of iter_pages and
+    returns (data_dict, data_df); data_dict holds each page only when keep_pages (by default
+    PCS_COVID_ScraPy.DEBUG) is set.
+    '''
+    data_dict, data_df = PCS.collect_pages(
+        iter_pages(url, delay, submit_id, pool_size, timeout, stop_before), keep_pages)
+    print('Scraped ' + str(len(data_df)) + ' rows over HTTP.')
+    return data_dict, data_df
+
+
+def count_pages(client, page_source):
+    '''
+    Finds the number of results pages by jumping to the furthest page each pager offers
+    (the trailing ellipsis) until no later page is listed. Costs one request per pager window
+    rather than one per page. Returns the total and the html of the last page fetched.
+    '''
+    page = 1
+    while True:
+        later = [p for p in page_links(page_source, client.url) if p > page]
+        if not later:
+            return page, page_source
+        page = max(later)
+        page_source = client.page(page)
+
+
+def Scrape_data_parallel(url, workers=4, max_per_host=4, submit_id=SUBMIT_MAIN, timeout=30):
+    '''
+    Scrape_data with the page range split across `workers` HTTP clients once the page count is
+    known. Each client has its own session (and so its own cookies); all of them share one
+    PCS_COVID_ScraPy.HostLimiter, so no more than `max_per_host` requests reach the dashboard
+    at once. Pages are reassembled in page order. Returns (data_dict, data_df).
+    '''
+    limiter = PCS.HostLimiter(max_per_host)
+    first = MinibaseClient(url, submit_id=submit_id, timeout=timeout, limiter=limiter)
+    page_one = first.submit()
+    tot, _ = count_pages(first, page_one)
+    print('Scraping ' + str(tot) + ' pages with ' + str(workers) + ' HTTP workers...')
+
+    def make_worker(first_page):
+        if first_page == 1:
+            return first
+        client = MinibaseClient(url, submit_id=submit_id, timeout=timeout, limiter=limiter)
+        client.submit()
+        #Carry over what the first client learned about page urls
+        client.links.update(first.links)
+        client.template = client.template or first.template
+        return client
+
+    pages = PCS.fetch_pages_concurrently(make_worker, range(1, tot+1), workers, run=PCS.archive_run(url, submit_id))
+    return PCS.collect_pages(pages)
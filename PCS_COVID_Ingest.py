@@ -0,0 +1,168 @@
+'''
+Single ingest stage for scraped case files.
+
+The saved files are not consistent: All_Data_2020-2021.csv starts with a byte order mark and
+writes dates as 6/28/2021, older dumps use 2021/08/19 and newer ones 2021-08-20. Dumps carry
+a saved index ('Unnamed: 0'), sometimes a 'Total cases' column, and data_dump_20210816 has the
+0, 1, 2 columns and jQuery text of a half-loaded page. ingest() turns any of them into the four
+dashboard columns:
+
+    Date                          datetime64, parsed with the one format detected for the file
+    Locations affected            categorical
+    Number of positive employees  smallest integer type that holds the counts (int16 or wider)
+    Number of positive students   likewise
+
+Rows that do not fit (no date, unparseable date or count, empty location) are returned
+separately in a quarantine table with the reason, instead of being dropped silently or
+breaking the analysis. Results are cached in .ingest_cache, keyed on each file's path, size and
+modification time, so re-ingesting unchanged files only reads the cache.
+'''
+import hashlib
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Date', 'Locations affected', 'Number of positive employees', 'Number of positive students']
+COUNTS = COLUMNS[2:]
+CACHE_DIR = '.ingest_cache'
+#Bump when the output of ingest() changes so that old cache entries are not used
+CACHE_VERSION = 1
+
+#Date formats the dashboard has served, keyed on the shape of the date
+DATE_FORMATS = [
+    (re.compile(r'^\d{4}/\d{1,2}/\d{1,2}$'), '%Y/%m/%d'),
+    (re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$'), '%Y-%m-%d'),
+    (re.compile(r'^\d{1,2}/\d{1,2}/\d{4}$'), '%m/%d/%Y'),
+]
+
+Ingested = namedtuple('Ingested', ['frame', 'quarantine', 'date_format'])
+
+_memory_cache = {}
+
+
+def date_format(value):
+    '''Returns the strptime format of a dashboard date string, or None if it is not one we know.'''
+    for pattern, fmt in DATE_FORMATS:
+        if pattern.match(value):
+            return fmt
+    return None
+
+
+def detect_format(dates):
+    '''Returns the format of the first recognizable date in a column of strings.'''
+    for value in dates:
+        fmt = date_format(value)
+        if fmt is not None:
+            return fmt
+    return None
+
+
+def compact_counts(values):
+    '''Casts whole-number counts to the smallest signed integer type from int16 up that holds them.'''
+    top = int(values.max()) if len(values) else 0
+    for dtype in (np.int16, np.int32):
+        if top <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+def normalize_table(raw, source=''):
+    '''
+    Normalizes a table of strings with (at least) the four dashboard columns. Returns an
+    Ingested tuple; quarantine holds the rejected rows as read, with `source` and `reason`.
+    '''
+    raw = raw.rename(columns=lambda c: str(c).strip().lstrip('﻿'))
+    missing = [c for c in COLUMNS if c not in raw.columns]
+    if missing:
+        raise ValueError(str(source) + ' has no ' + ', '.join(missing) + ' column.')
+    raw = raw[COLUMNS].fillna('').astype(str)
+    for name in COLUMNS:
+        raw[name] = raw[name].str.strip()
+
+    fmt = detect_format(raw['Date'])
+    if fmt is not None:
+        dates = pd.to_datetime(raw['Date'], format=fmt, errors='coerce')
+    else:
+        dates = pd.Series(pd.NaT, index=raw.index, dtype='datetime64[ns]')
+    counts = {name: pd.to_numeric(raw[name], errors='coerce') for name in COUNTS}
+
+    empty = (raw == '').all(axis=1).to_numpy()
+    bad_date = dates.isna().to_numpy()
+    bad_count = np.zeros(len(raw), dtype=bool)
+    for values in counts.values():
+        values = values.to_numpy(dtype=float)
+        bad_count |= np.isnan(values) | (values < 0) | (values != np.round(values))
+    bad_location = (raw['Locations affected'] == '').to_numpy()
+    reason = np.select([empty, bad_date, bad_count, bad_location],
+                       ['empty row', 'date', 'count', 'location'], default='')
+    good = reason == ''
+
+    frame = pd.DataFrame({
+        'Date': dates[good].to_numpy(),
+        'Locations affected': pd.Categorical(raw['Locations affected'][good].to_numpy()),
+    })
+    for name in COUNTS:
+        frame[name] = compact_counts(counts[name][good].to_numpy(dtype=float))
+    quarantine = raw[~good].assign(source=str(source), reason=reason[~good]).reset_index(drop=True)
+    return Ingested(frame, quarantine, fmt)
+
+
+def read_raw(path):
+    '''Reads a scraped csv as strings; the byte order mark in some files is dropped.'''
+    return pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+
+
+def cache_key(path):
+    stat = os.stat(path)
+    text = '|'.join([os.path.abspath(path), str(stat.st_size), str(stat.st_mtime_ns), str(CACHE_VERSION)])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def ingest(path, cache_dir=CACHE_DIR):
+    '''
+    Ingests one file (see the module docstring). Returns Ingested(frame, quarantine,
+    date_format). Pass cache_dir=None to skip the on-disk cache.
+    '''
+    key = cache_key(path)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    cached = None
+    if cache_dir is not None:
+        frame_path = os.path.join(cache_dir, key + '.parquet')
+        quarantine_path = os.path.join(cache_dir, key + '.quarantine.parquet')
+        if os.path.exists(frame_path) and os.path.exists(quarantine_path):
+            frame = pd.read_parquet(frame_path)
+            quarantine = pd.read_parquet(quarantine_path)
+            cached = Ingested(frame, quarantine, frame.attrs.get('date_format'))
+
+    if cached is None:
+        cached = normalize_table(read_raw(path), source=os.path.basename(path))
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            cached.frame.attrs['date_format'] = cached.date_format
+            cached.frame.to_parquet(frame_path, index=False)
+            cached.quarantine.to_parquet(quarantine_path, index=False)
+
+    _memory_cache[key] = cached
+    return cached
+
+
+def ingest_files(paths, cache_dir=CACHE_DIR):
+    '''
+    Ingests several files. Returns (frame, quarantine): all good rows with a `source`
+    column naming the file, and all quarantined rows.
+    '''
+    frames = []
+    quarantines = []
+    for path in paths:
+        result = ingest(path, cache_dir)
+        frames.append(result.frame.assign(source=os.path.basename(path)))
+        quarantines.append(result.quarantine)
+    frame = pd.concat(frames, ignore_index=True)
+    frame['Locations affected'] = frame['Locations affected'].astype('category')
+    frame['source'] = frame['source'].astype('category')
+    return frame, pd.concat(quarantines, ignore_index=True)
@@ -0,0 +1,204 @@
+'''
+Rates and trends of the case counts for every school, region and the district at once.
+
+CaseMetrics works on the (dates x schools) matrices of a PCS_COVID_Schools.SchoolSeries and
+an enrollment table, and computes every metric for all units in a few whole-matrix operations
+(window sums from the cumulative counts, one matrix product for the regions). No loop runs over
+the schools:
+
+    cases           cases in the last 7 and 14 days
+    incidence       the same per 1,000 enrolled
+    growth          week-over-week growth: last 7 days against the 7 days before, minus 1
+    doubling_time   days for the weekly case count to double at the current week-over-week
+                    growth (NaN when cases are not growing)
+    anomaly         True where the last 7 days are well above what the unit's own recent
+                    history predicts. The flag only uses the case counts themselves, so it
+                    needs no testing data: the baseline is the mean and spread of the daily
+                    counts in the `baseline_days` before the current week, the spread is at
+                    least the Poisson spread of that mean, and the week is flagged when it is
+                    more than `threshold` spreads above the baseline and holds at least
+                    `min_cases` cases.
+
+The enrollment table has a School and an Enrollment column and, optionally, a Region column
+grouping schools (e.g. North/South). Schools are matched to the dashboard's spellings through
+PCS_COVID_Schools.school_key.
+
+    metrics = CaseMetrics(school_series, 'school_enrollment.csv')
+    metrics.latest()                           one row per school, region and the district
+    metrics.frame('incidence', 14, ['Dunedin High', 'North'])
+'''
+import numpy as np
+import pandas as pd
+
+import PCS_COVID_Schools as Schools
+
+WINDOWS = (7, 14)
+#Incidence is given per this many enrolled
+PER = 1000
+#Days compared by week-over-week growth
+WEEK = 7
+DISTRICT = 'District'
+METRICS = ['cases', 'incidence', 'growth', 'doubling_time', 'anomaly']
+
+
+def read_enrollment(source):
+    '''
+    Enrollment table from a DataFrame or a csv file with School and Enrollment columns (and an
+    optional Region column). Adds the normalized school key used for matching.
+    '''
+    table = pd.read_csv(source) if isinstance(source, str) else pd.DataFrame(source).copy()
+    missing = [column for column in ['School', 'Enrollment'] if column not in table.columns]
+    if missing:
+        raise ValueError('The enrollment table has no ' + ' or '.join(missing) + ' column.')
+    table['Enrollment'] = pd.to_numeric(table['Enrollment'], errors='coerce')
+    table['key'] = table['School'].map(Schools.school_key)
+    return table
+
+
+def window_sums(cumulative, window):
+    '''Sums over the last `window` rows of cumulative counts (dates x units); NaN until a full window.'''
+    sums = np.full(cumulative.shape, np.nan)
+    if len(cumulative) >= window:
+        sums[window - 1:] = cumulative[window - 1:]
+        sums[window:] -= cumulative[:-window]
+    return sums
+
+
+def lagged(values, lag):
+    '''values shifted down by `lag` rows, NaN in the first ones.'''
+    shifted = np.full(values.shape, np.nan)
+    if lag < len(values):
+        shifted[lag:] = values[:len(values) - lag]
+    return shifted
+
+
+class CaseMetrics:
+    '''
+    Incidence, growth, doubling time and anomaly flags for every school, every region and the
+    district.
+        Inputs:
+            series - PCS_COVID_Schools.SchoolSeries over the case data.
+            enrollment - enrollment table (DataFrame or csv path, see read_enrollment).
+            measure - 'students', 'employees' or 'total': the counts to use. Enrollment is
+                a count of students, so 'students' is the natural match.
+            windows - lengths in days of the case and incidence windows.
+            per - incidence is cases per `per` enrolled.
+            district_enrollment - enrollment of the whole district. Defaults to the sum of the
+                table; give it when the table does not list every school.
+            baseline_days, threshold, min_cases - settings of the anomaly flag (see above).
+        Attributes:
+            dates - the series' dates.
+            units - DataFrame with one row per unit: name, kind ('school', 'region' or
+                'district') and enrollment. Column u of every matrix is unit u.
+            cases, incidence - {window: float array (dates x units)}.
+            growth, doubling_time - float arrays (dates x units).
+            anomaly - bool array (dates x units).
+            membership - (schools x regions) array, 1 where a school belongs to a region.
+            unmatched - schools in the enrollment table with no cases in the series.
+    '''
+
+    def __init__(self, series, enrollment, measure='students', windows=WINDOWS, per=PER,
+                 district_enrollment=None, baseline_days=28, threshold=3.0, min_cases=3):
+        self.series = series
+        self.windows = tuple(windows)
+        self.dates = series.dates
+        n_schools = len(series.index)
+
+        table = read_enrollment(enrollment)
+        codes = table['key'].map(series.index.codes_by_key)
+        matched = codes.notna().to_numpy()
+        self.unmatched = table.loc[~matched, 'School'].tolist()
+        table = table[matched]
+        codes = codes[matched].to_numpy(dtype=np.int64)
+        school_enrollment = np.full(n_schools, np.nan)
+        school_enrollment[codes] = table['Enrollment'].to_numpy(dtype=float)
+
+        #Schools x regions membership, so that every region's counts come from one product
+        if 'Region' in table.columns:
+            region_codes, regions = pd.factorize(table['Region'], sort=True)
+        else:
+            region_codes, regions = np.array([], dtype=np.int64), pd.Index([])
+        membership = np.zeros((n_schools, len(regions)))
+        in_region = region_codes >= 0
+        membership[codes[in_region], region_codes[in_region]] = 1
+        self.membership = membership
+
+        if district_enrollment is None:
+            district_enrollment = np.nansum(school_enrollment)
+        enrolled = np.concatenate([school_enrollment, np.nan_to_num(school_enrollment) @ membership,
+                                   [district_enrollment]])
+        enrolled[enrolled <= 0] = np.nan
+        self.units = pd.DataFrame({
+            'name': list(series.index.schools['name']) + [str(region) for region in regions] + [DISTRICT],
+            'kind': ['school'] * n_schools + ['region'] * len(regions) + ['district'],
+            'enrollment': enrolled,
+        })
+
+        schools = series.daily[measure].astype(float)
+        daily = np.hstack([schools, schools @ membership, schools.sum(axis=1, keepdims=True)])
+        cumulative = daily.cumsum(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.cases = {window: window_sums(cumulative, window) for window in self.windows}
+            self.incidence = {window: cases / enrolled * per for window, cases in self.cases.items()}
+
+            week = self.cases[WEEK] if WEEK in self.cases else window_sums(cumulative, WEEK)
+            ratio = week / lagged(week, WEEK)
+            ratio[~np.isfinite(ratio)] = np.nan
+            self.growth = ratio - 1
+            rate = np.log(ratio) / WEEK
+            self.doubling_time = np.where(rate > 0, np.log(2) / rate, np.nan)
+
+            #Mean and variance of the daily counts over the baseline_days before the current week
+            before_week = lagged(cumulative, WEEK)
+            base_sum = before_week - lagged(cumulative, WEEK + baseline_days)
+            squares = (daily ** 2).cumsum(axis=0)
+            base_squares = lagged(squares, WEEK) - lagged(squares, WEEK + baseline_days)
+            mean = base_sum / baseline_days
+            variance = np.maximum(base_squares / baseline_days - mean ** 2, mean)
+            expected = WEEK * mean
+            spread = np.sqrt(WEEK * variance)
+            self.anomaly = (week > expected + threshold * spread) & (week >= min_cases)
+
+    def columns(self, units=None):
+        '''
+        Unit columns for a list of schools (codes or name text, see SchoolIndex.find), region
+        names and 'District'; all units if None.
+        '''
+        if units is None:
+            return np.arange(len(self.units))
+        if isinstance(units, (str, int, np.integer)):
+            units = [units]
+        n_schools = len(self.series.index)
+        others = {name: column for column, name in enumerate(self.units['name'][n_schools:], n_schools)}
+        columns = [np.array([others[unit]]) if isinstance(unit, str) and unit in others
+                   else self.series.columns(unit) for unit in units]
+        return np.concatenate(columns) if columns else np.array([], dtype=np.int64)
+
+    def matrix(self, metric='incidence', window=WEEK):
+        '''The (dates x units) array of `metric`; window applies to cases and incidence.'''
+        if metric not in METRICS:
+            raise ValueError('metric must be one of ' + ', '.join(METRICS))
+        values = getattr(self, metric)
+        return values[window] if isinstance(values, dict) else values
+
+    def frame(self, metric='incidence', window=WEEK, units=None):
+        '''DataFrame of `metric` over the dates, one column per unit (see columns).'''
+        columns = self.columns(units)
+        return pd.DataFrame(self.matrix(metric, window)[:, columns], index=self.dates,
+                            columns=self.units['name'].to_numpy()[columns])
+
+    def latest(self, date=None):
+        '''
+        Every metric on `date` (default: the last date) for every unit, one row per unit, with
+        the units' kind and enrollment.
+        '''
+        row = len(self.dates) - 1 if date is None else self.dates.get_loc(pd.Timestamp(date))
+        table = self.units.copy()
+        for window in self.windows:
+            table['cases_' + str(window)] = self.cases[window][row]
+            table['incidence_' + str(window)] = self.incidence[window][row]
+        table['growth'] = self.growth[row]
+        table['doubling_time'] = self.doubling_time[row]
+        table['anomaly'] = self.anomaly[row]
+        return table
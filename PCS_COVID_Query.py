@@ -0,0 +1,321 @@
+'''
+Query layer over the case store, for dashboards and anyone who needs a number without running
+the notebooks:
+
+    service = QueryService('case_store', enrollment='school_enrollment.csv')
+    service.series('Dunedin High', 'rolling', start='2021-08-11')
+    service.series('North', 'incidence_7')          regions come from the enrollment table
+    service.series('district', 'cumulative', measure='students')
+
+Everything is served from the store's aggregate cube (PCS_COVID_Store.AggregateCube): the
+daily sums per school are turned into PCS_COVID_Schools.SchoolSeries matrices, and into
+PCS_COVID_Metrics.CaseMetrics when an enrollment table is given, once per store version.
+The service never writes to the store: a cube that is behind the store is rebuilt in memory.
+Cumulative counts follow the cube: they start again at 0 on the first day of each school year
+(July 1st), so the district's are the cube's Cumulative columns, and a school's or region's
+count the same way. Giving `start` only cuts the series; it does not move that baseline.
+Answers are kept in an LRU cache keyed by the store version, so a repeated query costs a
+dictionary lookup, and an append to the store (from any process) makes the next query rebuild.
+
+serve() puts the same queries behind a local HTTP/JSON endpoint:
+
+    GET /series?unit=Dunedin%20High&metric=rolling&measure=total&start=2021-08-11&end=2021-09-30
+    GET /units
+    GET /version
+
+Responses carry an ETag made from the store version and the query, and a request whose
+If-None-Match matches gets 304 Not Modified without a body. Start it with `pcs-covid serve`.
+'''
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+import pandas as pd
+
+import PCS_COVID_Metrics as Metrics
+import PCS_COVID_Schools as Schools
+import PCS_COVID_Store as Store
+
+DISTRICT = 'district'
+MEASURES = ['employees', 'students', 'total']
+KINDS = Schools.KINDS
+#Metrics that need the enrollment table, by query name: (CaseMetrics metric, window)
+RATE_METRICS = {
+    'cases_7': ('cases', 7),
+    'cases_14': ('cases', 14),
+    'incidence_7': ('incidence', 7),
+    'incidence_14': ('incidence', 14),
+    'growth': ('growth', 7),
+    'doubling_time': ('doubling_time', 7),
+    'anomaly': ('anomaly', 7),
+}
+
+
+def year_cumsum(daily, years):
+    '''Cumulative sums down the rows of `daily`, starting again where the label in `years` changes.'''
+    cumulative = daily.cumsum(axis=0)
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]]) if len(years) else np.array([], dtype=np.int64)
+    segment = np.searchsorted(starts, np.arange(len(daily)), side='right') - 1
+    #The running total just before each row's school year began
+    before = np.concatenate([np.zeros_like(cumulative[:1]), cumulative])[starts]
+    return cumulative - before[segment]
+
+
+class QueryError(ValueError):
+    '''Raised for a query that cannot be answered (unknown unit or metric).'''
+
+
+class LRUCache:
+    '''A dictionary holding at most `size` entries, dropping the least recently used.'''
+
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make):
+        '''The entry for `key`, made with make() if it is missing.'''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = make()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+
+class QueryService:
+    '''
+    Answers series queries from the case store in folder `root`.
+        Inputs:
+            root - (string) folder of the PCS_COVID_Store.CaseStore.
+            enrollment - enrollment table (DataFrame or csv path, see PCS_COVID_Metrics) for the
+                rate metrics and the regions; optional.
+            cache_size - (int) number of answers kept.
+    '''
+
+    def __init__(self, root='case_store', enrollment=None, cache_size=256):
+        self.root = root
+        self.enrollment = enrollment
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.meta_stamp = None
+        self.store_version = None
+        self.data = None
+
+    def version(self):
+        '''The store's version, re-read only when store.json has changed on disk.'''
+        meta_path = os.path.join(self.root, 'store.json')
+        stat = os.stat(meta_path) if os.path.exists(meta_path) else None
+        stamp = (stat.st_mtime_ns, stat.st_size) if stat is not None else None
+        with self.lock:
+            if stamp != self.meta_stamp or self.store_version is None:
+                self.store_version = Store.CaseStore(self.root).version
+                self.meta_stamp = stamp
+            return self.store_version
+
+    def state(self, version):
+        '''Series matrices (and metrics) for store `version`, built once per version.'''
+        with self.lock:
+            if self.data is not None and self.data['version'] == version:
+                return self.data
+            store = Store.CaseStore(self.root)
+            #Never store.cube: rebuilding it here would write store.json over a concurrent append
+            cube = store.cube_view()
+            sums = cube.schools()
+            series = Schools.SchoolSeries(sums)
+            metrics = Metrics.CaseMetrics(series, self.enrollment) if self.enrollment is not None else None
+
+            #School cumulatives start again each school year, as the cube's district ones do
+            years = Store.school_year(series.dates).to_numpy()
+            cumulative = {measure: year_cumsum(daily, years) for measure, daily in series.daily.items()}
+
+            #District totals from the cube's exact daily sums, so a row naming two schools counts
+            #once, and its per-school-year cumulative columns carried over days without reports
+            cube_district = cube.district().set_index('Date')
+            counts = cube_district[Store.CUBE_COUNTS].reindex(series.dates, fill_value=0)
+            totals = cube_district[Store.CUMULATIVE].reindex(series.dates).groupby(years).ffill().fillna(0)
+            district = {'daily': {}, 'cumulative': {}, 'rolling': {}}
+            for measure, column in zip(MEASURES, Store.CUBE_COUNTS):
+                daily = counts[column].to_numpy(dtype=np.int64)
+                running = daily.cumsum()
+                rolling = running.copy()
+                rolling[series.window:] -= running[:-series.window]
+                district['daily'][measure] = daily
+                district['cumulative'][measure] = totals['Cumulative ' + column].to_numpy(dtype=np.int64)
+                district['rolling'][measure] = rolling
+
+            self.data = {'version': store.version, 'series': series, 'metrics': metrics, 'district': district,
+                         'cumulative': cumulative}
+            return self.data
+
+    def units(self):
+        '''The schools (by their most common spelling) and regions that can be queried.'''
+        return self.cache.get((self.version(), 'units'), self.make_units)
+
+    def make_units(self):
+        data = self.state(self.version())
+        regions = []
+        if data['metrics'] is not None:
+            units = data['metrics'].units
+            regions = units.loc[units['kind'] == 'region', 'name'].tolist()
+        return {'schools': data['series'].index.schools['name'].tolist(), 'regions': regions,
+                'metrics': KINDS + (list(RATE_METRICS) if data['metrics'] is not None else []),
+                'measures': MEASURES}
+
+    def series(self, unit, metric='daily', measure='total', start=None, end=None):
+        '''
+        The daily series of `metric` for `unit` between start and end (inclusive), as a
+        pandas Series indexed by date. The result is shared with the cache: copy it before
+        changing it.
+            unit - 'district', a region of the enrollment table, or school name text (see
+                PCS_COVID_Schools.SchoolIndex.find; several matching schools are added up).
+            metric - 'daily', 'cumulative' (since the start of each school year) or 'rolling'
+                (7-day) counts, or with an enrollment table one of RATE_METRICS ('incidence_7',
+                'growth', 'anomaly', ...).
+            measure - 'employees', 'students' or 'total'. The rate metrics use the students.
+            start, end - dates cutting the series. The cumulative counts keep their school-year
+                baseline: from a start after July 1st they do not begin at 0.
+        '''
+        key = (self.version(), 'series', unit, metric, measure, str(start), str(end))
+        return self.cache.get(key, lambda: self.make_series(key[0], unit, metric, measure, start, end))
+
+    def make_series(self, version, unit, metric, measure, start, end):
+        if measure not in MEASURES:
+            raise QueryError('measure must be one of ' + ', '.join(MEASURES))
+        data = self.state(version)
+        series = data['series']
+        if metric in KINDS:
+            if str(unit).lower() == DISTRICT:
+                values = data['district'][metric][measure]
+            else:
+                matrix = data['cumulative'][measure] if metric == 'cumulative' else series.matrix(metric, measure)
+                values = self.unit_values(data, unit, matrix)
+        elif metric in RATE_METRICS:
+            if data['metrics'] is None:
+                raise QueryError(metric + ' needs an enrollment table.')
+            name, window = RATE_METRICS[metric]
+            metrics = data['metrics']
+            unit_name = Metrics.DISTRICT if str(unit).lower() == DISTRICT else unit
+            columns = metrics.columns(unit_name)
+            if len(columns) != 1:
+                raise QueryError(self.unit_error(unit, columns))
+            values = metrics.matrix(name, window)[:, columns[0]]
+        else:
+            raise QueryError('Unknown metric ' + str(metric) + '.')
+        result = pd.Series(values, index=series.dates, name=str(unit))
+        return result.loc[pd.Timestamp(start) if start else None:pd.Timestamp(end) if end else None]
+
+    def unit_values(self, data, unit, matrix):
+        '''Column sum of `matrix` over the schools of `unit` (a region or school name text).'''
+        metrics = data['metrics']
+        n_schools = len(data['series'].index)
+        regions = {} if metrics is None else {name: column - n_schools for column, name in
+                                              enumerate(metrics.units['name'][n_schools:-1], n_schools)}
+        if unit in regions:
+            members = np.flatnonzero(metrics.membership[:, regions[unit]])
+        else:
+            members = data['series'].columns(unit)
+        if not len(members):
+            raise QueryError(self.unit_error(unit, members))
+        return matrix[:, members].sum(axis=1)
+
+    @staticmethod
+    def unit_error(unit, columns):
+        if not len(columns):
+            return 'No school or region matches ' + repr(unit) + '.'
+        return repr(unit) + ' matches ' + str(len(columns)) + ' schools; rates are given for one school at a time.'
+
+    def etag(self, fields):
+        '''ETag of a /series answer: the store version and the query, known before any work is done.'''
+        return '"' + str(self.version()) + '-' + hashlib.sha1(repr(fields).encode()).hexdigest()[:16] + '"'
+
+    def payload(self, fields):
+        '''The JSON bytes answering query_fields() of a /series request, cached like series().'''
+        version = self.version()
+
+        def make():
+            values = self.series(*fields)
+            body = {'version': version, 'unit': fields[0], 'metric': fields[1], 'measure': fields[2],
+                    'dates': [day.strftime('%Y-%m-%d') for day in values.index],
+                    'values': json_values(values.to_numpy())}
+            return json.dumps(body).encode()
+        return self.cache.get((version, 'payload') + fields, make)
+
+def query_fields(query):
+    '''(unit, metric, measure, start, end) from the fields of a /series query string.'''
+    return (query.get('unit', DISTRICT), query.get('metric', 'daily'), query.get('measure', 'total'),
+            query.get('start') or None, query.get('end') or None)
+
+
+def json_values(values):
+    '''A numpy array as a JSON-ready list, with NaN as None.'''
+    if values.dtype.kind == 'f':
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body=b'', etag=None):
+            self.send_response(status)
+            if etag is not None:
+                self.send_header('ETag', etag)
+                #Dashboards may keep the answer but must ask again; a 304 makes that cheap
+                self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def send_json(self, value, status=200):
+            self.send(status, json.dumps(value).encode())
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = dict(parse_qsl(url.query))
+            try:
+                if url.path == '/series':
+                    fields = query_fields(query)
+                    etag = service.etag(fields)
+                    if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                        self.send(304, etag=etag)
+                    else:
+                        self.send(200, service.payload(fields), etag)
+                elif url.path == '/units':
+                    self.send_json(service.units())
+                elif url.path == '/version':
+                    self.send_json({'version': service.version()})
+                else:
+                    self.send_json({'error': 'Unknown path ' + url.path}, 404)
+            except (QueryError, ValueError, KeyError) as err:
+                self.send_json({'error': str(err)}, 400)
+
+    return Handler
+
+
+def serve(service, host='127.0.0.1', port=8050):
+    '''Starts the endpoint on a background thread. Returns (server, url); server.shutdown() stops it.'''
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://' + host + ':' + str(server.server_address[1]) + '/'
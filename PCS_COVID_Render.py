@@ -0,0 +1,231 @@
+'''
+Batch rendering of the dashboard figures.
+
+Each figure is described by a FigureSpec: its name (the output path without extension,
+relative to the output folder), the kind of drawing, the data it plots, a style dict and the
+formats to write. render() draws the specs in a process pool on the Agg canvas, without pyplot,
+so the workers share no state and need no display. A figure is keyed on a hash of its data,
+style and formats and skipped when the key and the files on disk match the last run (recorded
+in .render_manifest.json in the output folder), so a nightly run only redraws what changed.
+
+Each figure is drawn once: png and jpg are written from the same Agg buffer, and only vector
+formats (pdf, svg) take another pass.
+
+    specs = [daily_spec(cube.district(start='2021-08-11').set_index('Date')),
+             terms_spec(curves, '2021-2022 Fall', school_days)]
+    specs += school_specs(PCS_COVID_Schools.SchoolSeries(data_df))
+    render(specs)
+'''
+import ast
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+#Bump when the drawing code changes so that every figure is redrawn
+RENDER_VERSION = 1
+MANIFEST = '.render_manifest.json'
+RASTER = ('png', 'jpg', 'jpeg')
+EMPLOYEES = 'Number of positive employees'
+STUDENTS = 'Number of positive students'
+
+FigureSpec = namedtuple('FigureSpec', ['name', 'kind', 'data', 'style', 'formats'])
+
+
+def draw_daily(fig, data, style):
+    '''Daily district reports for employees and students; data is indexed by date.'''
+    ax = fig.add_subplot()
+    ax.plot(data.index, data[EMPLOYEES], color='lightgreen', mec='k', marker='o', markersize=10)
+    ax.plot(data.index, data[STUDENTS], color='lightblue', mec='k', marker='^', markersize=10)
+    ax.title.set_text(style.get('title', 'Total daily +COVID reports - Pinellas County Schools'))
+    ax.set_ylabel('# of positive cases reported each day')
+    for label in ax.get_xticklabels():
+        label.set_rotation(30)
+        label.set_horizontalalignment('right')
+    ax.legend(['Employees', 'Students'])
+
+
+def draw_terms(fig, data, style):
+    '''Cumulative curves by school day, one column per term (PCS_COVID_Terms.cumulative_curves).'''
+    ax = fig.add_subplot()
+    for term in data.columns:
+        if term == style.get('current'):
+            line = dict(marker='s', markerfacecolor='orange', color='k')
+        else:
+            line = dict(marker='d', markerfacecolor='lightgray', color='lightgray')
+        ax.plot(data.index, data[term], mec='k', markersize=10,
+                label=term + ', ' + str(int(np.nanmax(data[term]))) + ' total cases', **line)
+    ax.set_ylabel('District-wide cumulative sum, + cases')
+    ax.set_xlabel('School days since the first day of semester')
+    ax.legend()
+    ax.set_title('Cumulative cases after ' + str(style.get('school_days', len(data))) + ' school days')
+
+
+def draw_school(fig, data, style):
+    '''Small multiple for one school: daily student reports and cumulative students and employees.'''
+    ax = fig.add_subplot()
+    #One filled step area rather than a bar patch per day, which is far cheaper to draw
+    ax.fill_between(data.index, data['daily students'], step='mid', color='lightblue', label='Students per day')
+    ax.plot(data.index, data['cumulative students'], color='k', label='Students, cumulative')
+    ax.plot(data.index, data['cumulative employees'], color='k', linestyle='--', label='Employees, cumulative')
+    ax.set_title(style.get('title', ''), fontsize=9)
+    ax.tick_params(labelsize=7)
+    for label in ax.get_xticklabels():
+        label.set_rotation(30)
+        label.set_horizontalalignment('right')
+    ax.legend(fontsize=6, loc='upper left')
+    fig.subplots_adjust(left=0.12, right=0.97, top=0.9, bottom=0.2)
+
+
+DRAWERS = {
+    'daily': draw_daily,
+    'terms': draw_terms,
+    'school': draw_school,
+}
+
+
+def daily_spec(cases_by_date, name='Daily Positive Cases', formats=('png',)):
+    '''The daily district figure; cases_by_date is indexed by date and has both count columns.'''
+    return FigureSpec(name, 'daily', cases_by_date[[EMPLOYEES, STUDENTS]], {}, tuple(formats))
+
+
+def terms_spec(curves, current_term, school_days, name='DailyCumsumComparison', formats=('png', 'jpg', 'pdf')):
+    '''The semester comparison, from PCS_COVID_Terms.cumulative_curves.'''
+    return FigureSpec(name, 'terms', curves, {'current': current_term, 'school_days': school_days}, tuple(formats))
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text).casefold()).strip('-')
+
+
+def school_specs(series, folder='schools', formats=('png',)):
+    '''One small figure per school from a PCS_COVID_Schools.SchoolSeries, named <folder>/<school>.'''
+    specs = []
+    for code, key, name in series.index.schools[['code', 'key', 'name']].itertuples(index=False):
+        data = pd.DataFrame({
+            'daily students': series.daily['students'][:, code],
+            'cumulative students': series.cumulative['students'][:, code],
+            'cumulative employees': series.cumulative['employees'][:, code],
+        }, index=series.dates)
+        specs.append(FigureSpec(folder + '/' + slug(key), 'school', data,
+                                {'title': name, 'figsize': [4, 3]}, tuple(formats)))
+    return specs
+
+
+def figure_key(spec):
+    '''Hash of everything that decides what a figure looks like.'''
+    digest = hashlib.sha1()
+    digest.update(json.dumps([RENDER_VERSION, spec.kind, spec.style, list(spec.formats),
+                              [str(c) for c in spec.data.columns]], sort_keys=True, default=str).encode())
+    digest.update(pd.util.hash_pandas_object(spec.data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def output_paths(spec, out_dir):
+    return [os.path.join(out_dir, spec.name + '.' + fmt) for fmt in spec.formats]
+
+
+def render_one(spec, out_dir='.'):
+    '''Draws one figure and writes all of its formats. Returns the spec's name.'''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from PIL import Image
+
+    fig = Figure(figsize=spec.style.get('figsize', (6.4, 4.8)))
+    canvas = FigureCanvasAgg(fig)
+    DRAWERS[spec.kind](fig, spec.data, spec.style)
+    paths = output_paths(spec, out_dir)
+    os.makedirs(os.path.dirname(paths[0]) or '.', exist_ok=True)
+
+    raster = [(fmt, path) for fmt, path in zip(spec.formats, paths) if fmt in RASTER]
+    if raster:
+        canvas.draw()
+        image = Image.fromarray(np.asarray(canvas.buffer_rgba()))
+        for fmt, path in raster:
+            if fmt == 'png':
+                image.save(path, dpi=(fig.dpi, fig.dpi))
+            else:
+                image.convert('RGB').save(path, quality=95, dpi=(fig.dpi, fig.dpi))
+    for fmt, path in zip(spec.formats, paths):
+        if fmt not in RASTER:
+            fig.savefig(path, format=fmt)
+    return spec.name
+
+
+def main_is_guarded():
+    '''
+    Checks whether worker processes can be started from the current call to render. With the
+    spawn and forkserver start methods each worker imports the __main__ script again, so a call
+    at the top level of a script would start the pool again in every worker. Calls from an
+    interpreter or a notebook (no script to import) and calls made under
+    if __name__ == '__main__': are safe, as is everything when workers are forked.
+        Returns True if a process pool can be used.
+    '''
+    if multiprocessing.get_start_method() == 'fork':
+        return True
+    main = sys.modules.get('__main__')
+    path = getattr(main, '__file__', None)
+    if path is None:
+        return True
+    #Find the line of the script that led to this call
+    frame = sys._getframe(1)
+    while frame is not None and not (frame.f_globals is vars(main) and frame.f_code.co_name == '<module>'):
+        frame = frame.f_back
+    if frame is None:
+        return True
+    try:
+        with open(path) as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return False
+    for node in tree.body:
+        if node.lineno <= frame.f_lineno <= node.end_lineno:
+            return isinstance(node, ast.If) and '__name__' in ast.dump(node.test)
+    return False
+
+
+def render(specs, out_dir='.', workers=None, force=False):
+    '''
+    Draws the specs whose figures are out of date.
+        Inputs:
+            specs - list of FigureSpec.
+            out_dir - folder the figure names are relative to; the manifest is kept here.
+            workers - number of processes (default: one per CPU); 1 draws in this process, as
+                      does a call from the top level of a script that workers cannot import
+                      safely (see main_is_guarded).
+            force - redraw everything.
+        Returns the names of the figures drawn.
+    '''
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    keys = {spec.name: figure_key(spec) for spec in specs}
+    stale = [spec for spec in specs
+             if force or manifest.get(spec.name) != keys[spec.name]
+             or not all(os.path.exists(path) for path in output_paths(spec, out_dir))]
+
+    if workers == 1 or len(stale) <= 1 or not main_is_guarded():
+        drawn = [render_one(spec, out_dir) for spec in stale]
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(stale) // (workers * 4))
+            drawn = list(pool.map(render_one, stale, [out_dir] * len(stale), chunksize=chunksize))
+
+    manifest.update({name: keys[name] for name in drawn})
+    os.makedirs(out_dir, exist_ok=True)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+    return drawn
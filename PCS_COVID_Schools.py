@@ -0,0 +1,236 @@
+'''
+School dimension table and row index for the case data.
+
+The dashboard's 'Locations affected' column names the same school in several ways
+('Academie Da Vinci', 'Academie da Vinci Charter School', ...), and a cell may list more than
+one location. SchoolIndex normalizes the names once, gives every school an integer code, and
+builds an index from each school to the positions of its rows. All schools are indexed in a
+single pass over the column, instead of one str.contains scan per school.
+
+    index = SchoolIndex(data_df['Locations affected'])
+    index.schools                        dimension table: code, key, name, rows
+    index.rows('St. Petersburg High')    row positions of the matching school(s)
+    index.select(data_df, 'Dunedin High')
+'''
+import re
+
+import numpy as np
+import pandas as pd
+
+#A cell listing several locations separates them with one of these
+SEPARATORS = r'\s*(?:;|\n|\|)\s*'
+#Endings that only some spellings of a school's name carry
+OPTIONAL_SUFFIXES = re.compile(r'\s+(?:charter school|charter)$')
+#Different names for the same school, by normalized key
+ALIASES = {
+    'rawlings elementary school': 'marjorie rawlings elementary school',
+}
+
+
+def school_key(name):
+    '''
+    Normalized form of a school name used to match spellings: lower case, one kind of dash, no
+    periods, single spaces, without a trailing 'Charter School'/'Charter', aliases applied.
+    '''
+    key = str(name).casefold()
+    key = re.sub('[–—]', '-', key).replace('.', '')
+    key = re.sub(r'\s+', ' ', key).strip()
+    key = OPTIONAL_SUFFIXES.sub('', key)
+    return ALIASES.get(key, key)
+
+
+def split_locations(cell, separators=SEPARATORS):
+    '''Splits a 'Locations affected' cell into the names it lists.'''
+    return [name for name in re.split(separators, str(cell).strip()) if name]
+
+
+class SchoolIndex:
+    '''
+    Dimension table and school -> rows index over a 'Locations affected' column.
+        Inputs:
+            locations - the column (any Series or array; categoricals are used as they are).
+            separators - regular expression splitting a cell that lists several locations.
+        Attributes:
+            schools - DataFrame with one row per school: code, key (normalized name), name (the
+                most common spelling) and rows (how many rows mention it).
+            row_positions, school_codes - parallel arrays with one entry per (row, school) pair,
+                sorted by school code; a row listing two schools appears twice.
+            offsets - row_positions[offsets[c]:offsets[c+1]] are the rows of school code c.
+    '''
+
+    def __init__(self, locations, separators=SEPARATORS):
+        cell_codes, cells = pd.factorize(pd.Series(locations).astype(object), use_na_sentinel=True)
+
+        #Work out the schools of each distinct cell value (a few hundred), not of each row
+        keys = {}
+        cell_schools = []
+        for cell in cells:
+            codes = [keys.setdefault(school_key(name), len(keys)) for name in split_locations(cell, separators)]
+            #A school named twice in one cell still counts once for the row
+            cell_schools.append(list(dict.fromkeys(codes)))
+
+        #Pairs (distinct cell, school), then expand to rows with one sort by cell code
+        pair_cells = np.array([c for c, codes in enumerate(cell_schools) for _ in codes], dtype=np.int64)
+        pair_schools = np.array([s for codes in cell_schools for s in codes], dtype=np.int64)
+        valid = cell_codes >= 0
+        order = np.argsort(cell_codes[valid], kind='stable')
+        sorted_rows = np.flatnonzero(valid)[order]
+        cell_starts = np.searchsorted(cell_codes[valid][order], np.arange(len(cells) + 1))
+        counts = np.diff(cell_starts)
+
+        rows_per_pair = counts[pair_cells]
+        row_positions = np.concatenate([sorted_rows[cell_starts[c]:cell_starts[c + 1]] for c in pair_cells]) \
+            if len(pair_cells) else np.array([], dtype=np.int64)
+        school_codes = np.repeat(pair_schools, rows_per_pair)
+        by_school = np.lexsort((row_positions, school_codes))
+        self.row_positions = row_positions[by_school]
+        self.school_codes = school_codes[by_school]
+        self.offsets = np.searchsorted(self.school_codes, np.arange(len(keys) + 1))
+        self.size = len(cell_codes)
+        #First school listed in each distinct cell, for primary_codes()
+        first = np.array([codes[0] if codes else -1 for codes in cell_schools] + [-1], dtype=np.int64)
+        self.primary = first[np.where(valid, cell_codes, -1)]
+
+        #Count spellings by rows so the most common one names the school
+        spelling_rows = {}
+        for c, cell in enumerate(cells):
+            for name in split_locations(cell, separators):
+                code = keys[school_key(name)]
+                spelling_rows.setdefault(code, {})
+                spelling_rows[code][name] = spelling_rows[code].get(name, 0) + counts[c]
+        names = [max(spelling_rows[code].items(), key=lambda item: item[1])[0] for code in range(len(keys))]
+        self.schools = pd.DataFrame({
+            'code': np.arange(len(keys)),
+            'key': list(keys),
+            'name': names,
+            'rows': np.diff(self.offsets),
+        })
+        self.codes_by_key = keys
+
+    def __len__(self):
+        return len(self.schools)
+
+    def find(self, text):
+        '''
+        Codes of the schools whose name contains `text` (compared in normalized form), e.g.
+        find('St. Petersburg High') -> code of St. Petersburg High School.
+        '''
+        key = school_key(text)
+        if key in self.codes_by_key:
+            return np.array([self.codes_by_key[key]])
+        match = self.schools['key'].str.contains(key, regex=False).to_numpy()
+        return self.schools['code'].to_numpy()[match]
+
+    def rows_of(self, code):
+        '''Row positions of school `code`, in row order.'''
+        return self.row_positions[self.offsets[code]:self.offsets[code + 1]]
+
+    def rows(self, text):
+        '''Row positions of every school matching `text` (see find), in row order.'''
+        codes = self.find(text)
+        if len(codes) == 1:
+            return self.rows_of(codes[0])
+        return np.unique(np.concatenate([self.rows_of(code) for code in codes])) if len(codes) else np.array([], dtype=np.int64)
+
+    def select(self, data_df, text):
+        '''The rows of data_df for schools matching `text`. data_df must be the frame indexed.'''
+        if len(data_df) != self.size:
+            raise ValueError('data_df has ' + str(len(data_df)) + ' rows; the index was built on ' + str(self.size) + '.')
+        return data_df.iloc[self.rows(text)]
+
+    def primary_codes(self):
+        '''One school code per row: the first school listed in the row's cell (-1 if none).'''
+        return self.primary
+
+
+#Count columns, by the short names used for them here
+MEASURES = {
+    'employees': 'Number of positive employees',
+    'students': 'Number of positive students',
+}
+KINDS = ['daily', 'cumulative', 'rolling']
+
+
+class SchoolSeries:
+    '''
+    Dense (dates x schools) matrices of case counts for every school at once, built in one
+    vectorized pass instead of one filter, sort and cumsum per school.
+        Inputs:
+            data_df - frame with the Date and count columns; the one `index` was built on.
+            index - SchoolIndex over data_df['Locations affected'] (built here if not given).
+            window - length in days of the rolling sums.
+        Attributes:
+            dates - DatetimeIndex with every calendar day from the first date to the last, so
+                days without reports are zeros and the rolling sums span calendar days.
+            daily, cumulative, rolling - {measure: int64 array of shape (dates, schools)} for
+                the measures 'employees', 'students' and 'total'. Column c is school code c of
+                index.schools.
+    A row listing several schools counts for each of them, as a text search would.
+    '''
+
+    def __init__(self, data_df, index=None, window=7):
+        if index is None:
+            index = SchoolIndex(data_df['Locations affected'])
+        if len(data_df) != index.size:
+            raise ValueError('data_df has ' + str(len(data_df)) + ' rows; the index was built on ' + str(index.size) + '.')
+        self.index = index
+        self.window = window
+
+        days = pd.to_datetime(data_df['Date']).to_numpy().astype('datetime64[D]')
+        dated = ~np.isnat(days)
+        first = days[dated].min() if dated.any() else np.datetime64('1970-01-01', 'D')
+        n_days = int((days[dated].max() - first).astype(np.int64)) + 1 if dated.any() else 0
+        self.dates = pd.date_range(pd.Timestamp(first), periods=n_days, freq='D')
+
+        #One (day, school) cell per (row, school) pair of the index
+        keep = dated[index.row_positions]
+        rows = index.row_positions[keep]
+        cell = (days[rows] - first).astype(np.int64) * len(index) + index.school_codes[keep]
+        self.daily = {}
+        for measure, column in MEASURES.items():
+            values = pd.to_numeric(data_df[column], errors='coerce').fillna(0).to_numpy(dtype=np.int64)[rows]
+            counts = np.bincount(cell, weights=values, minlength=n_days * len(index))
+            self.daily[measure] = counts.astype(np.int64).reshape(n_days, len(index))
+        self.daily['total'] = self.daily['employees'] + self.daily['students']
+
+        self.cumulative = {measure: daily.cumsum(axis=0) for measure, daily in self.daily.items()}
+        self.rolling = {}
+        for measure, cumulative in self.cumulative.items():
+            rolling = cumulative.copy()
+            rolling[window:] -= cumulative[:-window]
+            self.rolling[measure] = rolling
+
+    def matrix(self, kind='cumulative', measure='students'):
+        '''The (dates x schools) array of `kind` ('daily', 'cumulative', 'rolling') for `measure`.'''
+        if kind not in KINDS:
+            raise ValueError('kind must be one of ' + ', '.join(KINDS))
+        return getattr(self, kind)[measure]
+
+    def columns(self, schools=None):
+        '''
+        School codes for a list of schools given as codes or name text (see SchoolIndex.find);
+        all schools if None.
+        '''
+        if schools is None:
+            return self.index.schools['code'].to_numpy()
+        if isinstance(schools, (str, int, np.integer)):
+            schools = [schools]
+        codes = [np.array([school]) if isinstance(school, (int, np.integer)) else self.index.find(school)
+                 for school in schools]
+        return np.unique(np.concatenate(codes)) if codes else np.array([], dtype=np.int64)
+
+    def frame(self, kind='cumulative', measure='students', schools=None):
+        '''DataFrame of the chosen series, one column per school (named by index.schools).'''
+        codes = self.columns(schools)
+        names = self.index.schools['name'].to_numpy()[codes]
+        return pd.DataFrame(self.matrix(kind, measure)[:, codes], index=self.dates, columns=names)
+
+    def regions(self, groups, kind='cumulative', measure='students'):
+        '''
+        Sums of the chosen series over groups of schools, e.g.
+            regions({'North': ['Dunedin High', 'Palm Harbor'], 'South': [...]})
+        Returns a DataFrame with one column per group.
+        '''
+        matrix = self.matrix(kind, measure)
+        totals = {name: matrix[:, self.columns(schools)].sum(axis=1) for name, schools in groups.items()}
+        return pd.DataFrame(totals, index=self.dates)
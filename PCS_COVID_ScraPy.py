@@ -1,99 +1,522 @@
-#Import packages
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait as WDW
-from selenium.webdriver.support import expected_conditions as EC
+#Import packages. selenium and bs4 are imported inside the functions that drive the browser,
+#so that importing this module (e.g. for parse_table or collect_pages) stays cheap.
 import time
+import re
+import atexit
+import glob
+import json
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from urllib.parse import urlparse
+import numpy as np
 import pandas as pd
-import lxml
+import lxml.html
 
-print('^^^^^^^^^^^^PCS_COVID_ScraPy is now loaded! Happy data analysis!^^^^^^^^^^^^^')
+import PCS_COVID_Ingest as Ingest
+import PCS_COVID_Telemetry as Telemetry
 
 ID = 'ui-paging-container'
+PAGE_LABEL = re.compile(r'(?:Go|Skip) to Page (\d+)')
+TABLE_CLASS = 'sw-flex-table'
+TABLE_START = re.compile(r'<table\b[^>]*\b' + TABLE_CLASS + r'\b[^>]*>', re.IGNORECASE)
+COLUMNS = Ingest.COLUMNS
+#Submit buttons of the current school year's table and of the 2020-2021 table
+SUBMIT_MAIN = 'minibaseSubmit65979'
+SUBMIT_OLDDATA = 'minibaseSubmit62143'
 DEBUG = False
 headless = True
+#Seconds between checks while waiting on the page
+POLL = 0.1
+#Seconds after which an unfinished checkpoint is too old to resume (it is also dropped the next day)
+CHECKPOINT_MAX_AGE = 6 * 3600
+#Stage timings and counters of every scrape; replace with a Telemetry that has output files
+#to export them (see PCS_COVID_Telemetry)
+TELEMETRY = Telemetry.Telemetry()
+#PCS_COVID_Archive.HtmlArchive keeping the html of every scraped page; None keeps nothing
+ARCHIVE = None
 
 def debug(*args):
     if DEBUG == True:
         print(args)
 
-def get_table(driver):
-    #Access table on each page
-    time.sleep(1)
-    soup = BeautifulSoup(driver.page_source, 'lxml')
-    table = soup.find_all('table')
+class TableError(ValueError):
+    '''Raised when html does not hold the dashboard's data table.'''
+
+
+class Pacer:
+    '''
+    Keeps a running estimate of how long the dashboard takes to re-render the table after a
+    click, and sizes wait timeouts from it. Fast connections then fail fast on a click that did
+    nothing, and slow ones get longer timeouts instead of StaleElement errors.
+        Inputs:
+            latency - (float) starting estimate in seconds, e.g. the old `delay` argument.
+            factor - (float) timeout as a multiple of the estimate.
+            minimum, maximum - (float) bounds on the timeout in seconds.
+            smoothing - (float) weight of the newest observation in the running estimate.
+    '''
+
+    def __init__(self, latency=2.0, factor=4.0, minimum=2.0, maximum=60.0, smoothing=0.3):
+        self.latency = latency
+        self.factor = factor
+        self.minimum = minimum
+        self.maximum = maximum
+        self.smoothing = smoothing
+
+    def timeout(self):
+        return min(max(self.factor * self.latency, self.minimum), self.maximum)
+
+    def record(self, seconds):
+        self.latency = (1 - self.smoothing) * self.latency + self.smoothing * seconds
+        debug('Page latency %.2f s, timeout now %.1f s' % (seconds, self.timeout()))
+
+
+def wait_for_element(driver, by, value, timeout):
+    '''
+    Waits up to `timeout` seconds (usually a Pacer's timeout()) for an element to be in the page
+    and returns it. The scraper sets no implicit wait, so this is the only waiting a lookup does.
+    '''
+    from selenium.webdriver.support.ui import WebDriverWait as WDW
+    from selenium.webdriver.support import expected_conditions as EC
+    return WDW(driver, timeout, poll_frequency=POLL).until(EC.presence_of_element_located((by, value)))
+
+
+def wait_for_table(driver, timeout):
+    '''Waits until the sw-flex-table element is in the page and returns it.'''
+    from selenium.webdriver.common.by import By
+    return wait_for_element(driver, By.CLASS_NAME, TABLE_CLASS, timeout)
+
+
+def table_replaced(old_table, old_html):
+    '''
+    Wait condition that is met once the table shown before a click has gone stale (the page
+    swapped in a new one) or its html has changed in place. Returns the current table element.
+    '''
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
+
+    def condition(driver):
+        try:
+            if old_table.get_attribute('outerHTML') == old_html:
+                return False
+        except StaleElementReferenceException:
+            pass
+        try:
+            return driver.find_element(By.CLASS_NAME, TABLE_CLASS)
+        except NoSuchElementException:
+            return False
+    return condition
+
+
+def click_and_wait(driver, element, pacer, page=None):
+    '''
+    Clicks a pager link and returns as soon as the results table has been re-rendered, with a
+    timeout set by `pacer`. The time it took is fed back into the pacer and recorded as the
+    page_load stage of `page`.
+    '''
+    from selenium.webdriver.support.ui import WebDriverWait as WDW
+    from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+    old_table = wait_for_table(driver, pacer.timeout())
+    old_html = old_table.get_attribute('outerHTML')
+    start = time.perf_counter()
+    with TELEMETRY.stage('page_load', page):
+        driver.execute_script("arguments[0].click();", element)
+        try:
+            WDW(driver, pacer.timeout(), poll_frequency=POLL, ignored_exceptions=[StaleElementReferenceException]).until(
+                table_replaced(old_table, old_html))
+        except TimeoutException:
+            #Count a timeout as a slow page so the next wait is longer
+            pacer.record(pacer.timeout())
+            raise
+    pacer.record(time.perf_counter() - start)
+
+
+def get_table(driver, pacer, page=None, run=None):
+    from selenium.common.exceptions import StaleElementReferenceException
+    #Access table on each page as soon as it is there; retry if it is swapped out while being read
+    for attempt in range(3):
+        try:
+            with TELEMETRY.stage('table_wait', page):
+                element = wait_for_table(driver, pacer.timeout())
+            #Only serialize the table element, not the whole page
+            with TELEMETRY.stage('table_serialize', page) as event:
+                table_source = element.get_attribute('outerHTML')
+                event['bytes'] = len(table_source)
+            archive_page(run, page, table_source)
+            return timed_parse(table_source, page)
+        except StaleElementReferenceException:
+            if attempt == 2:
+                raise
+
+def archive_run(url, submit_id=None):
+    '''Starts a run in ARCHIVE for a scrape of `url`; returns its id, or None when not archiving.'''
+    return ARCHIVE.start_run(url, submit_id) if ARCHIVE is not None else None
+
+def archive_page(run, page, html, source='table'):
+    '''Keeps the html of `page` in ARCHIVE under `run` (see PCS_COVID_Archive).'''
+    if ARCHIVE is not None and run is not None:
+        with TELEMETRY.stage('archive', page):
+            ARCHIVE.add(run, page, html, source)
+
+def archive_resumed(run, source_run, pages):
+    '''Adds `pages` of the earlier run `source_run` to `run` in ARCHIVE (pages resumed from a checkpoint).'''
+    if ARCHIVE is not None and run is not None and source_run is not None:
+        ARCHIVE.copy_pages(source_run, run, pages)
+
+def timed_parse(page_source, page=None, parse=None):
+    '''Runs `parse` (default extract_table) on page html as the table_parse stage of `page`.'''
+    with TELEMETRY.stage('table_parse', page) as event:
+        event['bytes'] = len(page_source)
+        temp_df = (parse or extract_table)(page_source)
+        event['rows'] = len(temp_df)
+    return temp_df
+
+def parse_table(page_source):
+    '''
+    Reads the data table out of the html of a dashboard page. Shared by the Selenium routine
+    and the HTTP engine in PCS_COVID_HTTP (which passes the response text). See extract_table.
+    '''
+    return extract_table(page_source)
+
+def parse_table_soup(page_source):
+    '''
+    The original table reader: builds a BeautifulSoup tree of the whole page and hands every
+    <table> to pd.read_html. Picks up the filter form's layout table when the page is not
+    fully loaded (the 0, 1, 2 columns and jQuery text in data_dump_20210816). Kept for
+    comparison in benchmarks/bench_table_extract.py.
+    '''
+    from bs4 import BeautifulSoup
+    with TELEMETRY.stage('soup_parse') as event:
+        event['bytes'] = len(page_source)
+        soup = BeautifulSoup(page_source, 'lxml')
+        table = soup.find_all('table')
 
     #read the table
-    new_df = pd.read_html(str(table))
-    
+    with TELEMETRY.stage('read_html') as event:
+        new_df = pd.read_html(StringIO(str(table)))
+        event['rows'] = len(new_df[0])
+
     return new_df[0]
 
-def get_page_indices(driver):
-    paging_buttons = driver.find_element(By.ID, ID).text
+def table_html(page_source):
+    '''Cuts the sw-flex-table element out of a page so that only it has to be parsed.'''
+    match = TABLE_START.search(page_source)
+    if match is None:
+        raise TableError('No ' + TABLE_CLASS + ' table in the page.')
+    end = page_source.find('</table>', match.end())
+    if end < 0:
+        raise TableError('The ' + TABLE_CLASS + ' table is not closed; the page is incomplete.')
+    return page_source[match.start():end + len('</table>')]
+
+def extract_table(page_source):
+    '''
+    Reads the rows of the sw-flex-table element with lxml and returns them as a DataFrame with
+    the four dashboard columns: Date as datetimes, the location as text, and the two counts as
+    integers. Only the table element is parsed, and anything that is not the data table (no
+    sw-flex-table, or a header other than COLUMNS) raises TableError instead of turning up as
+    extra columns.
+    '''
+    table = lxml.html.fragment_fromstring(table_html(page_source))
+    header = [th.text_content().strip() for th in table.xpath('.//tr/th')]
+    if header[:len(COLUMNS)] != COLUMNS:
+        raise TableError('Unexpected table header: ' + str(header))
+
+    width = len(header)
+    cells = [[td.text_content().strip() for td in tr.xpath('./td')] for tr in table.xpath('.//tr[td]')]
+    cells = [row[:len(COLUMNS)] for row in cells if len(row) == width]
+    columns = list(zip(*cells)) if cells else [()] * len(COLUMNS)
+
+    dates = np.array(columns[0], dtype=object)
+    fmt = Ingest.date_format(dates[0]) if len(dates) else None
+    data = {
+        'Date': pd.to_datetime(dates, format=fmt, errors='coerce') if fmt else parse_dates(dates),
+        'Locations affected': np.array(columns[1], dtype=object),
+    }
+    for name, values in zip(COLUMNS[2:], columns[2:]):
+        counts = pd.to_numeric(np.array(values, dtype=object), errors='coerce')
+        data[name] = counts.astype('int64') if not np.isnan(counts).any() else counts
+    return pd.DataFrame(data, columns=COLUMNS)
+
+def get_page_links(driver):
+    '''
+    Returns {page number: element} for every link in the pager, read from the aria-labels
+    ('Go to Page N', and 'Skip to Page N' for the ellipses) rather than from their position.
+    '''
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import StaleElementReferenceException
+    for attempt in range(3):
+        try:
+            links = {}
+            for a in driver.find_elements(By.XPATH, '//*[@id="' + ID + '"]//a[@aria-label]'):
+                match = PAGE_LABEL.search(a.get_attribute('aria-label') or '')
+                if match is not None:
+                    links[int(match.group(1))] = a
+            return links
+        except StaleElementReferenceException:
+            #The pager was re-rendered while being read
+            if attempt == 2:
+                raise
+
+def go_to_page(driver, page, current, pacer):
+    '''
+    Clicks through the pager from page `current` to page `page`. When the page is not in the
+    visible window, jumps with the link nearest to it (usually an ellipsis) and looks again.
+    '''
+    from selenium.webdriver.common.by import By
+    while current != page:
+        #The pager may still be rendering after a submit; wait for it before reading its links
+        wait_for_element(driver, By.ID, ID, pacer.timeout())
+        links = get_page_links(driver)
+        if not links:
+            raise RuntimeError('No pager links found while looking for page ' + str(page) + '.')
+        if page in links:
+            target = page
+        elif page > current:
+            target = max(links)
+        else:
+            target = min(links)
+        debug('On page ' + str(current) + ', clicking page ' + str(target) + ' on the way to ' + str(page))
+        click_and_wait(driver, links[target], pacer, target)
+        current = target
+    return current
+
+def get_page_indices(driver, timeout=0):
+    from selenium.webdriver.common.by import By
+    with TELEMETRY.stage('get_page_indices'):
+        paging_buttons = wait_for_element(driver, By.ID, ID, timeout).text
     page_text_indices = [page for page in paging_buttons.split('\n')]
     page_numbers = [int(page) for page in page_text_indices if (page != '...')]
 
     return paging_buttons, page_text_indices, page_numbers
 
 
-def initiate_scraping(url, driver_path):
+def start_driver(driver_path):
+    '''Starts a Chrome session for the scraper (headless unless `headless` is switched off).'''
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
     #Set up selenium web interaction -
     options = webdriver.ChromeOptions()
     options.add_argument('--ignore-certificate-errors')
     options.add_argument('--incognito')
     if headless == True:
         options.add_argument('--headless')         #Operates webpage without viewing through Chrome
-    driver = webdriver.Chrome(driver_path, options=options)
-    
+    with TELEMETRY.stage('browser_start'):
+        return webdriver.Chrome(service=Service(driver_path), options=options)
 
-    #Open webpage with webdriver, un-comment --headless argument above if you don't want to 
-    #view the page. 
-    driver.get(url)
 
-    # Wait for pages to fully load for specified amount of time before throwing error.
-    driver.implicitly_wait(10)
+def open_search(driver, url, submit_id=SUBMIT_MAIN, pacer=None):
+    '''
+    Loads the search page in `driver` and clicks `submit_id`, leaving page 1 of the results shown.
+    The submit button is waited for with the timeout of `pacer` (a new Pacer if None).
+    '''
+    from selenium.webdriver.common.by import By
+    pacer = pacer if pacer is not None else Pacer()
+    #Open webpage with webdriver, set headless = False above if you want to view the page.
+    with TELEMETRY.stage('search_load'):
+        driver.get(url)
+        # Wait for the submit button rather than setting an implicit wait, which would make every
+        # lookup that is expected to miss block for its full length
+        wait_for_element(driver, By.ID, submit_id, pacer.timeout())
 
     #Now that the web page is open and operable, we need to click on the submit
     #button. Clicking on the search button allows us to get all of the data in a table. 
-    click_submit_main(driver)
-
+    with TELEMETRY.stage('submit', 1):
+        click_submit(driver, submit_id)
     return driver
 
+
+def initiate_scraping(url, driver_path, submit_id=SUBMIT_MAIN, pacer=None):
+    return open_search(start_driver(driver_path), url, submit_id, pacer)
+
+def click_submit(driver, submit_id):
+    from selenium.webdriver.common.by import By
+    driver.find_element(By.XPATH, '//*[@id="' + submit_id + '"]').click()
+
 def click_submit_main(driver):
-    driver.find_element_by_xpath('//*[@id="minibaseSubmit65979"]').click()
+    click_submit(driver, SUBMIT_MAIN)
 
 def click_submit_olddata(driver):
-    driver.find_element_by_xpath('//*[@id="minibaseSubmit62143"]').click()
+    click_submit(driver, SUBMIT_OLDDATA)
+
+
+class DriverPool:
+    '''
+    Keeps browser sessions alive between scrape jobs, so that scraping the current table, the
+    2020-2021 table, or the same table again later does not start a new Chrome every time.
+    A browser handed back is reset (cookies cleared, blank page) and kept for the next job; one
+    that fails the health check on its way out again, or has served max_uses jobs, is quit and
+    replaced. close() quits every browser the pool started, including ones still handed out; it
+    runs at the end of a with block and, failing that, when Python exits.
+        Inputs:
+            driver_path - (string) the file path to your webdriver.
+            size - (int) most browsers open at once; acquire() waits until one is free.
+            max_uses - (int) jobs a browser serves before it is replaced by a fresh one.
+    '''
+
+    def __init__(self, driver_path, size=2, max_uses=20):
+        self.driver_path = driver_path
+        self.size = size
+        self.max_uses = max_uses
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+        #Every open browser and the number of jobs it has served
+        self.uses = {}
+        self.closed = False
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def acquire(self):
+        '''Returns a working browser: an idle one that passes healthy(), or a new one.'''
+        if self.closed:
+            raise RuntimeError('The driver pool is closed.')
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    driver = self.idle.pop() if self.idle else None
+                if driver is None:
+                    driver = start_driver(self.driver_path)
+                    break
+                if self.healthy(driver):
+                    TELEMETRY.count('browser_reused')
+                    break
+                self.discard(driver)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.uses[driver] = self.uses.get(driver, 0) + 1
+        return driver
+
+    def release(self, driver, broken=False):
+        '''Hands a browser back; it is kept for reuse unless broken, worn out or not resettable.'''
+        try:
+            if broken or self.closed or self.uses.get(driver, 0) >= self.max_uses or not self.reset(driver):
+                self.discard(driver)
+            else:
+                with self.lock:
+                    self.idle.append(driver)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def session(self, url, submit_id=SUBMIT_MAIN):
+        '''A pooled browser showing page 1 of the results of `submit_id`, handed back afterwards.'''
+        driver = open_driver(url, self.driver_path, submit_id, self)
+        broken = True
+        try:
+            yield driver
+            broken = False
+        finally:
+            self.release(driver, broken)
+
+    @staticmethod
+    def healthy(driver):
+        '''True if the browser still answers. A dead chromedriver shows up as a connection error.'''
+        try:
+            return driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def reset(driver):
+        '''Clears what the last job left behind. Returns False if the browser did not respond.'''
+        try:
+            with TELEMETRY.stage('browser_reset'):
+                driver.delete_all_cookies()
+                driver.get('about:blank')
+            return True
+        except Exception:
+            return False
+
+    def discard(self, driver):
+        with self.lock:
+            self.uses.pop(driver, None)
+        try:
+            with TELEMETRY.stage('browser_quit'):
+                driver.quit()
+        except Exception:
+            pass
 
+    def close(self):
+        '''Quits every browser the pool has open. The pool cannot be used afterwards.'''
+        with self.lock:
+            self.closed = True
+            drivers = list(self.uses)
+            self.idle = []
+        for driver in drivers:
+            self.discard(driver)
+        atexit.unregister(self.close)
 
-def determine_total_pages(url, driver_path):
+
+def open_driver(url, driver_path, submit_id=SUBMIT_MAIN, pool=None, pacer=None):
+    '''initiate_scraping, with the browser taken from `pool` (a DriverPool) when one is given.'''
+    if pool is None:
+        return initiate_scraping(url, driver_path, submit_id, pacer)
+    driver = pool.acquire()
+    try:
+        return open_search(driver, url, submit_id, pacer)
+    except BaseException:
+        pool.release(driver, broken=True)
+        raise
+
+
+def close_driver(driver, pool=None, broken=False):
+    '''Quits a browser from open_driver, or hands it back to its pool.'''
+    from selenium.common.exceptions import WebDriverException
+    if pool is not None:
+        pool.release(driver, broken)
+        return
+    try:
+        with TELEMETRY.stage('browser_quit'):
+            driver.quit()
+    except WebDriverException:
+        pass
+
+
+def get_pager_state(driver, timeout=0):
+    '''
+    Reads where the pager is, waiting up to `timeout` seconds for it. Returns (page_numbers,
+    trailing_ellipsis, links):
+        page_numbers - the page numbers shown in the current window.
+        trailing_ellipsis - True when the window ends with '...', i.e. there are more pages.
+        links - {page number: element} from get_page_links.
+    '''
+    _, page_text_indices, page_numbers = get_page_indices(driver, timeout)
+    trailing_ellipsis = len(page_text_indices) > 0 and page_text_indices[-1] == '...'
+    return page_numbers, trailing_ellipsis, get_page_links(driver)
+
+
+def determine_total_pages(url, driver_path, submit_id=SUBMIT_MAIN, pool=None):
     '''
     This function clicks the submit button, clicks on the ellipsis until the ellipsis is not the last
     in the list of page indices, and returns the total number of pages to be scraped of data tables.
+    Scrape_data no longer needs it (it finds the last page while scraping); it is kept for
+    Scrape_data_parallel, which has to know the page count before splitting the pages up.
     '''
 
-    driver = initiate_scraping(url, driver_path)
+    from selenium.webdriver.common.by import By
+    pacer = Pacer()
+    driver = open_driver(url, driver_path, submit_id, pool, pacer)
+    wait_for_table(driver, pacer.timeout())
 
     for x in range(10000):
-        time.sleep(1.2)
-        _, page_text_indices, page_numbers = get_page_indices(driver)
-        print('Iteration ', str(x), '.')
-        indices_numbers = list(zip(page_text_indices, page_numbers))
-        print('Last index/number - ' + str(len(indices_numbers)) +'**** ' + str(indices_numbers))
-    
+        _, page_text_indices, page_numbers = get_page_indices(driver, pacer.timeout())
+        debug('Iteration ', str(x), ', pages shown: ', page_text_indices)
+
         if page_text_indices[-1] == '...':
             print('Page ' + str(max(page_numbers)) + ' is not the last. Clicking ellipsis to go to next.')
-            #Create xpath for ellipsis button:
-            if page_text_indices[0] == '...':
-                next_page_xpath = '//*[@id="ui-paging-container"]/ul/li[' + str(len(page_text_indices)+2) +']/a'
-                debug(next_page_xpath)
-            else: 
-                next_page_xpath = '//*[@id="ui-paging-container"]/ul/li[' + str(len(page_text_indices)) +']/a'
-                debug(next_page_xpath)
-            button = driver.find_element_by_xpath(next_page_xpath)
-            time.sleep(1.2)
-            driver.execute_script("arguments[0].click();", button)
+            #The trailing ellipsis is the link to the highest page number
+            links = get_page_links(driver)
+            click_and_wait(driver, links[max(links)], pacer)
         else:
             print('Iteration ', x, 'No ellipsis (...) at the end of this page. Maximum obtained at page ', str(max(page_numbers)), '.')
             total_pages = max(page_numbers)
@@ -102,114 +525,560 @@ def determine_total_pages(url, driver_path):
     #Once determined, return the webpage to the original form with the submit button to execute
     #filterless search and scrape data:
     new_search_xpath = '//*[@id="module-content-64809"]/div/div[2]/ul/li/div/div[1]/span/span/p[1]/a'
-    new_search_button = driver.find_element_by_xpath(new_search_xpath)
+    new_search_button = wait_for_element(driver, By.XPATH, new_search_xpath, pacer.timeout())
     driver.execute_script("arguments[0].click();", new_search_button)
 
-    
     return total_pages, page_text_indices, driver
 
 
-def Scrape_data(url, driver_path, delay):
+class Checkpoint:
+    '''
+    Folder holding the pages of an unfinished scrape, so that a run that dies part way can pick
+    up at the first missing page instead of page 1. Each finished page is written to
+    page_NNNN.csv; state.json records the url, the archive run of the last attempt (see
+    PCS_COVID_Archive), and for every saved page its row count and the pager window it was
+    scraped from. Only the page number is needed to get back to a page: go_to_page jumps there
+    with the ellipsis links.
+    The table is newest first and grows every day, so saved pages only line up with the live
+    ones for a while. A checkpoint from a finished run, from a different url, from an earlier
+    day or older than max_age seconds is cleared when a new run starts, and iter_pages checks
+    the last saved page against the site before it trusts the others (see matches).
+    '''
+
+    def __init__(self, directory, url, max_age=CHECKPOINT_MAX_AGE):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.state_path = os.path.join(directory, 'state.json')
+        self.state = self.new_state(url)
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                saved = json.load(f)
+            if saved.get('url') == url and not saved.get('finished') and self.fresh(saved, max_age):
+                self.state = saved
+            else:
+                self.clear()
+
+    @staticmethod
+    def new_state(url):
+        return {'url': url, 'started': time.time(), 'finished': False, 'pages': {}}
+
+    @staticmethod
+    def fresh(state, max_age):
+        '''True if the run in `state` started today and less than max_age seconds ago.'''
+        started = state.get('started')
+        if not isinstance(started, (int, float)):
+            return False
+        same_day = time.strftime('%Y-%m-%d', time.localtime(started)) == time.strftime('%Y-%m-%d')
+        return same_day and 0 <= time.time() - started <= max_age
+
+    def page_path(self, page):
+        return os.path.join(self.directory, 'page_%04d.csv' % page)
+
+    def completed(self):
+        '''Page numbers saved so far, in order.'''
+        return sorted(int(page) for page in self.state['pages'])
+
+    def first_missing(self):
+        page = 1
+        while str(page) in self.state['pages']:
+            page += 1
+        return page
+
+    def write_state(self):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    def save(self, page, temp_df, window):
+        #Write to a temporary file first so a crash never leaves half a page behind
+        temp_path = self.page_path(page) + '.tmp'
+        temp_df.to_csv(temp_path, index=False)
+        os.replace(temp_path, self.page_path(page))
+        self.state['pages'][str(page)] = {
+            'rows': len(temp_df), 'window': window, 'saved': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.write_state()
+
+    def load(self, page):
+        temp_df = pd.read_csv(self.page_path(page))
+        temp_df['Date'] = parse_dates(temp_df['Date'])
+        return temp_df
+
+    def matches(self, page, temp_df):
+        '''True if `temp_df`, freshly scraped, holds the same rows as the saved copy of `page`.'''
+        saved = self.load(page)
+        if saved.shape != temp_df.shape:
+            return False
+        #Compare as text: the csv round trip may change the dtypes but not the values
+        return bool((saved.astype(str).to_numpy() == temp_df[list(saved.columns)].astype(str).to_numpy()).all())
+
+    def finish(self):
+        self.state['finished'] = True
+        self.write_state()
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, 'page_*.csv')):
+            os.remove(path)
+        self.state = self.new_state(self.state['url'])
+        self.write_state()
+
+
+def scrape_page(session, page, pacer):
+    '''
+    Brings the browser in `session` to `page`, scrapes it, and reads the pager.
+    session is a dict holding the driver and the page it shows; a missing driver is opened
+    with open_driver first (from session['pool'], if there is one). Returns (DataFrame, pager
+    window, whether a next page exists).
+    '''
+    if session.get('driver') is None:
+        session['driver'] = open_driver(session['url'], session['driver_path'],
+                                        session.get('submit_id', SUBMIT_MAIN), session.get('pool'), pacer)
+        session['current'] = 1
+    driver = session['driver']
+    session['current'] = go_to_page(driver, page, session['current'], pacer)
+    temp_df = get_table(driver, pacer, page=page, run=session.get('run'))
+    page_numbers, trailing_ellipsis, links = get_pager_state(driver, pacer.timeout())
+    if page + 1 not in links and trailing_ellipsis:
+        raise RuntimeError('Pager shows more pages but no link to page ' + str(page + 1) + '.')
+    return temp_df, page_numbers, page + 1 in links
+
+
+def scrape_page_with_retries(session, page, pacer, retries, backoff):
+    '''
+    scrape_page, retried up to `retries` times. After a failure the browser is closed and a
+    fresh one is started after waiting backoff, 2*backoff, 4*backoff... seconds; it then jumps
+    straight back to `page` rather than starting over.
+    '''
+    from selenium.common.exceptions import WebDriverException
+    for attempt in range(retries + 1):
+        try:
+            return scrape_page(session, page, pacer)
+        except (WebDriverException, TableError, RuntimeError) as err:
+            if attempt == retries:
+                raise
+            wait = backoff * 2 ** attempt
+            print('Page ' + str(page) + ' failed (' + type(err).__name__ + '). Retrying in ' + str(wait) + ' s...')
+            TELEMETRY.count('retries')
+            close_session(session, broken=True)
+            with TELEMETRY.stage('backoff_sleep', page):
+                time.sleep(wait)
+
+
+def close_session(session, broken=False):
+    if session.get('driver') is not None:
+        close_driver(session['driver'], session.get('pool'), broken)
+        session['driver'] = None
+
+
+def iter_pages(url, driver_path, delay, stop_before=None, checkpoint_dir=None, retries=3, backoff=2.0,
+               submit_id=SUBMIT_MAIN, pool=None):
+    '''
+    Generator behind Scrape_data: yields (page number, DataFrame) for each page as soon as it
+    has been parsed. Pages are scraped in a single pass: after each page the pager is read, the
+    link to the next page (a number, or the trailing ellipsis) is clicked, and the walk ends on
+    the page with no trailing ellipsis and no higher page number. The browser is closed when
+    the generator finishes or is closed. Feed it to collect_pages or write_pages_csv, or loop
+    over it directly.
+    With checkpoint_dir, every page is saved as it is scraped (see Checkpoint). A run started
+    after a crash (the same day) first scrapes the last saved page again; if it still holds
+    the saved rows, the saved pages are yielded and the run resumes at the first missing page,
+    otherwise the table has moved on and the checkpoint is dropped for a scrape from page 1.
+    Each page gets `retries` further attempts, `backoff` seconds apart and doubling, before
+    giving up.
+    submit_id picks the table (SUBMIT_MAIN or SUBMIT_OLDDATA). With a DriverPool as `pool`, the
+    browser comes from the pool and goes back to it at the end instead of being quit.
+    '''
+    #Tables other than the main one get their own checkpoint key
+    key = url if submit_id == SUBMIT_MAIN else url + '#' + submit_id
+    checkpoint = Checkpoint(checkpoint_dir, key) if checkpoint_dir else None
+    session = {'url': url, 'driver_path': driver_path, 'driver': None, 'submit_id': submit_id, 'pool': pool,
+               'run': archive_run(url, submit_id)}
+    pacer = Pacer(delay)
+    page = 1
+    try:
+        if checkpoint is not None and checkpoint.first_missing() > 1:
+            #Only resume if the last saved page still lines up with the live table
+            last = checkpoint.first_missing() - 1
+            temp_df, window, has_next = scrape_page_with_retries(session, last, pacer, retries, backoff)
+            if checkpoint.matches(last, temp_df):
+                print('Resuming from checkpoint at page ' + str(last + 1) + '.')
+                #The saved pages were archived by the run that scraped them; list them under this one
+                archive_resumed(session['run'], checkpoint.state.get('run'), range(1, last))
+                for page in range(1, last + 1):
+                    temp_df = checkpoint.load(page)
+                    yield page, temp_df
+                    if reached_watermark(temp_df, stop_before):
+                        return
+                if not has_next:
+                    checkpoint.finish()
+                    return
+                page = last + 1
+            else:
+                print('Page ' + str(last) + ' has changed since the checkpoint was saved. Starting over.')
+                checkpoint.clear()
+        if checkpoint is not None:
+            checkpoint.state['run'] = session['run']
+
+        while True:
+            #The page stage covers every attempt at the page, its retries and backoff included
+            with TELEMETRY.stage('page', page) as event:
+                temp_df, window, has_next = scrape_page_with_retries(session, page, pacer, retries, backoff)
+                event['rows'] = len(temp_df)
+            debug('Data scraped from page ' + str(page) + ' table ...')
+            if checkpoint is not None:
+                with TELEMETRY.stage('checkpoint_save', page):
+                    checkpoint.save(page, temp_df, window)
+            TELEMETRY.count('pages')
+            yield page, temp_df
+            if reached_watermark(temp_df, stop_before):
+                print('Page ' + str(page) + ' reaches back past ' + str(stop_before.date()) + '. Stopping.')
+                break
+            if not has_next:
+                print('No ellipsis (...) at the end of the pager. Last page is ' + str(page) + '.')
+                break
+            page += 1
+            print('Scraping page ' + str(page) + ' (pager shows up to ' + str(max(window)) + ').')
+        if checkpoint is not None:
+            checkpoint.finish()
+    finally:
+        close_session(session)
+        TELEMETRY.flush()
+
+
+def collect_pages(pages, keep_pages=None):
+    '''
+    Gathers (page, DataFrame) pairs from iter_pages into one DataFrame with a single concat at
+    the end. The {'Page N': DataFrame} dictionary is only filled when keep_pages is True
+    (by default, when DEBUG is on), for troubleshooting individual pages.
+    Returns (data_dict, data_df).
+    '''
+    if keep_pages is None:
+        keep_pages = DEBUG
+    frames = []
+    data_dict = {}
+    for page, temp_df in pages:
+        frames.append(temp_df)
+        if keep_pages:
+            data_dict['Page ' + str(page)] = temp_df
+    data_df = pd.concat(frames) if frames else pd.DataFrame([])
+    return data_dict, data_df
+
+
+def write_pages_csv(pages, filename):
+    '''
+    Streams (page, DataFrame) pairs from iter_pages straight into a csv file, one page at a
+    time, so the scrape never has to be held in memory. The file has the same layout as the
+    data dumps saved from a DataFrame (an index column, then the table's columns).
+    Returns the number of rows written.
+    '''
+    rows = 0
+    with open(filename, 'w', newline='') as f:
+        for page, temp_df in pages:
+            temp_df = temp_df.set_axis(range(rows, rows + len(temp_df)))
+            temp_df.to_csv(f, header=(rows == 0))
+            rows += len(temp_df)
+    return rows
+
+
+def Scrape_data(url, driver_path, delay, stop_before=None, keep_pages=None, checkpoint_dir=None,
+                submit_id=SUBMIT_MAIN, pool=None):
     '''
     Wrapper function employing the functions above to perform the iterative scraping routine.
     This routine can target either the current PCS data or the historic data (2020-2021 school
-    year). 
+    year). It collects the pages from iter_pages into one DataFrame.
         Inputs:
             url - (string) web address where the data portal can be accessed.
             driver_path - (string) the file path to your webdriver. See the readme.md for 
                 instructions on installing and testing a webdriver. 
-            delay - (float) number of seconds to delay before operating clicks or selections
-                through the webdriver. This is an important parameter to use if this routine
-                hangs up repeatedly on your computer, especially when going through large data
-                sets with many pages. Increasing the delay will increase the total amount of 
-                time it takes for this routine to operate, however it is useful to avoid
-                hang-ups associated with the web driver trying to access java script controls
-                which have not yet loaded. 
+            delay - (float) your estimate, in seconds, of how long a page takes to load. There
+                are no fixed pauses any more: after each click the routine waits for the table
+                to re-render, with a timeout that starts at a few times `delay` and then adapts
+                to the load times it sees (see Pacer). Raise it if the first pages time out on
+                a slow connection. 
+            stop_before - (datetime, optional) stop paging after the first page holding a row
+                dated before this. The table is sorted newest first, so later pages hold only
+                older rows. Used by Scrape_data_incremental.
+            keep_pages - (bool) also return each page's DataFrame in data_dict. Defaults to
+                DEBUG; otherwise data_dict is empty.
+            checkpoint_dir - (string, optional) folder to save each page in as it is scraped.
+                If the run dies, calling Scrape_data again with the same folder resumes at the
+                first page that is missing. Pages are also retried with backoff before the
+                run gives up (see iter_pages).
+            submit_id - (string) SUBMIT_MAIN for the current school year, or SUBMIT_OLDDATA
+                for the 2020-2021 table.
+            pool - (DriverPool, optional) take the browser from this pool and hand it back
+                afterwards, instead of starting and quitting one for this call.
     '''
+    pages = iter_pages(url, driver_path, delay, stop_before, checkpoint_dir=checkpoint_dir,
+                       submit_id=submit_id, pool=pool)
+    return collect_pages(pages, keep_pages)
 
 
-    #Determine the number of pages:
-    tot, indices, driver = determine_total_pages(url, driver_path)
-    print('Imitated filterless search to determine total pages: complete...\n')
+def Scrape_datasets(jobs, driver_path, delay, pool=None, concurrent=False):
+    '''
+    Scrapes several dashboard tables with the browsers of one DriverPool, e.g.
+        Scrape_datasets({'2021-2022': (URL, SUBMIT_MAIN), '2020-2021': (URL_2020_2021, SUBMIT_OLDDATA)},
+                        driver_path, 2)
+        Inputs:
+            jobs - {name: (url, submit_id)} for each table.
+            driver_path, delay - as for Scrape_data.
+            pool - (DriverPool, optional) pool to use and leave open. By default a pool is made
+                for this call and closed at the end.
+            concurrent - (bool) scrape the tables at the same time, one browser each, instead
+                of one after the other in the same browser.
+        Returns:
+            {name: data_df}
+    '''
+    own_pool = pool is None
+    if own_pool:
+        pool = DriverPool(driver_path, size=len(jobs) if concurrent else 1)
 
-    #Initiate the page log:
-    data_df = pd.DataFrame([])
-    print('Empty DataFrame created. \n')
+    def run(name):
+        url, submit_id = jobs[name]
+        _, data_df = Scrape_data(url, driver_path, delay, submit_id=submit_id, pool=pool)
+        return name, data_df
 
-    #Initiate filterless search
-    click_submit_main(driver)
-    print('Restarting filterless search to scrape data...')
+    try:
+        if concurrent:
+            with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+                return dict(executor.map(run, jobs))
+        return dict(run(name) for name in jobs)
+    finally:
+        if own_pool:
+            pool.close()
 
-    #Set up dictionary container for data troubleshooting:
-    data_dict = {}
-    print('Empty dictionary ready for temporary data sets.\n')
-
-    #Scrape page 1 data
-    temp_df = get_table(driver)
-    data_df = pd.concat([data_df, temp_df])
-    key = 'Page ' + str(1)
-    data_dict |= {key:temp_df}
-    print('Data scraped from page 1 table...\n')
-    first_loop = True
-
-    #Loop through remaining pages, beginning with page 2
-    for page in range(2, tot+1):
-        _, _, page_numbers = get_page_indices(driver)
-        print('Scraping page ' + str(page) + ' of ' + str(tot) + ' pages.')
-        if page <= max(page_numbers):
-            if first_loop is True: 
-                debug('Working in the if loop, first group of pages.')
-                #This is the condition for the first time iterating through the table pages
-                next_page_xpath = '//*[@id="ui-paging-container"]/ul/li[' + str(page) + ']/a'
-                debug('Page 1 iteration ' + str(page) + ', xpath = ' + str(next_page_xpath))
-                button = driver.find_element_by_xpath(next_page_xpath)
-                driver.execute_script("arguments[0].click();", button)
-                time.sleep(delay)
-            else:
-                debug('Working in the if loop, subsequent groups of pages.')
-                #This is the condition for the susequent times iterating through the table pages
-                next_page_xpath = '//*[@id="ui-paging-container"]/ul/li[' + str(new_start) + ']/a'
-                new_start = new_start + 1
-                debug('Subsequent page iteration ' + str(page) + ', xpath = ' + str(next_page_xpath))
-                button = driver.find_element_by_xpath(next_page_xpath)
-                driver.execute_script("arguments[0].click();", button)
-                time.sleep(delay)
-            #Scrape data and concatenate
-            temp_df = get_table(driver)
-            debug('Data scraped from page ' + str(page) + r' table ...\n')
-            #debug(temp_df.head())
-            data_df = pd.concat([data_df, temp_df])
-            key = 'Page ' + str(page)
-            data_dict |= {key:temp_df}
-
-        elif page > max(page_numbers):
-            debug('Working from the elif loop (clicking the ellipsis).')
-            #In this case, we click the right ellipsis.
-            if first_loop is True:
-                next_page_xpath = '//*[@id="ui-paging-container"]/ul/li[' + str(page) + ']/a'
-                debug('Page 1 iteration ' + str(page) + ', xpath = ' + str(next_page_xpath))
-                button = driver.find_element_by_xpath(next_page_xpath)
-                driver.execute_script("arguments[0].click();", button)
-                time.sleep(2)
-            else:
-                next_page_xpath = '//*[@id="ui-paging-container"]/ul/li[' + str(13) + ']/a'
-                debug('Page 1 iteration ' + str(page) + ', xpath = ' + str(next_page_xpath))
-                button = driver.find_element_by_xpath(next_page_xpath)
-                driver.execute_script("arguments[0].click();", button)
-                time.sleep(2)
-            #Scrape data and concatenate
-            temp_df = get_table(driver)
-            debug('Data scraped from page ' + str(page) + r' table ...\n, represented by "..."...')
-            #debug(temp_df.head())
-            data_df = pd.concat([data_df, temp_df])
-            key = 'Page ' + str(page)
-            data_dict |= {key:temp_df}
-            #Set first_loop = False
-            first_loop = False
-            debug(page)
-            debug(first_loop)
-            new_start = 4
-            debug('New counter for constructing x_paths: ', new_start)
-    
+
+def parse_dates(dates):
+    '''
+    Converts a column of dashboard dates to datetimes. The site has served both 2021/08/19
+    and 8/19/2021, so the format is inferred; anything unparseable becomes NaT.
+    '''
+    return pd.to_datetime(dates, errors='coerce', yearfirst=True, format='mixed')
+
+
+def reached_watermark(temp_df, stop_before):
+    '''True if a scraped page holds any row dated before stop_before (None never stops).'''
+    if stop_before is None or 'Date' not in temp_df.columns:
+        return False
+    dates = parse_dates(temp_df['Date'])
+    return bool((dates < stop_before).any())
+
+
+def latest_dump(directory='.'):
+    '''Returns the path of the newest data_dump_YYYYMMDD.csv in directory, or None.'''
+    files = sorted(glob.glob(os.path.join(directory, 'data_dump_*.csv')), reverse=True)
+    return files[0] if files else None
+
+
+def read_dump(path):
+    '''Reads a saved data dump through PCS_COVID_Ingest: the four dashboard columns, typed.'''
+    dump_df = Ingest.ingest(path).frame
+    return dump_df.astype({'Locations affected': object})
+
+
+def watermark(dump_df, overlap_days=3):
+    '''
+    Returns the date from which an incremental scrape has to re-read the dashboard: the newest
+    date in dump_df minus overlap_days. The overlap picks up cases the district adds to recent
+    days after the fact.
+    '''
+    return dump_df['Date'].max() - pd.Timedelta(days=overlap_days)
+
+
+def merge_incremental(dump_df, new_df, cutoff):
+    '''
+    Combines a stored dump with freshly scraped rows. Rows from cutoff onwards come from the new
+    scrape only, so re-scraped days replace their stored versions instead of doubling up.
+    Returns the merged table, newest first like the dashboard.
+    '''
+    new_df = new_df.copy()
+    new_df['Date'] = parse_dates(new_df['Date'])
+    new_df = new_df.dropna(subset=['Date'])
+    merged = pd.concat([new_df[new_df['Date'] >= cutoff], dump_df[dump_df['Date'] < cutoff]])
+    return merged.sort_values(by='Date', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def Scrape_data_incremental(url, driver_path, delay, dump_dir='.', overlap_days=3, engine='selenium', http_delay=0):
+    '''
+    Brings the newest data dump up to date instead of re-scraping the whole dashboard.
+    Reads the newest date in the latest data_dump_*.csv in dump_dir, pages through the
+    dashboard only until rows older than that (minus overlap_days) show up, and merges the new
+    rows into the stored ones. A daily refresh then reads one or two pages.
+        Inputs:
+            url, driver_path, delay - as for Scrape_data.
+            dump_dir - (string) folder holding the data_dump_YYYYMMDD.csv files.
+            overlap_days - (int) number of days before the newest stored date to re-read.
+            engine - 'selenium' for Scrape_data or 'http' for PCS_COVID_HTTP.Scrape_data.
+                `delay` is a page load estimate for the browser and only applies to 'selenium'.
+            http_delay - (float) pause between page requests of the 'http' engine; none by
+                default, as with PCS_COVID_HTTP.Scrape_data.
+        Returns:
+            data_dict - {'Page N': DataFrame} for the pages scraped this time, when DEBUG is on.
+            data_df - the full merged table. With no dump to start from, a full scrape.
+    '''
+    path = latest_dump(dump_dir)
+    cutoff = None
+    if path is not None:
+        dump_df = read_dump(path)
+        cutoff = watermark(dump_df, overlap_days)
+        print('Latest dump ' + path + ' runs to ' + str(dump_df['Date'].max().date()) +
+              '. Re-reading the dashboard from ' + str(cutoff.date()) + '.')
+
+    if engine == 'http':
+        import PCS_COVID_HTTP
+        data_dict, new_df = PCS_COVID_HTTP.Scrape_data(url, delay=http_delay, stop_before=cutoff)
+    else:
+        data_dict, new_df = Scrape_data(url, driver_path, delay, stop_before=cutoff)
+
+    if cutoff is None:
+        return data_dict, new_df
+    data_df = merge_incremental(dump_df, new_df, cutoff)
+    print(str(len(new_df)) + ' rows scraped, ' + str(len(data_df) - len(dump_df)) + ' rows added.')
     return data_dict, data_df
 
+
+def Scrape_data_fast(url, driver_path, delay, submit_id=SUBMIT_MAIN):
+    '''
+    Scrapes the dashboard with the HTTP engine in PCS_COVID_HTTP, which replays the form
+    submission and page requests without a browser. If the page does not contain the form or
+    pager the engine expects, a request still fails after its retries, or a page keeps coming
+    back without the data table, falls back to the Selenium routine, Scrape_data. Returns the
+    same (data_dict, data_df) pair as Scrape_data.
+    '''
+    import PCS_COVID_HTTP
+
+    try:
+        return PCS_COVID_HTTP.Scrape_data(url, submit_id=submit_id)
+    except (PCS_COVID_HTTP.MinibaseError, PCS_COVID_HTTP.requests.RequestException, TableError) as err:
+        print('HTTP engine failed (' + str(err) + '). Falling back to Selenium...')
+        return Scrape_data(url, driver_path, delay, submit_id=submit_id)
+
+
+class HostLimiter:
+    '''
+    Caps how many requests are in flight to each host at once. One limiter is shared by every
+    worker in a pool, so adding workers never puts more than max_per_host requests on the
+    district's server.
+    '''
+
+    def __init__(self, max_per_host=4):
+        self.max_per_host = max_per_host
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.slots:
+                self.slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.slots[host]
+
+
+def split_pages(pages, workers):
+    '''Splits a list of pages into at most `workers` contiguous chunks of near equal size.'''
+    pages = list(pages)
+    workers = max(1, min(workers, len(pages)))
+    size, extra = divmod(len(pages), workers)
+    chunks = []
+    start = 0
+    for i in range(workers):
+        stop = start + size + (1 if i < extra else 0)
+        chunks.append(pages[start:stop])
+        start = stop
+    return [chunk for chunk in chunks if chunk]
+
+
+def fetch_pages_concurrently(make_worker, pages, workers=4, parse=parse_table, run=None):
+    '''
+    Fetches and parses `pages` with a pool of workers and returns [(page, DataFrame)] in page
+    order.
+        Inputs:
+            make_worker - callable taking the first page of its chunk and returning a worker with
+                page(n) -> html and close(). Each worker is a driver session (DriverWorker) or an
+                HTTP client (PCS_COVID_HTTP.MinibaseClient), and is used by one thread only.
+            pages - page numbers to fetch.
+            workers - (int) size of the pool. Each worker gets a contiguous run of pages, so a
+                driver session only has to page forward through its own chunk.
+            parse - function turning page html into a DataFrame.
+            run - archive run (from archive_run) to keep the pages' html under.
+    '''
+    chunks = split_pages(pages, workers)
+
+    def fetch_chunk(chunk):
+        worker = make_worker(chunk[0])
+        try:
+            pairs = []
+            for page in chunk:
+                page_source = worker.page(page)
+                archive_page(run, page, page_source, 'page')
+                pairs.append((page, timed_parse(page_source, page, parse)))
+            return pairs
+        finally:
+            worker.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(chunks))) as pool:
+        results = list(pool.map(fetch_chunk, chunks))
+    TELEMETRY.count('pages', sum(len(chunk) for chunk in chunks))
+    TELEMETRY.flush()
+    return sorted((pair for chunk in results for pair in chunk), key=lambda pair: pair[0])
+
+
+class DriverWorker:
+    '''
+    One Selenium session used as a page worker. It submits the search on start-up and then
+    moves through the pager with go_to_page. Pass `driver` to adopt a session that already
+    shows page 1 of the results. With a DriverPool as `pool`, the browser comes from (or, when
+    adopted, belongs to) the pool and is handed back on close().
+    '''
+
+    def __init__(self, url, driver_path, delay, limiter=None, driver=None, pool=None, submit_id=SUBMIT_MAIN):
+        self.url = url
+        self.pacer = Pacer(delay)
+        self.limiter = limiter if limiter is not None else HostLimiter()
+        self.pool = pool
+        if driver is None:
+            #Get the browser before the host slot: a worker waiting on the pool must not hold a
+            #slot the workers that have browsers need to load their pages
+            driver = pool.acquire() if pool is not None else start_driver(driver_path)
+            try:
+                with self.limiter.slot(url):
+                    open_search(driver, url, submit_id, self.pacer)
+            except BaseException:
+                close_driver(driver, pool, broken=True)
+                raise
+        self.driver = driver
+        self.current = 1
+
+    def page(self, page):
+        with self.limiter.slot(self.url):
+            self.current = go_to_page(self.driver, page, self.current, self.pacer)
+            with TELEMETRY.stage('page_source', page) as event:
+                page_source = self.driver.page_source
+                event['bytes'] = len(page_source)
+            return page_source
+
+    def close(self):
+        close_driver(self.driver, self.pool)
+
+
+def Scrape_data_parallel(url, driver_path, delay, workers=2, max_per_host=2, submit_id=SUBMIT_MAIN, pool=None):
+    '''
+    Scrape_data with the page range split across a pool of `workers` browser sessions.
+    The page count comes from determine_total_pages as before; its session then becomes the
+    worker for the first chunk of pages. At most `max_per_host` sessions load pages from the
+    dashboard at the same time. With a DriverPool as `pool` the sessions are taken from it
+    (workers beyond its size wait for a free browser). Returns the same (data_dict, data_df)
+    pair as Scrape_data.
+    '''
+    tot, _, first_driver = determine_total_pages(url, driver_path, submit_id, pool)
+    click_submit(first_driver, submit_id)
+    print('Scraping ' + str(tot) + ' pages with ' + str(workers) + ' browser sessions...')
+    limiter = HostLimiter(max_per_host)
+
+    def make_worker(first_page):
+        if first_page == 1:
+            return DriverWorker(url, driver_path, delay, limiter, driver=first_driver, pool=pool)
+        return DriverWorker(url, driver_path, delay, limiter, pool=pool, submit_id=submit_id)
+
+    pages = fetch_pages_concurrently(make_worker, range(1, tot+1), workers, run=archive_run(url, submit_id))
+    return collect_pages(pages)
@@ -0,0 +1,412 @@
+'''
+Append-only, partitioned store for the dashboard case data.
+
+Instead of a new full snapshot csv for every scrape (data_dump_YYYYMMDD.csv), rows are kept once
+in Parquet files partitioned by school year and month:
+
+    <root>/school_year=2021-2022/month=2021-08/part-000003.parquet
+    <root>/store.json        version number and the next part number
+
+Appending a snapshot only writes the (Date, Locations affected) groups that are new or whose
+rows changed; each write goes to a new part file. When reading, the newest part holding a
+(Date, Locations affected) key wins, so a re-scraped day replaces what was stored for it. Rows
+repeated within one snapshot (two separate reports for one school on one day) are kept.
+
+Reads go through a memory-mapped pyarrow dataset. Partitions outside the requested date range
+are never opened and only the requested columns are decoded, so loading one semester does not
+mean parsing the whole history.
+
+Daily totals by school and for the district are kept next to the rows in an AggregateCube
+(<root>/cube) and updated by each append, so district series do not have to be regrouped from
+the rows on every run.
+'''
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+
+import PCS_COVID_Ingest as Ingest
+
+KEYS = ['Date', 'Locations affected']
+COUNTS = ['Number of positive employees', 'Number of positive students']
+COLUMNS = KEYS + COUNTS
+SEQ = '_part'
+SCHEMA = pa.schema([
+    ('Date', pa.timestamp('ns')),
+    ('Locations affected', pa.string()),
+    ('Number of positive employees', pa.int32()),
+    ('Number of positive students', pa.int32()),
+    (SEQ, pa.int32()),
+])
+PARTITION_SCHEMA = pa.schema([('school_year', pa.string()), ('month', pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+DATASET_SCHEMA = pa.schema(list(SCHEMA) + list(PARTITION_SCHEMA))
+CUBE_DIR = 'cube'
+TOTAL = 'Total cases'
+CUBE_COUNTS = COUNTS + [TOTAL]
+CUMULATIVE = ['Cumulative ' + c for c in CUBE_COUNTS]
+
+
+def school_year(dates):
+    '''Labels each date with its school year, e.g. 2021-2022 for 2021-07-01 through 2022-06-30.'''
+    dates = pd.Series(dates)
+    year = dates.dt.year - (dates.dt.month < 7).astype(int)
+    return year.astype(str) + '-' + (year + 1).astype(str)
+
+
+def read_snapshot(path):
+    '''
+    Reads one scraped csv (a data_dump_*.csv, the 2020-2021 file or a Dahomey-style export) into
+    the four dashboard columns through PCS_COVID_Ingest. Quarantined rows are left out.
+    '''
+    return Ingest.ingest(path).frame
+
+
+def normalize(frame):
+    '''Returns the four dashboard columns with the dtypes the store uses, rows without a date dropped.'''
+    frame = frame[COLUMNS].dropna(subset=['Date'])
+    return pd.DataFrame({
+        'Date': pd.to_datetime(frame['Date']).astype('datetime64[ns]'),
+        'Locations affected': frame['Locations affected'].astype(str).astype(object),
+        COUNTS[0]: pd.to_numeric(frame[COUNTS[0]], errors='coerce').fillna(0).astype('int32'),
+        COUNTS[1]: pd.to_numeric(frame[COUNTS[1]], errors='coerce').fillna(0).astype('int32'),
+    })
+
+
+def group_signatures(frame):
+    '''
+    Returns one hash per (Date, Locations affected) group, independent of row order within the
+    group, so that a stored day and a re-scraped day can be compared without a row-by-row join.
+    `frame` must have gone through normalize().
+    '''
+    row_hashes = pd.util.hash_pandas_object(frame[COLUMNS], index=False)
+    return row_hashes.groupby([frame['Date'], frame['Locations affected']]).sum()
+
+
+def latest_rows(frame):
+    '''Keeps, for each (Date, Locations affected) key, only the rows from the newest part.'''
+    newest = frame.groupby(KEYS, sort=False)[SEQ].transform('max')
+    return frame[frame[SEQ] == newest]
+
+
+def daily_sums(frame):
+    '''Sums the counts of a normalized frame per (Date, Locations affected) and adds Total cases.'''
+    sums = frame.groupby(KEYS, sort=True)[COUNTS].sum().astype('int64').reset_index()
+    sums[TOTAL] = sums[COUNTS[0]] + sums[COUNTS[1]]
+    return sums
+
+
+class AggregateCube:
+    '''
+    Daily totals kept with the store in <root>/cube, one folder per month:
+
+        school_year=2021-2022/month=2021-08/schools.parquet    Date, Locations affected, the counts,
+                                                               Total cases
+        school_year=2021-2022/month=2021-08/district.parquet   Date, the counts, Total cases
+
+    update() replaces the (Date, Locations affected) sums that an append changed. Only the
+    months touched are rewritten, so a daily refresh costs one or two months of sums however
+    long the history grows. district() adds a cumulative column for each count, running from
+    the school year's start; a school year has at most a few hundred district rows, so they
+    are summed when read rather than stored.
+    '''
+
+    def __init__(self, root):
+        self.root = os.path.join(root, CUBE_DIR)
+
+    def path(self, year, month, name):
+        return os.path.join(self.root, 'school_year=' + year, 'month=' + month, name + '.parquet')
+
+    def partitions(self):
+        '''(school year, month) of every month the cube holds, oldest first.'''
+        folders = glob.glob(os.path.join(self.root, 'school_year=*', 'month=*'))
+        names = [(os.path.basename(os.path.dirname(folder)), os.path.basename(folder)) for folder in folders]
+        return sorted((year.split('=', 1)[1], month.split('=', 1)[1]) for year, month in names)
+
+    def legacy(self):
+        '''True if the cube still has the one-file-per-school-year layout of earlier versions.'''
+        return bool(glob.glob(os.path.join(self.root, 'school_year=*', '*.parquet')))
+
+    def load(self, year, month, name):
+        path = self.path(year, month, name)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def write(self, year, month, name, frame):
+        os.makedirs(os.path.dirname(self.path(year, month, name)), exist_ok=True)
+        temp_path = self.path(year, month, name) + '.tmp'
+        frame.to_parquet(temp_path, index=False)
+        os.replace(temp_path, self.path(year, month, name))
+
+    def clear(self):
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+
+    def update(self, sums):
+        '''Applies daily_sums() of the groups an append wrote.'''
+        years = school_year(sums['Date']).to_numpy()
+        months = sums['Date'].dt.strftime('%Y-%m').to_numpy()
+        for (year, month), new in sums.groupby([years, months]):
+            schools = self.load(year, month, 'schools')
+            if schools is not None:
+                replaced = pd.MultiIndex.from_frame(schools[KEYS]).isin(pd.MultiIndex.from_frame(new[KEYS]))
+                schools = pd.concat([schools[~replaced], new], ignore_index=True)
+            else:
+                schools = new
+            schools = schools.sort_values(by=KEYS, kind='stable').reset_index(drop=True)
+            district = schools.groupby('Date')[CUBE_COUNTS].sum().reset_index()
+            self.write(year, month, 'schools', schools)
+            self.write(year, month, 'district', district)
+
+    def rebuild(self, frame):
+        '''Recomputes the cube from all rows of the store.'''
+        self.clear()
+        if len(frame):
+            self.update(daily_sums(normalize(frame)))
+
+    def read(self, name, start=None, end=None):
+        partitions = self.partitions()
+        #The district's cumulative columns need every month of a school year, schools only the range
+        if start is not None:
+            first = (school_year([pd.Timestamp(start)])[0], pd.Timestamp(start).strftime('%Y-%m'))
+            partitions = [(y, m) for y, m in partitions if y >= first[0] and (name == 'district' or m >= first[1])]
+        if end is not None:
+            last = (school_year([pd.Timestamp(end)])[0], pd.Timestamp(end).strftime('%Y-%m'))
+            partitions = [(y, m) for y, m in partitions if y <= last[0] and m <= last[1]]
+        frames = [frame for frame in (self.load(y, m, name) for y, m in partitions) if frame is not None]
+        if not frames:
+            return pd.DataFrame(columns=(['Date'] if name == 'district' else KEYS) + CUBE_COUNTS +
+                                (CUMULATIVE if name == 'district' else []))
+        frame = pd.concat(frames, ignore_index=True)
+        if name == 'district':
+            frame = frame.sort_values(by='Date', kind='stable').reset_index(drop=True)
+            cumulative = frame.groupby(school_year(frame['Date']).to_numpy())[CUBE_COUNTS].cumsum()
+            frame[CUMULATIVE] = cumulative.to_numpy()
+        if start is not None:
+            frame = frame[frame['Date'] >= pd.Timestamp(start)]
+        if end is not None:
+            frame = frame[frame['Date'] <= pd.Timestamp(end)]
+        return frame.reset_index(drop=True)
+
+    def district(self, start=None, end=None, rebase=False):
+        '''
+        District totals per reported date between start and end (inclusive).
+            rebase - make the cumulative columns count from `start` rather than from the start of
+                the school year (for a range within one school year).
+        '''
+        frame = self.read('district', start, end)
+        if rebase and len(frame):
+            first = frame.iloc[0]
+            offset = first[CUMULATIVE].to_numpy() - first[CUBE_COUNTS].to_numpy()
+            frame[CUMULATIVE] = frame[CUMULATIVE].to_numpy() - offset
+        return frame
+
+    def schools(self, start=None, end=None):
+        '''Totals per (Date, Locations affected) between start and end (inclusive).'''
+        return self.read('schools', start, end)
+
+
+class MemoryCube(AggregateCube):
+    '''An AggregateCube kept in memory, for readers that may not write to the store.'''
+
+    def __init__(self):
+        self.frames = {}
+
+    def partitions(self):
+        return sorted({(year, month) for year, month, name in self.frames})
+
+    def legacy(self):
+        return False
+
+    def load(self, year, month, name):
+        return self.frames.get((year, month, name))
+
+    def write(self, year, month, name, frame):
+        self.frames[(year, month, name)] = frame
+
+    def clear(self):
+        self.frames = {}
+
+
+class CaseStore:
+    '''
+    The store kept in folder `root`. See the module docstring for the layout.
+        CaseStore(root).append(df) - add a scrape or a snapshot.
+        CaseStore(root).read(columns, start, end) - load rows, newest version of each key.
+    '''
+
+    def __init__(self, root='case_store'):
+        self.root = root
+        self.meta_path = os.path.join(root, 'store.json')
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'version': 0, 'next_part': 0, 'cube_version': 0}
+
+    @property
+    def version(self):
+        '''Number of appends that changed the data; use it to key caches built on the store.'''
+        return self.meta['version']
+
+    @property
+    def cube(self):
+        '''
+        The store's AggregateCube. It is rebuilt from the rows if it does not reflect the
+        current version (e.g. for a store written before the cube existed).
+        '''
+        cube = AggregateCube(self.root)
+        if self.meta.get('cube_version') != self.version or cube.legacy():
+            cube.rebuild(self.read())
+            self.meta['cube_version'] = self.version
+            self.write_meta()
+        return cube
+
+    def cube_view(self):
+        '''
+        The store's cube for reading only: the one on disk if it reflects the current version,
+        otherwise a MemoryCube rebuilt from the rows. Unlike the cube property it never writes
+        the cube or store.json, so it is safe alongside a process that appends.
+        '''
+        cube = AggregateCube(self.root)
+        if self.meta.get('cube_version') == self.version and not cube.legacy():
+            return cube
+        cube = MemoryCube()
+        cube.rebuild(self.read())
+        return cube
+
+    def write_meta(self):
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(temp_path, self.meta_path)
+
+    def part_files(self):
+        return sorted(glob.glob(os.path.join(self.root, 'school_year=*', 'month=*', 'part-*.parquet')))
+
+    def empty(self):
+        return not self.part_files()
+
+    def dataset(self):
+        #use_mmap maps the files into memory instead of reading them into buffers
+        filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+        return ds.dataset(self.part_files(), schema=DATASET_SCHEMA, format='parquet',
+                          partitioning=PARTITIONING, partition_base_dir=self.root, filesystem=filesystem)
+
+    def read(self, columns=None, start=None, end=None, keep_partitions=False, as_of=None):
+        '''
+        Loads rows from the store, sorted by date.
+            Inputs:
+                columns - list of columns to load (default: all four dashboard columns).
+                start, end - optional first and last date to load, inclusive. Partitions
+                    outside the range are skipped without being opened.
+                keep_partitions - also return the school_year and month columns.
+                as_of - optional part number; read the store as it was once that part had been
+                    written (parts are numbered in the order they were appended, until compact()).
+        '''
+        columns = list(columns) if columns is not None else list(COLUMNS)
+        if self.empty():
+            return pd.DataFrame({c: pd.Series(dtype=SCHEMA.field(c).type.to_pandas_dtype()) for c in columns})
+
+        expression = None
+        if start is not None:
+            start = pd.Timestamp(start)
+            expression = ((ds.field('school_year') >= school_year([start])[0]) &
+                          (ds.field('month') >= start.strftime('%Y-%m')) &
+                          (ds.field('Date') >= pa.scalar(start.as_unit('ns').value, pa.timestamp('ns'))))
+        if end is not None:
+            end = pd.Timestamp(end)
+            upper = ((ds.field('school_year') <= school_year([end])[0]) &
+                     (ds.field('month') <= end.strftime('%Y-%m')) &
+                     (ds.field('Date') <= pa.scalar(end.as_unit('ns').value, pa.timestamp('ns'))))
+            expression = upper if expression is None else expression & upper
+        if as_of is not None:
+            upto = ds.field(SEQ) <= as_of
+            expression = upto if expression is None else expression & upto
+
+        load = list(dict.fromkeys(KEYS + [c for c in columns if c in SCHEMA.names] + [SEQ]))
+        if keep_partitions:
+            load += ['school_year', 'month']
+        table = self.dataset().to_table(columns=load, filter=expression)
+        frame = latest_rows(table.to_pandas())
+        frame = frame.sort_values(by='Date', kind='stable').reset_index(drop=True)
+        extra = ['school_year', 'month'] if keep_partitions else []
+        return frame[columns + extra]
+
+    def append(self, frame):
+        '''
+        Adds rows to the store. Only (Date, Locations affected) groups that are new, or whose
+        rows differ from what is stored, are written. Returns the number of rows written.
+        '''
+        frame = normalize(frame)
+        if frame.empty:
+            return 0
+
+        stored = normalize(self.read(start=frame['Date'].min(), end=frame['Date'].max()))
+        new_signatures = group_signatures(frame)
+        old_signatures = group_signatures(stored).reindex(new_signatures.index)
+        changed = new_signatures.index[(new_signatures != old_signatures).to_numpy()]
+        if len(changed) == 0:
+            return 0
+        frame = frame.set_index(KEYS).loc[changed].reset_index()
+
+        part = self.meta['next_part']
+        frame[SEQ] = np.int32(part)
+        frame['school_year'] = school_year(frame['Date']).to_numpy()
+        frame['month'] = frame['Date'].dt.strftime('%Y-%m').to_numpy()
+        for (year, month), rows in frame.groupby(['school_year', 'month']):
+            folder = os.path.join(self.root, 'school_year=' + year, 'month=' + month)
+            os.makedirs(folder, exist_ok=True)
+            table = pa.Table.from_pandas(rows[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+            pq.write_table(table, os.path.join(folder, 'part-%06d.parquet' % part))
+
+        #Keep the cube in step if it was; otherwise the cube property rebuilds it when asked
+        cube = AggregateCube(self.root)
+        if self.meta.get('cube_version') == self.meta['version'] and not cube.legacy():
+            cube.update(daily_sums(frame))
+            self.meta['cube_version'] = self.meta['version'] + 1
+        self.meta['next_part'] = part + 1
+        self.meta['version'] += 1
+        self.write_meta()
+        return len(frame)
+
+    def import_csv(self, paths):
+        '''
+        Appends snapshot csv files in the order given (oldest first, so that newer scrapes
+        win). Files already imported with the same size and modification time are skipped, so
+        this can be run on every new data dump. Returns the number of rows written.
+        '''
+        sources = self.meta.setdefault('sources', {})
+        written = 0
+        for path in paths:
+            stat = os.stat(path)
+            stamp = [stat.st_size, stat.st_mtime]
+            name = os.path.basename(path)
+            if sources.get(name) == stamp:
+                continue
+            written += self.append(read_snapshot(path))
+            sources[name] = stamp
+            self.write_meta()
+        return written
+
+    def compact(self):
+        '''Rewrites every partition as a single part file holding only its current rows.'''
+        frame = self.read(keep_partitions=True)
+        old_files = self.part_files()
+        part = self.meta['next_part']
+        frame[SEQ] = np.int32(part)
+        for (year, month), rows in frame.groupby(['school_year', 'month']):
+            folder = os.path.join(self.root, 'school_year=' + year, 'month=' + month)
+            table = pa.Table.from_pandas(rows[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+            pq.write_table(table, os.path.join(folder, 'part-%06d.parquet' % part))
+        for path in old_files:
+            os.remove(path)
+        self.meta['next_part'] = part + 1
+        self.write_meta()
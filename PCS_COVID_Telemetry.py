@@ -0,0 +1,170 @@
+'''
+Timings and counters for scrape runs.
+
+The scrapers report each stage through PCS_COVID_ScraPy.TELEMETRY: starting the browser,
+loading the search page, submitting the form, waiting for a page after a click, waiting for the
+table, serializing it, parsing it, reading the pager, HTTP requests, checkpoint writes and the
+sleeps between retries. Every stage records its duration and, where it applies, the size of the
+html it handled ('bytes'; characters for html read from the browser) and the rows parsed;
+pages, retries and errors are counted.
+
+By default only the totals are kept (summary() shows them). To export the records:
+
+    import PCS_COVID_ScraPy as PCS, PCS_COVID_Telemetry as Telemetry
+    PCS.TELEMETRY = Telemetry.Telemetry(jsonl_path='scrape_metrics.jsonl',
+                                        prom_path='scrape_metrics.prom',
+                                        profile_path='scrape.pstats')
+    with PCS.TELEMETRY.run('daily'):
+        PCS.Scrape_data(URL, driver_path, 2)
+
+jsonl_path gets one JSON line per stage as it finishes. prom_path gets the totals in the
+Prometheus text format (for node_exporter's textfile collector) whenever a scrape finishes.
+profile_path gets cProfile statistics of each run() block (read them with pstats).
+'''
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'pcs_covid_scrape'
+
+
+class Telemetry:
+    '''
+    Collects stage records for scrape runs. Safe to share between the threads of the parallel
+    scrapers.
+        Inputs:
+            jsonl_path - file to append one JSON line per stage to (optional).
+            prom_path - Prometheus text file to (re)write on flush() (optional).
+            profile_path - file for the cProfile statistics of each run() (optional).
+            keep_events - also keep every record in memory, in `events`.
+    '''
+
+    def __init__(self, jsonl_path=None, prom_path=None, profile_path=None, keep_events=False):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.profile_path = profile_path
+        self.keep_events = keep_events
+        self.lock = threading.Lock()
+        self.events = []
+        self.stages = {}
+        self.counters = {}
+        self.run_name = None
+        self.run_started = None
+        self.run_seconds = None
+
+    @contextmanager
+    def stage(self, name, page=None):
+        '''
+        Times the block as stage `name`. The block can add 'bytes' and 'rows' to the dict it
+        receives. A block that raises is recorded with its error and counted in errors.
+        '''
+        event = {}
+        start = time.perf_counter()
+        try:
+            yield event
+        except BaseException as err:
+            event['error'] = type(err).__name__
+            raise
+        finally:
+            event['seconds'] = time.perf_counter() - start
+            self.record(name, page, event)
+
+    def record(self, name, page, event):
+        event = dict(event, stage=name, time=time.time())
+        if page is not None:
+            event['page'] = page
+        if self.run_name is not None:
+            event['run'] = self.run_name
+        with self.lock:
+            totals = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                   'bytes': 0, 'rows': 0, 'errors': 0})
+            totals['count'] += 1
+            totals['seconds'] += event['seconds']
+            totals['max_seconds'] = max(totals['max_seconds'], event['seconds'])
+            totals['bytes'] += event.get('bytes', 0)
+            totals['rows'] += event.get('rows', 0)
+            totals['errors'] += 'error' in event
+            if self.keep_events:
+                self.events.append(event)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(event) + '\n')
+
+    def count(self, name, amount=1):
+        '''Adds to counter `name`, e.g. count('retries').'''
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        '''Totals per stage: count, seconds, max_seconds, bytes, rows, errors.'''
+        with self.lock:
+            return {name: dict(totals) for name, totals in self.stages.items()}
+
+    @contextmanager
+    def run(self, name='scrape'):
+        '''
+        Marks a scrape run: its records carry `name`, it is profiled when profile_path is set,
+        and the Prometheus file is written at the end.
+        '''
+        profiler = None
+        if self.profile_path is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+        self.run_name = name
+        self.run_started = time.time()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+            self.run_seconds = time.perf_counter() - start
+            self.flush()
+            self.run_name = None
+
+    def prometheus(self):
+        '''The totals in the Prometheus text exposition format.'''
+        stages = self.summary()
+        with self.lock:
+            counters = dict(self.counters)
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append('# HELP ' + PREFIX + '_' + name + ' ' + help_text)
+            lines.append('# TYPE ' + PREFIX + '_' + name + ' ' + kind)
+            for suffix, labels, value in samples:
+                label_text = '{' + ','.join(k + '="' + v + '"' for k, v in labels.items()) + '}' if labels else ''
+                lines.append(PREFIX + '_' + name + suffix + label_text + ' ' + repr(float(value)))
+
+        metric('stage_seconds', 'summary', 'Time spent in each scrape stage.',
+               [(suffix, {'stage': s}, t[key]) for s, t in sorted(stages.items())
+                for suffix, key in (('_sum', 'seconds'), ('_count', 'count'))])
+        metric('stage_max_seconds', 'gauge', 'Longest single run of each stage.',
+               [('', {'stage': s}, t['max_seconds']) for s, t in sorted(stages.items())])
+        metric('bytes_total', 'counter', 'Html bytes handled by each stage.',
+               [('', {'stage': s}, t['bytes']) for s, t in sorted(stages.items()) if t['bytes']])
+        metric('rows_total', 'counter', 'Table rows parsed by each stage.',
+               [('', {'stage': s}, t['rows']) for s, t in sorted(stages.items()) if t['rows']])
+        metric('errors_total', 'counter', 'Stages that raised an error.',
+               [('', {'stage': s}, t['errors']) for s, t in sorted(stages.items())])
+        metric('events_total', 'counter', 'Counted events such as retries.',
+               [('', {'event': name}, value) for name, value in sorted(counters.items())])
+        if self.run_started is not None:
+            metric('last_run_timestamp_seconds', 'gauge', 'Start of the last run.', [('', {}, self.run_started)])
+        if self.run_seconds is not None:
+            metric('last_run_seconds', 'gauge', 'Duration of the last run.', [('', {}, self.run_seconds)])
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        '''Writes the Prometheus file, if one is set, replacing it in one step.'''
+        if self.prom_path is None:
+            return
+        temp_path = self.prom_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(temp_path, self.prom_path)
@@ -0,0 +1,126 @@
+'''
+School-term calendar and alignment of case series by school day.
+
+Comparing semesters means putting day 1 of each term on the same axis. align() maps dates to a
+(term, school day) pair with one searchsorted over the term start dates, counting school days
+(weekdays not in `holidays`) from each term's first day; reports dated on a weekend count
+toward the next school day. cumulative_curves() then sums a column for every term at once into
+one table indexed by school day, so adding a year or a term is a row in the calendar rather
+than another masked copy of the data.
+
+The calendar is a table of term, start and end (inclusive) dates. TERMS holds the terms the
+notebook compares; pass a list of (term, start, end) tuples, a DataFrame or a csv path to use
+another one.
+'''
+import numpy as np
+import pandas as pd
+
+#First and last day of each term
+TERMS = [
+    ('2020-2021 Fall', '2020-08-30', '2020-12-18'),
+    ('2020-2021 Spring', '2021-01-04', '2021-06-09'),
+    ('2021-2022 Fall', '2021-08-11', '2021-12-17'),
+]
+
+
+def calendar(terms=None):
+    '''
+    Returns the term calendar as a DataFrame with columns term, start and end, sorted by start.
+    `terms` is a list of (term, start, end) tuples, a DataFrame with those columns, or the path
+    of a csv holding them (default: TERMS). Raises ValueError if two terms overlap.
+    '''
+    if terms is None:
+        terms = TERMS
+    if isinstance(terms, str):
+        terms = pd.read_csv(terms)
+    if not isinstance(terms, pd.DataFrame):
+        terms = pd.DataFrame(list(terms), columns=['term', 'start', 'end'])
+    table = pd.DataFrame({
+        'term': terms['term'].astype(str).to_numpy(),
+        'start': pd.to_datetime(terms['start']).to_numpy(),
+        'end': pd.to_datetime(terms['end']).to_numpy(),
+    }).sort_values(by='start', kind='stable').reset_index(drop=True)
+    if (table['end'] < table['start']).any():
+        raise ValueError('A term ends before it starts.')
+    if (table['start'].to_numpy()[1:] <= table['end'].to_numpy()[:-1]).any():
+        raise ValueError('Terms in the calendar overlap.')
+    return table
+
+
+def align(dates, terms=None, holidays=()):
+    '''
+    Maps dates to terms and school days.
+        Inputs:
+            dates - array or Series of dates.
+            terms - calendar, as for calendar().
+            holidays - dates that are not school days.
+        Returns (term, school_day): integer arrays with, for each date, its row in calendar(terms)
+        (-1 outside every term) and the number of school days between the term's first day and
+        the date (0 on the first school day; -1 outside every term).
+    '''
+    table = calendar(terms)
+    days = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]')
+    starts = table['start'].to_numpy().astype('datetime64[D]')
+    ends = table['end'].to_numpy().astype('datetime64[D]')
+
+    term = np.searchsorted(starts, days, side='right') - 1
+    inside = (term >= 0) & ~np.isnat(days)
+    inside[inside] = days[inside] <= ends[term[inside]]
+    term = np.where(inside, term, -1)
+
+    school_day = np.full(len(days), -1, dtype=np.int64)
+    holidays = pd.to_datetime(list(holidays)).to_numpy().astype('datetime64[D]')
+    school_day[inside] = np.busday_count(starts[term[inside]], days[inside], holidays=holidays)
+    return term, school_day
+
+
+def cumulative_curves(frame, column='Total cases', terms=None, holidays=(), days=None):
+    '''
+    Cumulative sums of frame[column] for every term, aligned by school day.
+        Inputs:
+            frame - rows or daily totals with a Date column and `column`.
+            terms, holidays - as for align().
+            days - optional number of school days to keep, e.g. the days so far in the current
+                term to compare all terms over the same stretch.
+        Returns a DataFrame indexed by school day (0, 1, ...) with one column per term that has
+        data; a term's column is NaN after its last reported school day.
+    '''
+    table = calendar(terms)
+    term, school_day = align(frame['Date'], table, holidays)
+    keep = term >= 0
+    if days is not None:
+        keep &= school_day < days
+    term = term[keep]
+    school_day = school_day[keep]
+    values = pd.to_numeric(frame[column], errors='coerce').fillna(0).to_numpy()[keep]
+
+    n_days = int(school_day.max()) + 1 if len(school_day) else 0
+    if days is not None:
+        n_days = min(n_days, days)
+    n_terms = len(table)
+    daily = np.bincount(school_day * n_terms + term, weights=values, minlength=n_days * n_terms)
+    curves = daily.reshape(n_days, n_terms).cumsum(axis=0)
+
+    #Blank each term after the last school day it has data for
+    last = np.full(n_terms, -1, dtype=np.int64)
+    np.maximum.at(last, term, school_day)
+    curves[np.arange(n_days)[:, None] > last[None, :]] = np.nan
+    has_data = last >= 0
+    return pd.DataFrame(curves[:, has_data], index=pd.RangeIndex(n_days, name='School day'),
+                        columns=table['term'].to_numpy()[has_data])
+
+
+def term_index(table, term):
+    '''Row of `term` (a term name) in the calendar `table`. Raises ValueError for an unknown term.'''
+    rows = table.index[table['term'] == term]
+    if not len(rows):
+        raise ValueError('Unknown term ' + repr(term) + '; the calendar has ' + ', '.join(table['term']) + '.')
+    return rows[0]
+
+
+def school_days_so_far(frame, term, terms=None, holidays=()):
+    '''Number of school days of `term` (a term name) that have data in frame.'''
+    table = calendar(terms)
+    codes, school_day = align(frame['Date'], table, holidays)
+    in_term = codes == term_index(table, term)
+    return int(school_day[in_term].max()) + 1 if in_term.any() else 0
@@ -0,0 +1,89 @@
+'''
+Times the scrapers against the local dashboard simulator (dashboard_sim.py), so throughput and
+resilience can be compared between commits without touching the district's site.
+
+Engines:
+    http           PCS_COVID_HTTP.Scrape_data, one page after another
+    http-parallel  PCS_COVID_HTTP.Scrape_data_parallel with --workers clients
+    selenium       PCS_COVID_ScraPy.Scrape_data (only with --driver-path)
+
+Run from the repository root:
+    python benchmarks/bench_scrape.py [--pages 200] [--latency 0.05] [--jitter 0.02]
+        [--failure-rate 0.01 --failure-mode 500] [--workers 4] [--driver-path chromedriver]
+
+Each run reports pages per second, the rows returned against the rows served, and what the
+server counted (requests, failures injected, bytes). Results go to --output as JSON.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+import PCS_COVID_HTTP
+import PCS_COVID_Ingest as Ingest
+import PCS_COVID_ScraPy as PCS
+import dashboard_sim
+
+
+def run_engine(engine, args, data):
+    dashboard = dashboard_sim.Dashboard(data, page_size=args.page_size, pages=args.pages, latency=args.latency,
+                                        jitter=args.jitter, failure_rate=args.failure_rate,
+                                        failure_mode=args.failure_mode, seed=args.seed)
+    server, url = dashboard_sim.serve(dashboard)
+    expected = len(dashboard.tables[dashboard_sim.SUBMIT_MAIN])
+    start = time.perf_counter()
+    error = None
+    rows = 0
+    try:
+        if engine == 'http':
+            _, data_df = PCS_COVID_HTTP.Scrape_data(url)
+        elif engine == 'http-parallel':
+            _, data_df = PCS_COVID_HTTP.Scrape_data_parallel(url, workers=args.workers, max_per_host=args.workers)
+        else:
+            _, data_df = PCS.Scrape_data(url, args.driver_path, max(args.latency, 0.1))
+        rows = len(data_df)
+    except Exception as err:
+        error = type(err).__name__ + ': ' + str(err)
+    seconds = time.perf_counter() - start
+    server.shutdown()
+
+    pages = -(-expected // args.page_size)
+    result = {'engine': engine, 'seconds': seconds, 'pages': pages, 'pages_per_second': pages / seconds,
+              'rows': rows, 'rows_served': expected, 'complete': rows == expected, 'error': error}
+    result.update({'server_' + k: v for k, v in dashboard.stats.items()})
+    print('%-14s %7.2f s  %7.1f pages/s  %d/%d rows%s' % (
+        engine, seconds, result['pages_per_second'], rows, expected, '  ' + error if error else ''))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--csv', default=os.path.join(HERE, '..', 'All_Data_2020-2021.csv'))
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-mode', choices=dashboard_sim.FAILURE_MODES, default='500')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--driver-path', help='also time the Selenium scraper with this webdriver')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    data = Ingest.read_raw(args.csv)
+    engines = ['http', 'http-parallel'] + (['selenium'] if args.driver_path else [])
+    results = [run_engine(engine, args, data) for engine in engines]
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=1)
+        print('Wrote ' + args.output)
+
+
+if __name__ == '__main__':
+    main()
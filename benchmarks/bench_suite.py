@@ -0,0 +1,194 @@
+'''
+Benchmark suite for the data path, from csv to figures, on real and synthetic data.
+
+Datasets:
+    real      All_Data_2020-2021.csv and every data_dump_*.csv in the repository root
+    10x ...   synthetic multi-year, many-school data from synthetic.py at each --scales value
+
+Stages timed on each dataset (best of --repeat runs):
+    ingest        read the csv and normalize it (PCS_COVID_Ingest.normalize_table, no cache)
+    parse_dates   parse the Date column with the detected format
+    daily_groupby district totals per date
+    school_series SchoolIndex and SchoolSeries for every school
+    term_align    PCS_COVID_Terms.cumulative_curves over all terms
+    render        one school figure (PCS_COVID_Render.render_one), per figure
+and once, on pages rebuilt from All_Data_2020-2021.csv or recorded pages (--pages DIR):
+    extract_table the lxml table extractor, per page
+
+Results are written as JSON (one record per dataset and stage, plus the commit and library
+versions) to benchmarks/results/<commit>.json, or --output. --compare OLD.json prints each
+stage's change against an earlier run, so a regression between commits stands out.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py [--scales 10 100 1000] [--repeat 3] [--compare OLD.json]
+'''
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import numpy as np
+import pandas as pd
+
+import PCS_COVID_Ingest as Ingest
+import PCS_COVID_Render as Render
+import PCS_COVID_Schools as Schools
+import PCS_COVID_ScraPy as PCS
+import PCS_COVID_Terms as Terms
+import synthetic
+from bench_table_extract import sample_pages
+
+
+def best_time(function, repeat):
+    '''Runs function() `repeat` times; returns (best seconds, last result).'''
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def real_dataset():
+    '''The checked-in csv files as (list of raw string tables, term calendar).'''
+    paths = [os.path.join(ROOT, 'All_Data_2020-2021.csv')] + sorted(glob.glob(os.path.join(ROOT, 'data_dump_*.csv')))
+    return [Ingest.read_raw(path) for path in paths], None
+
+
+def synthetic_dataset(scale, directory):
+    '''A synthetic csv written to `directory`, read back as strings.'''
+    frame, calendar = synthetic.synthetic_cases(scale)
+    path = os.path.join(directory, 'synthetic_%gx.csv' % scale)
+    frame.to_csv(path, index=False)
+    return [Ingest.read_raw(path)], calendar
+
+
+def run_stages(name, raws, calendar, repeat, out_dir):
+    '''Times every stage on one dataset. Returns a list of result records.'''
+    rows = sum(len(raw) for raw in raws)
+    results = []
+
+    def record(stage, seconds, units=None, unit='row'):
+        units = rows if units is None else units
+        results.append({'dataset': name, 'stage': stage, 'rows': rows, 'seconds': seconds,
+                        'units': units, 'unit': unit, 'us_per_unit': seconds / max(units, 1) * 1e6})
+        print('  %-14s %10.4f s  %10.3f us/%s' % (stage, seconds, seconds / max(units, 1) * 1e6, unit))
+
+    seconds, ingested = best_time(lambda: [Ingest.normalize_table(raw, name) for raw in raws], repeat)
+    record('ingest', seconds)
+    frame = pd.concat([result.frame for result in ingested], ignore_index=True)
+
+    dates = pd.concat([raw['Date'] for raw in raws], ignore_index=True).str.strip()
+
+    def parse():
+        fmt = Ingest.detect_format(dates)
+        return pd.to_datetime(dates, format=fmt, errors='coerce')
+    seconds, _ = best_time(parse, repeat)
+    record('parse_dates', seconds)
+
+    seconds, _ = best_time(lambda: frame.groupby('Date')[Ingest.COUNTS].sum(), repeat)
+    record('daily_groupby', seconds)
+
+    def series():
+        return Schools.SchoolSeries(frame, Schools.SchoolIndex(frame['Locations affected']))
+    seconds, school_series = best_time(series, repeat)
+    record('school_series', seconds)
+
+    totals = frame.assign(**{'Total cases': frame[Ingest.COUNTS[0]].astype('int64') + frame[Ingest.COUNTS[1]]})
+    seconds, _ = best_time(lambda: Terms.cumulative_curves(totals, 'Total cases', calendar), repeat)
+    record('term_align', seconds)
+
+    specs = Render.school_specs(school_series)[:5]
+    seconds, _ = best_time(lambda: [Render.render_one(spec, out_dir) for spec in specs], repeat)
+    record('render', seconds / len(specs), units=1, unit='figure')
+    return results
+
+
+def extract_stage(pages, repeat):
+    seconds, _ = best_time(lambda: [PCS.extract_table(page) for page in pages], repeat)
+    print('  %-14s %10.4f s  %10.3f us/page' % ('extract_table', seconds, seconds / len(pages) * 1e6))
+    return {'dataset': 'pages', 'stage': 'extract_table', 'rows': len(pages), 'seconds': seconds,
+            'units': len(pages), 'unit': 'page', 'us_per_unit': seconds / len(pages) * 1e6}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    import matplotlib
+    import pyarrow
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'machine': platform.machine(), 'cpus': os.cpu_count(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'pyarrow': pyarrow.__version__, 'matplotlib': matplotlib.__version__}
+
+
+def compare(old_path, results):
+    '''Prints each stage's time against an earlier results file.'''
+    with open(old_path) as f:
+        old = json.load(f)
+    before = {(r['dataset'], r['stage']): r['us_per_unit'] for r in old['results']}
+    print('\nAgainst ' + old_path + ' (commit ' + old['environment']['commit'] + '):')
+    for r in results:
+        key = (r['dataset'], r['stage'])
+        if key in before and before[key] > 0:
+            ratio = r['us_per_unit'] / before[key]
+            flag = '  SLOWER' if ratio > 1.2 else ''
+            print('  %-8s %-14s %6.2fx%s' % (r['dataset'], r['stage'], ratio, flag))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scales', type=float, nargs='*', default=[10, 100],
+                        help='synthetic dataset sizes, as multiples of the 2020-2021 file (e.g. 10 100 1000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--pages', help='folder of recorded dashboard pages (*.html) for extract_table')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    env = environment()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        print('real:')
+        raws, calendar = real_dataset()
+        results += run_stages('real', raws, calendar, args.repeat, directory)
+        for scale in args.scales:
+            name = '%gx' % scale
+            print(name + ':')
+            raws, calendar = synthetic_dataset(scale, directory)
+            results += run_stages(name, raws, calendar, args.repeat, directory)
+
+    print('pages:')
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        pages = sample_pages(os.path.join(ROOT, 'All_Data_2020-2021.csv'))
+    results.append(extract_stage(pages, args.repeat))
+
+    output = args.output or os.path.join(HERE, 'results', env['commit'] + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': env, 'results': results}, f, indent=1)
+    print('\nWrote ' + output)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
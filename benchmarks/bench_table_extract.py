@@ -0,0 +1,91 @@
+'''
+Times the two ways of reading the data table out of a dashboard page:
+    parse_table_soup - the original path: BeautifulSoup over the whole page, then pd.read_html
+                       on every <table>.
+    extract_table    - the lxml extractor that parses only the sw-flex-table element.
+
+Run from the repository root:
+    python benchmarks/bench_table_extract.py [--pages DIR] [--repeat N]
+
+With --pages, every *.html file in DIR is used (pages saved from the live site). Without it,
+pages are rebuilt from All_Data_2020-2021.csv in the dashboard's layout: the filter form with its
+inline jQuery, the 25-row sw-flex-table and the pager.
+'''
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+import PCS_COVID_ScraPy as PCS
+
+ROWS_PER_PAGE = 25
+
+#One of the filter dropdowns as the dashboard renders it (see data_dump_20210816)
+FILTER_SCRIPT = ('$(document).ready(function() {  CheckScript(\'Dropdown\', staticURL + '
+                 '\'/GlobalAssets/Scripts/ThirdParty/jquery.dropdown.js\');  $(\'ul.ui-dropdown\').each('
+                 'function() {  if ($(this).attr(\'id\') == \'sel-sw-minibasefilter65979-field-1\') {  '
+                 '$(this).remove();  }  });  });')
+
+
+def sample_page(rows, page, pages):
+    '''Builds the html of one dashboard results page holding `rows`.'''
+    filters = ''.join(
+        '<tr><td>' + name + '</td><td>All <script>' + FILTER_SCRIPT + '</script></td></tr>'
+        for name in PCS.COLUMNS[:2])
+    body = ''.join(
+        '<tr>' + ''.join('<td>' + str(value) + '</td>' for value in row) + '</tr>'
+        for row in rows.itertuples(index=False))
+    pager = ''.join(
+        '<li><a href="javascript:;" aria-label="Go to Page ' + str(n) + '">' + str(n) + '</a></li>'
+        for n in range(max(1, page - 4), min(pages, page + 5) + 1))
+    return ('<html><head><script>' + FILTER_SCRIPT * 20 + '</script></head><body>'
+            '<div id="module-content-64809"><table class="ui-minibase-filters">' + filters + '</table>'
+            '<input type="submit" id="minibaseSubmit65979" value="Submit">'
+            '<table class="' + PCS.TABLE_CLASS + '"><tr>' + ''.join('<th>' + c + '</th>' for c in PCS.COLUMNS) +
+            '</tr>' + body + '</table><div id="' + PCS.ID + '"><ul>' + pager + '</ul></div></div></body></html>')
+
+
+def sample_pages(csv_path):
+    data_df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    pages = (len(data_df) + ROWS_PER_PAGE - 1) // ROWS_PER_PAGE
+    return [sample_page(data_df.iloc[i*ROWS_PER_PAGE:(i+1)*ROWS_PER_PAGE], i+1, pages) for i in range(pages)]
+
+
+def time_per_page(parse, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page_source in pages:
+            parse(page_source)
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--pages', help='folder of recorded dashboard pages (*.html)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        pages = sample_pages(os.path.join(root, 'All_Data_2020-2021.csv'))
+
+    print(str(len(pages)) + ' pages, ' + str(sum(len(p) for p in pages) // len(pages)) + ' bytes each on average')
+    soup = time_per_page(PCS.parse_table_soup, pages, args.repeat)
+    lxml_time = time_per_page(PCS.extract_table, pages, args.repeat)
+    print('parse_table_soup: %8.3f ms/page' % (soup * 1000))
+    print('extract_table:    %8.3f ms/page  (%.1fx faster)' % (lxml_time * 1000, soup / lxml_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+'''
+Local stand-in for the district's COVID dashboard, for testing and timing the scrapers offline.
+
+It serves what the scrapers rely on from the Schoolwires minibase page:
+    /            the search page: filter fields sw-minibasefilter65979-field-0 (date text) and
+                 -field-1 (location text) and the submit buttons minibaseSubmit65979 (current
+                 data) and minibaseSubmit62143 (2020-2021 data) in one form
+    /results     the results: a sw-flex-table page and the ui-paging-container pager, with
+                 'Go to Page N' links in windows of ten pages and 'Skip to Page N' ellipses
+                 (the ellipses use a javascript onclick, like the live site), plus the
+                 'New Search' link determine_total_pages clicks
+
+The rows come from any csv with the four dashboard columns, served as-is. The page size, the
+number of pages (rows are repeated to fill them, so thousands of pages are possible), the
+latency and jitter of every response and a rate of injected failures are all settable, and the
+server counts what it served.
+
+Run from the repository root:
+    python benchmarks/dashboard_sim.py --csv All_Data_2020-2021.csv --latency 0.2 --jitter 0.1
+then point a scraper at the url it prints, e.g.
+    PCS_COVID_HTTP.Scrape_data('http://127.0.0.1:8000/')
+or start one in-process with serve(Dashboard(...)).
+'''
+import argparse
+import html
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import pandas as pd
+
+import PCS_COVID_Ingest as Ingest
+
+SUBMIT_MAIN = 'minibaseSubmit65979'
+SUBMIT_OLDDATA = 'minibaseSubmit62143'
+FILTER_DATE = 'sw-minibasefilter65979-field-0'
+FILTER_LOCATION = 'sw-minibasefilter65979-field-1'
+FAILURE_MODES = ['500', 'reset', 'partial']
+
+SEARCH_PAGE = '''<html><head><title>COVID-19 Cases</title></head><body>
+<div id="module-content-64809"><form method="post" action="/results">
+<label for="{date_id}">Date</label><input type="text" id="{date_id}" name="f0" value="">
+<label for="{location_id}">Locations affected</label><input type="text" id="{location_id}" name="f1" value="">
+<input type="submit" id="{main}" name="submit" value="Submit">
+<input type="submit" id="{old}" name="submit" value="2020-2021">
+</form></div></body></html>'''
+
+
+class Dashboard:
+    '''
+    The simulated dashboard's data and behaviour.
+        Inputs:
+            data - DataFrame with the four dashboard columns, newest first, served for
+                SUBMIT_MAIN; old_data likewise for SUBMIT_OLDDATA (default: data).
+            page_size - rows per results page.
+            pages - serve this many pages, repeating the rows as needed (default: just the rows).
+            window - page links shown per pager window.
+            latency, jitter - seconds added to every response: latency plus a uniform amount
+                in [-jitter, jitter], never below zero.
+            failure_rate - share of requests that fail, in the way given by failure_mode:
+                '500' (server error), 'reset' (connection closed without a response) or
+                'partial' (a page without the results table, as when it is half loaded).
+            seed - seed for the jitter and failures, so runs can be repeated.
+    '''
+
+    def __init__(self, data, old_data=None, page_size=25, pages=None, window=10, latency=0.0, jitter=0.0,
+                 failure_rate=0.0, failure_mode='500', seed=0):
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError('failure_mode must be one of ' + ', '.join(FAILURE_MODES))
+        self.tables = {SUBMIT_MAIN: self.fill(data, page_size, pages),
+                       SUBMIT_OLDDATA: self.fill(old_data if old_data is not None else data, page_size, pages)}
+        self.page_size = page_size
+        self.window = window
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.filtered = {}
+        self.stats = {'requests': 0, 'pages': 0, 'failures': 0, 'bytes': 0}
+
+    @staticmethod
+    def fill(data, page_size, pages):
+        data = data[Ingest.COLUMNS].astype(str).reset_index(drop=True)
+        if pages is None or len(data) == 0:
+            return data
+        repeats = -(-pages * page_size // len(data))
+        return pd.concat([data] * repeats, ignore_index=True).iloc[:pages * page_size]
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def delay(self):
+        '''Sleeps for one response's latency and returns True if this request should fail.'''
+        with self.lock:
+            wait = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            fail = self.random.random() < self.failure_rate
+        if wait:
+            time.sleep(wait)
+        return fail
+
+    def results(self, submit, date_text, location_text):
+        '''Rows of the chosen table that match the filters (cached per filter).'''
+        key = (submit, date_text, location_text)
+        with self.lock:
+            if key in self.filtered:
+                return self.filtered[key]
+        table = self.tables.get(submit, self.tables[SUBMIT_MAIN])
+        if date_text:
+            table = table[table['Date'].str.contains(date_text, regex=False)]
+        if location_text:
+            table = table[table['Locations affected'].str.contains(location_text, case=False, regex=False)]
+        with self.lock:
+            self.filtered[key] = table
+        return table
+
+    def search_page(self):
+        return SEARCH_PAGE.format(date_id=FILTER_DATE, location_id=FILTER_LOCATION,
+                                  main=SUBMIT_MAIN, old=SUBMIT_OLDDATA)
+
+    def pager(self, page, pages, query):
+        '''The ui-paging-container list for `page`: its window of ten and the ellipses around it.'''
+        def url(n):
+            return '/results?' + urlencode(dict(query, PageIndex=n))
+        first = (page - 1) // self.window * self.window + 1
+        last = min(first + self.window - 1, pages)
+        items = []
+        if first > 1:
+            items.append('<li><a href="javascript:;" onclick="location.href=\'' + url(first - 1) + '\'" '
+                         'aria-label="Skip to Page ' + str(first - 1) + '">...</a></li>')
+        for n in range(first, last + 1):
+            current = ' class="ui-page-active" aria-current="page"' if n == page else ''
+            items.append('<li><a href="' + url(n) + '"' + current + ' aria-label="Go to Page ' + str(n) + '">'
+                         + str(n) + '</a></li>')
+        if last < pages:
+            items.append('<li><a href="javascript:;" onclick="location.href=\'' + url(last + 1) + '\'" '
+                         'aria-label="Skip to Page ' + str(last + 1) + '">...</a></li>')
+        return '<div id="ui-paging-container"><ul>' + '\n'.join(items) + '</ul></div>'
+
+    def results_page(self, query, partial=False):
+        submit = query.get('submit_id', SUBMIT_MAIN)
+        table = self.results(submit, query.get('f0', ''), query.get('f1', ''))
+        pages = max(1, -(-len(table) // self.page_size))
+        page = min(max(1, int(query.get('PageIndex', 1))), pages)
+        rows = table.iloc[(page - 1) * self.page_size:page * self.page_size]
+
+        header = ''.join('<th>' + html.escape(c) + '</th>' for c in Ingest.COLUMNS)
+        body = ''.join('<tr>' + ''.join('<td>' + html.escape(v) + '</td>' for v in row) + '</tr>'
+                       for row in rows.itertuples(index=False))
+        table_html = '' if partial else '<table class="sw-flex-table"><tr>' + header + '</tr>' + body + '</table>'
+        links = {k: v for k, v in query.items() if k != 'PageIndex'}
+        return ('<html><body><div id="module-content-64809"><div>'
+                '<div><p>' + str(len(table)) + ' results</p></div>'
+                '<div><ul><li><div><div><span><span><p><a href="/">New Search</a></p></span></span></div></div>'
+                '</li></ul></div>'
+                '<div>' + table_html + self.pager(page, pages, links) + '</div>'
+                '</div></div></body></html>')
+
+
+def make_handler(dashboard):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, text, status=200):
+            body = text.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            dashboard.count('bytes', len(body))
+
+        def handle_request(self, query):
+            dashboard.count('requests')
+            partial = False
+            if dashboard.delay():
+                dashboard.count('failures')
+                if dashboard.failure_mode == '500':
+                    self.send('<html><body>Server error</body></html>', status=500)
+                    return
+                if dashboard.failure_mode == 'reset':
+                    self.close_connection = True
+                    return
+                partial = True
+            path = urlparse(self.path).path
+            if path == '/results':
+                dashboard.count('pages')
+                self.send(dashboard.results_page(query, partial))
+            else:
+                self.send(dashboard.search_page())
+
+        def do_GET(self):
+            self.handle_request(dict(parse_qsl(urlparse(self.path).query, keep_blank_values=True)))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            fields = dict(parse_qsl(self.rfile.read(length).decode(), keep_blank_values=True))
+            #The submit button sends its value; map it back to the button's id
+            fields['submit_id'] = SUBMIT_OLDDATA if fields.get('submit') == '2020-2021' else SUBMIT_MAIN
+            fields.pop('submit', None)
+            self.handle_request(fields)
+
+    return Handler
+
+
+def serve(dashboard, host='127.0.0.1', port=0):
+    '''Starts the dashboard on a background thread. Returns (server, url); server.shutdown() stops it.'''
+    server = ThreadingHTTPServer((host, port), make_handler(dashboard))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://' + host + ':' + str(server.server_address[1]) + '/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local copy of the COVID dashboard.')
+    parser.add_argument('--csv', default=os.path.join(HERE, '..', 'All_Data_2020-2021.csv'),
+                        help='rows to serve for the current year')
+    parser.add_argument('--old-csv', help='rows to serve for the 2020-2021 button (default: --csv)')
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--pages', type=int, help='number of pages to serve, repeating rows as needed')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-mode', choices=FAILURE_MODES, default='500')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    data = Ingest.read_raw(args.csv)
+    old_data = Ingest.read_raw(args.old_csv) if args.old_csv else None
+    dashboard = Dashboard(data, old_data, args.page_size, args.pages, latency=args.latency, jitter=args.jitter,
+                          failure_rate=args.failure_rate, failure_mode=args.failure_mode, seed=args.seed)
+    server, url = serve(dashboard, args.host, args.port)
+    print('Serving ' + str(len(dashboard.tables[SUBMIT_MAIN])) + ' rows at ' + url + ' (Ctrl-C to stop)')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(dashboard.stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''
+Synthetic case data in the dashboard's layout, for benchmarks at many times the real size.
+
+synthetic_cases(scale) returns about scale x the rows of All_Data_2020-2021.csv, spread over
+more school years and more schools as the scale grows: 10x is ten school years of ~150 schools,
+100x twenty years of ~750 schools, 1000x twenty years of ~7,500. Reports fall on school days
+(weekdays in a fall and a spring term each year), counts are Poisson, and a share of the
+schools appear under two spellings, as on the real dashboard.
+
+Run from the repository root to write a csv:
+    python benchmarks/synthetic.py 100 synthetic_100x.csv
+'''
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+BASE_ROWS = 3157
+BASE_SCHOOLS = 150
+MAX_YEARS = 20
+FIRST_YEAR = 2020
+KINDS = ['Elementary School', 'Middle School', 'High School', 'Academy Charter School']
+
+
+def terms(years, first_year=FIRST_YEAR):
+    '''Term calendar, as for PCS_COVID_Terms.calendar, for `years` school years.'''
+    rows = []
+    for year in range(first_year, first_year + years):
+        rows.append((str(year) + '-' + str(year + 1) + ' Fall', str(year) + '-08-10', str(year) + '-12-18'))
+        rows.append((str(year) + '-' + str(year + 1) + ' Spring', str(year + 1) + '-01-04', str(year + 1) + '-06-01'))
+    return rows
+
+
+def school_days(calendar):
+    '''All weekdays inside the terms.'''
+    days = [pd.bdate_range(start, end) for _, start, end in calendar]
+    return days[0].append(days[1:]) if len(days) > 1 else days[0]
+
+
+def school_names(n, rng):
+    '''n school names and, for about one in ten, a second spelling.'''
+    names = np.array(['Synthetic ' + str(i) + ' ' + KINDS[i % len(KINDS)] for i in range(n)], dtype=object)
+    variants = names.copy()
+    respelled = rng.random(n) < 0.1
+    variants[respelled] = [name.replace(' Charter School', '').replace('School', 'school')
+                           for name in names[respelled]]
+    return names, variants
+
+
+def synthetic_cases(scale, seed=0):
+    '''
+    Returns (frame, calendar): a DataFrame with the four dashboard columns, newest first and
+    with dates as m/d/YYYY strings as in All_Data_2020-2021.csv, and the term calendar it spans.
+    '''
+    rng = np.random.default_rng(seed)
+    years = max(1, min(MAX_YEARS, int(scale)))
+    schools = int(math.ceil(BASE_SCHOOLS * scale / years))
+    calendar = terms(years)
+    days = school_days(calendar)
+    rows = int(BASE_ROWS * scale)
+
+    names, variants = school_names(schools, rng)
+    school = rng.integers(0, schools, rows)
+    location = np.where(rng.random(rows) < 0.2, variants[school], names[school])
+    dates = days[np.sort(rng.integers(0, len(days), rows))[::-1]]
+    students = rng.poisson(1.5, rows)
+    employees = rng.poisson(0.3, rows)
+    #Every report has at least one case
+    students[(students + employees) == 0] = 1
+
+    frame = pd.DataFrame({
+        'Date': dates.strftime('%m/%d/%Y'),
+        'Locations affected': location,
+        'Number of positive employees': employees,
+        'Number of positive students': students,
+    })
+    return frame, calendar
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic case csv.')
+    parser.add_argument('scale', type=float)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    frame, _ = synthetic_cases(args.scale, args.seed)
+    frame.to_csv(args.output, index=False)
+    print('Wrote ' + str(len(frame)) + ' rows to ' + args.output)
+
+
+if __name__ == '__main__':
+    main()
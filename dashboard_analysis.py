@@ -21,12 +21,7 @@
 
 # %%
 #Load packages
-import pandas as pd
 import matplotlib.pyplot as plt
-from datetime import date
-import datetime
-import matplotlib.dates as mdates
-import numpy as np
 import glob
 
 # %% [markdown]
@@ -35,40 +30,30 @@ import glob
 # From this point on, we employ pandas and matplotlib to analyze and visualize the data. This notebook allows you to slice the data into various bins, by date, by school, by category, and shows some clever ways to plot the data compared to last year's data. 
 #
 # ### This year's data, last year's data
-# The next cell loads and cleans up the latest .csv file saved from the datascraping routine. It also loads the static data from the 2020-2021 school year, which had already been scraped in the same fashion. The clean-up steps are: 
-#    * Get rid of extra columns (sometimes the scraper goes too fast and gets extra columns labeled 0, 1, 2)
-#    * Transform the `Date` column into pandas datetime objects for easier plotting
+# The next cell loads this year's data and the data from the 2020-2021 school year from the case store (`PCS_COVID_Store.py`), a folder of Parquet files partitioned by school year and month. Any `data_dump_*.csv` file saved since the last run is imported first; only the rows that changed are written. Each school year is then read on its own, without parsing the other files. The store keeps the dates as datetimes and has no saved index or extra columns, so no clean-up is needed.
 
 # %%
-# Import datadump.csv files from 2021-2022 school year
+import PCS_COVID_Store as Store
 
-# make a list of csvs
-files = glob.glob('data_dump_*.csv')
-files = sorted(files, reverse=True)
+# Import the 2020-2021 data and any new datadump.csv files, oldest first
+store = Store.CaseStore('case_store')
+files = sorted(glob.glob('data_dump_*.csv'))
+store.import_csv(['All_Data_2020-2021.csv'] + files)
+print('Store version ' + str(store.version) + ', latest file: ' + files[-1])
 
-# Pick the data dump file from the most recent date
-print(files[0])
-data_df = pd.read_csv(files[0])
-data_df['Date'] = pd.to_datetime(data_df['Date'], yearfirst=True)
+# This school year, and all of the 2020-2021 school year for comparison
+data_df = store.read(start='2021-07-01')
 print(data_df.columns)
 print(data_df.dtypes)
 
-# Import all data from 2020-2021 school year for comparison
-last_year_df = pd.read_csv('All_Data_2020-2021.csv')
-last_year_df['Date'] = pd.to_datetime(last_year_df['Date'], yearfirst=True)
+last_year_df = store.read(start='2020-07-01', end='2021-06-30')
 print(last_year_df.columns)
 print(last_year_df.dtypes)
 
-# %%
-#Uncomment the line below if the data have extra columns 0, 1, and 2 in the dataframe. This happens
-#sometimes when the scraping happens too fast for th table to load.
-data_df.drop(columns=['Unnamed: 0'], inplace=True)
-print(data_df.columns)
-
 # %% [markdown]
 # ## Initial Visualization
 #
-# In the next two cells, we visualize the data at the district level. The first visualization is simply looking at the positive reported cases each day of the 2021-2022 school year, for both employees and students. The second cell visualizes the cumulative sum of cases for the 2021-2022 school year and compares those data to the same length of time starting in the Fall semester and the Spring semester. 
+# In the next two cells, we visualize the data at the district level. The first visualization is simply looking at the positive reported cases each day of the 2021-2022 school year, for both employees and students. The second cell visualizes the cumulative sum of cases for the 2021-2022 school year and compares those data to the same number of school days at the start of last year's Fall and Spring semesters. The term dates are kept in a calendar table in `PCS_COVID_Terms.py`; adding another year or term there adds another curve to the plot.
 
 # %%
 pcsb_students_2019 = 100000
@@ -89,7 +74,9 @@ print('Total covid+ student cases in district = ' + str(total_cases_students) +
       ' (' + str(total_cases_students/pcsb_students_2019*100) + "%" + ' of students)')
 total_cases_employees = sum(data_df['Number of positive employees'].dropna())
 print('Total covid+ employees cases in district = ' + str(total_cases_employees))
-cases_by_date = data_df.groupby('Date').sum().sort_values(by='Date', ascending=True)
+#Daily district totals come from the store's aggregate cube, kept up to date by each import
+cube = store.cube
+cases_by_date = cube.district(start='2021-08-11').set_index('Date')
 print(cases_by_date)
 fig, ax = plt.subplots()
 ax.plot(cases_by_date.index, cases_by_date['Number of positive employees'], 
@@ -101,122 +88,76 @@ ax.set_ylabel('# of positive cases reported each day')
 plt.xticks(rotation=30, ha='right')
 ax.legend(['Employees', 'Students'])
 
-plt.savefig('Daily Positive Cases.png')
-
 
 # %%
-#Daily district-wide cumulative sums for 2021-2021 and compare to last school year
-#Start with active mask to compare the same amounts of elapsed school days:
-summer_start_date_2020 = pd.to_datetime('2020-08-30')
-summer_start_date_2021 = pd.to_datetime('2021-08-11')
-winter_start_date_2020 = pd.to_datetime('2021-01-04')
-length_current_year = max(data_df['Date']) - summer_start_date_2021 + datetime.timedelta(days=1)
-time_mask_summer = summer_start_date_2020 + length_current_year
-time_mask_winter = winter_start_date_2020 + length_current_year
-print(length_current_year, time_mask_summer, time_mask_winter)
-
-daily_cum_sum = data_df.groupby(['Date'])['Total cases'].sum().cumsum().sort_values()
-#print(daily_cum_sum)
-
-#Create a DataFrame with data equal to the number of school days so far, 
-# for both summer and winter semesters, using the dynamic time mask from above
-last_year_so_far_summer_df = last_year_df[~(last_year_df['Date']<summer_start_date_2020) & ~(last_year_df['Date']>time_mask_summer)]
-#print(last_year_so_far_summer_df.head())
-daily_cum_sum_summer2020 = last_year_so_far_summer_df.groupby(['Date'])['Total cases'].sum().cumsum().sort_values()
-summer_xaxis = daily_cum_sum_summer2020.index-min(daily_cum_sum_summer2020.index)
-last_year_so_far_winter_df = last_year_df[~(last_year_df['Date']<winter_start_date_2020) & ~(last_year_df['Date']>time_mask_winter)]
-#print(last_year_so_far_summer_df.head())
-daily_cum_sum_winter2020 = last_year_so_far_winter_df.groupby(['Date'])['Total cases'].sum().cumsum().sort_values()
-winter_xaxis = daily_cum_sum_winter2020.index-min(daily_cum_sum_winter2020.index)
-
-print('Axis length comparison:\n')
-print('x-axis: ', last_year_so_far_summer_df.index-min(last_year_so_far_summer_df.index))
-print('y-axis: ', daily_cum_sum_summer2020)
+#Daily district-wide cumulative sums for 2021-2022, compared to the semesters of last school year.
+#The terms are listed in PCS_COVID_Terms.TERMS; every term is aligned on school days in one pass,
+#and the comparison covers as many school days as the current term has so far.
+import PCS_COVID_Terms as Terms
 
-fig, ax = plt.subplots()
+current_term = '2021-2022 Fall'
+district_df = cube.district(start='2020-07-01')
+school_days = Terms.school_days_so_far(district_df, current_term)
+curves = Terms.cumulative_curves(district_df, 'Total cases', days=school_days)
+print(curves)
 
-ax.plot(daily_cum_sum.index-min(daily_cum_sum.index), 
-        daily_cum_sum, 
-        marker='s',
-        mec='k',
-        markerfacecolor='orange',
-        markersize=10,
-        color='k'
-)
-ax.plot(summer_xaxis, 
-        daily_cum_sum_summer2020, 
-        marker='d',
-        mec='k',
-        markerfacecolor='lightgray',
-        markersize=10,
-        color='lightgray'
-)
-ax.plot(winter_xaxis, 
-        daily_cum_sum_winter2020, 
-        marker='>',
-        mec='k',
-        markerfacecolor='lightgray',
-        markersize=10,
-        color='lightgray'
-)
+fig, ax = plt.subplots()
+for term in curves.columns:
+    if term == current_term:
+        style = dict(marker='s', markerfacecolor='orange', color='k')
+    else:
+        style = dict(marker='d', markerfacecolor='lightgray', color='lightgray')
+    ax.plot(curves.index, 
+            curves[term], 
+            mec='k',
+            markersize=10,
+            label=term + ', ' + str(int(curves[term].max())) + ' total cases',
+            **style
+    )
 #plt.xticks(rotation=30, ha='right')
 ax.set_ylabel('District-wide cumulative sum, + cases')
-ax.set_xlabel('Days since the first day of semester')
-ax.legend(
-        [
-        '2021-2022 Fall, ' + str(max(daily_cum_sum)) + ' total cases',
-        '2020-2021 Fall, ' + str(max(daily_cum_sum_summer2020)) + ' total cases',
-        '2020-2021 Spring, ' + str(max(daily_cum_sum_winter2020)) + ' total cases'
-        ]
-)
-ax.set_title('Cumulative cases after ' + str((length_current_year - datetime.timedelta(days=1)).days) + ' school days')
-plt.savefig('DailyCumsumComparison.png')
-plt.savefig('DailyCumsumComparison.jpg')
-plt.savefig('DailyCumsumComparison.pdf')
+ax.set_xlabel('School days since the first day of semester')
+ax.legend()
+ax.set_title('Cumulative cases after ' + str(school_days) + ' school days')
 
 # %% [markdown]
 # ## Focus on North Pinellas County vs. South Pinellas County
 #
 # Pinellas County is politically heterogeneous, with the south side leaning strongly democrat and the north side leaning strongly republican. Masks in schools and a social responsible response to COVID in general have become partisan issues. One goal of this notebook is to examine whether partisanship has caused a rift in how schools transmit and spread COVID in absence of mask mandates in the county. As we build a data base of school addresses and total populations for a full analysis, we offer an analysis of two schools as a proxy for examination of this partisan divide in social responsibility.
 #
-# To compare two schools, we select the text in the their names and use pandas to filter the rest of the data. For each one, a time series can be made for both students and employees who have tests positive for COVID 19 during this school year. These schools allow us to use geography as a proxy for how many people may become sick with COVID due to opening schools with no mask mandate and the highly contagious delta variant of COVID causing record daily positive cases and hospitalization in the county and across the state. 
+# To compare two schools, we select the text in the their names and look the schools up in a school index (`PCS_COVID_Schools.py`). The index is built once over the `Locations affected` column: it merges different spellings of a school's name, splits cells that list several locations, and records the rows of every school, so picking out any number of schools costs no further scans of the data. `SchoolSeries` turns the index into (dates × schools) tables of daily, cumulative and 7-day rolling counts for every school at once; picking schools, or adding up a region, only selects columns. For each one, a time series can be made for both students and employees who have tests positive for COVID 19 during this school year. These schools allow us to use geography as a proxy for how many people may become sick with COVID due to opening schools with no mask mandate and the highly contagious delta variant of COVID causing record daily positive cases and hospitalization in the county and across the state. 
 
 # %%
-#Use the following two lines to pick data from a single school:
-text_in_school1_name = 'St. Petersburg High'
-school1_df = data_df[data_df['Locations affected'].astype(str).str.contains(text_in_school1_name)].sort_values(by='Date', ascending=True)
-school1_df['Cumulative Sum Students'] = school1_df['Number of positive students'].cumsum()
-print(school1_df)
-print(school1_df.dtypes)
+import PCS_COVID_Schools as Schools
+
+#One pass over the locations column indexes every school
+school_index = Schools.SchoolIndex(data_df['Locations affected'])
+print(str(len(school_index)) + ' schools')
 
+#Daily, cumulative and 7-day rolling counts for every school, in one pass
+school_series = Schools.SchoolSeries(data_df, school_index)
+
+#Use the following two lines to pick the schools to compare; any number of them can be added:
+text_in_school1_name = 'St. Petersburg High'
 text_in_school2_name = 'Dunedin High'
-school2_df = data_df[data_df['Locations affected'].astype(str).str.contains(text_in_school2_name)].sort_values(by='Date', ascending=True)
-school2_df['Cumulative Sum Students'] = school2_df['Number of positive students'].cumsum()
-print(school2_df)
+comparison = school_series.regions(
+    {text_in_school1_name: [text_in_school1_name], text_in_school2_name: [text_in_school2_name]},
+    kind='cumulative', measure='students')
+print(comparison)
 
 _, ax = plt.subplots(nrows=1, ncols=1)
-ax.plot(
-    (school2_df['Date']),
-    school2_df['Cumulative Sum Students'],
-    color='k', 
-    mec='k',
-    markerfacecolor='yellow',
-    marker='o',
-    markersize=10,
-    linestyle="--",
-    label=text_in_school2_name
-)
-ax.plot(
-    (school1_df['Date']),
-    school1_df['Cumulative Sum Students'],
-    color='k', 
-    mec='k',
-    markerfacecolor='lightgreen',
-    marker='o',
-    markersize=10,
-    linestyle="--",
-    label=text_in_school1_name
-)
+for name, color in [(text_in_school2_name, 'yellow'), (text_in_school1_name, 'lightgreen')]:
+    ax.plot(
+        comparison.index,
+        comparison[name],
+        color='k', 
+        mec='k',
+        markerfacecolor=color,
+        marker='o',
+        markersize=10,
+        linestyle="--",
+        label=name
+    )
 plt.xticks(rotation=30, ha='right')
 ax.legend()
 
@@ -225,4 +166,36 @@ ax.legend()
 #ax.xaxis.set_major_locator(fmt_weekly)
 #ax.xaxis.set_major_locator(mdates.YearLocator())
 #ax.xaxis.set_major_formatter(mdates.DateFormatter('%b\n%Y'))
+
+# %% [markdown]
+# ## Rates per school
+#
+# Raw counts favour large schools. With an enrollment table (`school_enrollment.csv`, with `School`, `Enrollment` and optionally `Region` columns), `PCS_COVID_Metrics.py` turns the school series into 7 and 14 day incidence per 1,000 students, week-over-week growth, doubling time and flags for weeks well above a school's own recent history, for every school, every region and the district at once. Schools are matched to the table by name, whatever spelling the dashboard used.
+
+# %%
+import os
+import PCS_COVID_Metrics as Metrics
+
+if os.path.exists('school_enrollment.csv'):
+    metrics = Metrics.CaseMetrics(school_series, 'school_enrollment.csv')
+    if metrics.unmatched:
+        print('No cases yet for: ' + ', '.join(metrics.unmatched))
+    latest = metrics.latest()
+    print(latest.sort_values('incidence_7', ascending=False).head(20))
+    print(latest[latest['anomaly']])
+else:
+    print('Add school_enrollment.csv to compute rates per 1,000 students.')
+
+# %% [markdown]
+# ## Save the figures
+#
+# The plots above are for viewing here. The image files are written by the render stage in `PCS_COVID_Render.py`: the district figures, the semester comparison and one small figure per school (in `schools/`). Figures are drawn in parallel, each format of a figure comes from one drawing, and figures whose data have not changed since the last run are skipped.
+
+# %%
+import PCS_COVID_Render as Render
+
+specs = [Render.daily_spec(cases_by_date), Render.terms_spec(curves, current_term, school_days)]
+specs += Render.school_specs(school_series)
+drawn = Render.render(specs)
+print('Drew ' + str(len(drawn)) + ' of ' + str(len(specs)) + ' figures')
 # %%
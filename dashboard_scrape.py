@@ -28,44 +28,78 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import PCS_COVID_ScraPy as PCS
 from datetime import date
+import os
 import matplotlib.dates as mdates
 
 
 
+import PCS_COVID_Config as Config
+
+#URLs and the driver path come from pcs_covid.ini or PCS_COVID_* environment variables
+#(see PCS_COVID_Config.py)
+config = Config.load()
+
 #Set URL
-URL = 'https://www.pcsb.org/covid19cases'
-URL_2020_2021 = 'https://www.pcsb.org/Page/34025'
+URL = config['url']
+URL_2020_2021 = config['url_2020_2021']
 
 #Set driver path !!!Important - every user will have a different driver path! See readme.md for more info!
-# A = !pwd
-A = None
-if A == ['/Users/williams/Documents/NancyPy/PCS_COVID']:
-    driver_path = '/Users/williams/Documents/NancyPy/PCS_COVID/chromedriver' # Nancy's machine
-else:
-    driver_path = "C:/webdrivers/chromedriver.exe" # Brad's machine
+#Put it in pcs_covid.ini in this folder, e.g.
+#   [pcs_covid]
+#   driver_path = C:/webdrivers/chromedriver.exe
+#or set the PCS_COVID_DRIVER_PATH environment variable.
+driver_path = config['driver_path']
 
 # %% [markdown]
 # ## Scraping the table into a df
 #
-# Once the variables are set above, we can run the wrapper function. This function is likely to throw errors such as "StaleElement" or "Driver not Found" until you:
-#   1. Get the timer set appropriately for your internet connection and page load times, and 
+# Once the variables are set above, we can run the wrapper function. After each click the routine waits for the table to be re-rendered instead of sleeping for a fixed time, and the wait timeouts adapt to how fast the pages have been loading. The last argument (2 below) is only the starting guess, in seconds, for the page load time. This function can still throw errors such as "StaleElement" or "Driver not Found" until you:
+#   1. Get the starting guess about right for your internet connection and page load times, and 
 #   2. Get consistent behavior from the web browser you are driving. 
 #
-# In the case of those types of errors, close the browser that opens when this operates and re-run this cell. You may get several consecutive errors, but it will eventually work. You can also try to re-run the first cell and increase the delay time.
+# Each page is retried a few times, with a fresh browser, before the routine gives up. Every scraped page is also saved in the `scrape_checkpoint` folder, so if it still stops with one of those errors, close the browser that opens when this operates and re-run this cell: it picks up at the first page it does not have yet instead of starting over. A checkpoint is only resumed the same day, and only while its last page still matches the site; otherwise the scrape starts over. You can also try to re-run the first cell and increase the delay time.
 #
 # This routine will give status updates of how many pages it is scraping and how many it has scraped.
 
 # %%
-data_dict, data_df = PCS.Scrape_data(URL, driver_path, 2)
+data_dict, data_df = PCS.Scrape_data(URL, driver_path, 2, checkpoint_dir='scrape_checkpoint')
+
+# %% [markdown]
+# `PCS.Scrape_data_fast` does the same job without opening a browser: it replays the form submission and the page requests over HTTP (see `PCS_COVID_HTTP.py`) and only falls back to the Selenium routine above if the page does not look the way it expects. It returns the same `data_dict, data_df` pair.
 
 # %%
-#Verify the size the dataframe. There are approximately 25 rows per page scraped (in most cases). 
+#data_dict, data_df = PCS.Scrape_data_fast(URL, driver_path, 2)
 
-#Uncomment the line below if the data have extra columns 0, 1, and 2 in the dataframe. This happens
-#sometimes when the scraping happens too fast for th table to load.
-#data_df.drop(columns=[0, 1, 2], inplace=True)
+# %% [markdown]
+# Once the number of pages is known, the pages can also be split across several workers. `PCS.Scrape_data_parallel` uses a pool of browser sessions and `PCS_COVID_HTTP.Scrape_data_parallel` a pool of HTTP clients. `max_per_host` caps how many of them load pages from the district's server at the same time.
 
-data_df['Date'] = pd.to_datetime(data_df['Date'], yearfirst=True)
+# %%
+#data_dict, data_df = PCS.Scrape_data_parallel(URL, driver_path, 2, workers=2, max_per_host=2)
+
+# %% [markdown]
+# For a daily refresh there is no need to scrape the whole history again. The dashboard is sorted newest first, so `PCS.Scrape_data_incremental` reads the newest date in the latest `data_dump_*.csv`, pages only until it reaches rows older than that date (minus `overlap_days`, to catch cases added late), and merges the new rows into the stored ones. The returned `data_df` is the full, up to date table, ready to be saved as today's dump below.
+
+# %%
+#data_dict, data_df = PCS.Scrape_data_incremental(URL, driver_path, 2, overlap_days=3)
+
+# %% [markdown]
+# `PCS.iter_pages` is the generator behind `Scrape_data`: it hands over each page's rows as soon as they are parsed. `PCS.write_pages_csv` streams them straight to a csv file without holding the whole table in memory. The page by page `data_dict` is only filled when `PCS.DEBUG = True` (or `keep_pages=True`).
+
+# %%
+#PCS.write_pages_csv(PCS.iter_pages(URL, driver_path, 2), 'data_dump_' + date.today().strftime("%Y%m%d") + '.csv')
+
+# %% [markdown]
+# To scrape both the current year's table and the 2020-2021 table, `PCS.Scrape_datasets` runs them from one `PCS.DriverPool`: the browser started for the first table is reset and reused for the second (or, with `concurrent=True`, each table gets its own browser and they run at the same time). Every browser the pool started is closed at the end. A `DriverPool` can also be passed as `pool=` to `Scrape_data` and `Scrape_data_parallel` and kept open across several jobs.
+
+# %%
+#datasets = PCS.Scrape_datasets({'2021-2022': (URL, PCS.SUBMIT_MAIN),
+#                                '2020-2021': (URL_2020_2021, PCS.SUBMIT_OLDDATA)}, driver_path, 2)
+#data_df = datasets['2021-2022']
+
+# %%
+#Verify the size the dataframe. There are approximately 25 rows per page scraped (in most cases). 
+#The table reader only keeps the four dashboard columns and already parses the dates, so there
+#are no extra 0, 1, 2 columns to drop. Saved files are read back through PCS_COVID_Ingest.
 print(data_df.columns)
 print(data_df.dtypes)
 print(data_df.shape)
@@ -82,6 +116,24 @@ print(filename)
 #Uncomment the line below to save the data 
 pd.DataFrame.to_csv(data_df, filename)
 
+#Add the new rows to the case store read by dashboard_analysis.py
+import PCS_COVID_Store as Store
+Store.CaseStore('case_store').import_csv([filename])
+
+# %%
+#What did the district add, change or remove since the previous dump? Also keeps the dumps in
+#snapshot_archive as one base table plus small deltas (see PCS_COVID_Diff.py).
+import glob
+import PCS_COVID_Diff as Diff
+
+archive = Diff.DeltaArchive('snapshot_archive')
+for dump in sorted(glob.glob('data_dump_*.csv')):
+    if os.path.basename(dump) not in archive.names():
+        changes = archive.add(os.path.basename(dump), Diff.load_snapshot(dump))
+        if changes is not None:
+            print(dump)
+            print(Diff.summarize(changes))
+
 # %%
 #Condensed code with exception handling from Dahomey Kadera: 
 #Runs a bit slower than the PCS_COVID_ScraPy package, perhaps more dependable though.
@@ -117,21 +169,18 @@ header = soup.find('tr')
 for th in header.find_all('th'):
   column_names.append(th.get_text())
 
-df = pd.DataFrame(columns = column_names)
+#Collect rows in a plain list and build the DataFrame once at the end; appending to a
+#DataFrame row by row copies the whole table every time.
+all_rows = []
   
 def get_rows():
-  global df
   soup = initiate_soup()
   rows = soup.find_all('tr')
   for row in rows[1: ]:
     this_row = []
     for td in row.find_all('td'):
       this_row.append(td.get_text())
-    values_to_add = {}
-    for i in range(len(column_names)): 
-      values_to_add[column_names[i]] = this_row[i]
-    row_to_add = pd.Series(values_to_add, name=len(df))
-    df = df.append(row_to_add)	
+    all_rows.append(this_row[:len(column_names)])
 
 get_rows()	
 	
@@ -157,6 +206,7 @@ for i in range(2,100):
     pass  
 	  
 print(column_names)
+df = pd.DataFrame(all_rows, columns=column_names)
 df.to_csv("cov_dat_Dahomey_20210817.csv")
 
 # %%
@@ -0,0 +1,73 @@
+'''
+Archives a scrape of the local stand-in for the dashboard (benchmarks/dashboard_sim.py) and
+rebuilds it with pcs-covid reparse, next to runs that never got a page.
+'''
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import PCS_COVID_Archive as Archive
+import PCS_COVID_CLI as CLI
+import PCS_COVID_HTTP
+import PCS_COVID_Ingest as Ingest
+import PCS_COVID_ScraPy as PCS
+import PCS_COVID_Store as Store
+import dashboard_sim
+
+RECORDED = os.path.join(ROOT, 'data_dump_20210823.csv')
+
+
+@pytest.fixture
+def dashboard():
+    dashboard = dashboard_sim.Dashboard(Ingest.read_raw(RECORDED), page_size=25)
+    server, url = dashboard_sim.serve(dashboard)
+    yield dashboard, url
+    server.shutdown()
+
+
+@pytest.fixture
+def settings(tmp_path):
+    config = tmp_path / 'pcs_covid.ini'
+    config.write_text('[pcs_covid]\nstore = ' + str(tmp_path / 'store') + '\narchive_dir = ' +
+                      str(tmp_path / 'archive') + '\n')
+    return str(config)
+
+
+def test_run_without_pages_leaves_nothing(tmp_path):
+    archive = Archive.HtmlArchive(str(tmp_path / 'archive'))
+    archive.start_run('http://localhost/')
+    assert archive.runs() == []
+    assert os.listdir(os.path.join(archive.root, 'runs')) == []
+
+
+def test_reparse_skips_empty_runs(dashboard, settings, tmp_path, monkeypatch):
+    dashboard, url = dashboard
+    archive = Archive.HtmlArchive(str(tmp_path / 'archive'))
+    monkeypatch.setattr(PCS, 'ARCHIVE', archive)
+    _, data_df = PCS_COVID_HTTP.Scrape_data(url)
+    scraped = archive.runs()[-1]
+
+    #A later scrape that failed before its first page, and an empty run left by an older version
+    PCS.archive_run(url)
+    open(archive.run_path('99991231T235959-0000', '.json'), 'w').close()
+    open(archive.run_path('99991231T235959-0000'), 'w').close()
+    assert archive.runs() == [scraped]
+
+    assert Archive.reparse(archive).equals(data_df)
+    assert list(Archive.reparse_all(archive, [scraped, '99991231T235959-0000'], workers=1)) == [scraped]
+    assert CLI.main(['--config', settings, 'reparse', '--workers', '1']) == 0
+    assert len(Store.CaseStore(str(tmp_path / 'store')).read()) > 0
+    assert CLI.main(['--config', settings, 'reparse', '--run', '99991231T235959-0000']) == 1
+
+
+def test_reparse_of_empty_archive(settings, tmp_path):
+    archive = Archive.HtmlArchive(str(tmp_path / 'archive'))
+    archive.start_run('http://localhost/')
+    with pytest.raises(ValueError):
+        Archive.reparse(archive)
+    assert CLI.main(['--config', settings, 'reparse', '--all']) == 1
@@ -0,0 +1,83 @@
+'''
+Runs the HTTP engine against the local stand-in for the dashboard (benchmarks/dashboard_sim.py)
+serving a recorded data dump, with and without injected failures.
+'''
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import PCS_COVID_HTTP
+import PCS_COVID_Ingest as Ingest
+import PCS_COVID_ScraPy as PCS
+import dashboard_sim
+
+RECORDED = os.path.join(ROOT, 'data_dump_20210823.csv')
+
+
+@pytest.fixture(scope='module')
+def recorded():
+    return Ingest.read_raw(RECORDED)
+
+
+@pytest.fixture
+def dashboard_url(recorded):
+    servers = []
+
+    def start(**settings):
+        dashboard = dashboard_sim.Dashboard(recorded, page_size=25, **settings)
+        server, url = dashboard_sim.serve(dashboard)
+        servers.append(server)
+        return dashboard, url
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def served(dashboard, submit_id=dashboard_sim.SUBMIT_MAIN):
+    return dashboard.tables[submit_id]
+
+
+def assert_same_rows(data_df, expected):
+    assert len(data_df) == len(expected)
+    assert (data_df['Date'].to_numpy() == PCS.parse_dates(expected['Date']).to_numpy()).all()
+    assert data_df['Locations affected'].tolist() == expected['Locations affected'].tolist()
+
+
+def test_scrape_returns_every_recorded_row(dashboard_url):
+    dashboard, url = dashboard_url()
+    data_dict, data_df = PCS_COVID_HTTP.Scrape_data(url, keep_pages=True)
+    assert_same_rows(data_df, served(dashboard))
+    assert len(data_dict) == dashboard.stats['pages']
+
+
+def test_old_data_button(dashboard_url, recorded):
+    dashboard, url = dashboard_url()
+    _, data_df = PCS_COVID_HTTP.Scrape_data(url, submit_id=PCS_COVID_HTTP.SUBMIT_OLDDATA)
+    assert_same_rows(data_df, served(dashboard, dashboard_sim.SUBMIT_OLDDATA))
+
+
+@pytest.mark.parametrize('mode', dashboard_sim.FAILURE_MODES)
+def test_failed_pages_are_retried(dashboard_url, mode):
+    dashboard, url = dashboard_url(failure_rate=0.1, failure_mode=mode, seed=3)
+    _, data_df = PCS_COVID_HTTP.Scrape_data(url)
+    assert dashboard.stats['failures'] > 0
+    assert_same_rows(data_df, served(dashboard))
+
+
+def test_parallel_scrape(dashboard_url):
+    dashboard, url = dashboard_url(failure_rate=0.05, seed=1)
+    _, data_df = PCS_COVID_HTTP.Scrape_data_parallel(url, workers=3, max_per_host=3)
+    assert_same_rows(data_df, served(dashboard))
+
+
+def test_fast_scrape_falls_back_on_missing_table(dashboard_url, monkeypatch):
+    _, url = dashboard_url(failure_rate=1.0, failure_mode='partial')
+    calls = []
+    monkeypatch.setattr(PCS, 'Scrape_data', lambda *args, **kwargs: calls.append(args) or ({}, 'selenium'))
+    assert PCS.Scrape_data_fast(url, 'chromedriver', 2) == ({}, 'selenium')
+    assert len(calls) == 1